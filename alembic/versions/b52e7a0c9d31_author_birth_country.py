@@ -0,0 +1,37 @@
+"""Author birth country
+
+Revision ID: b52e7a0c9d31
+Revises: 3f9c1d2b8e47
+Create Date: 2026-10-18 14:02:47.530921
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b52e7a0c9d31'
+down_revision: Union[str, None] = '3f9c1d2b8e47'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('authors', sa.Column('birth_country_id', sa.Integer(), nullable=True))
+    op.create_foreign_key('authors_birth_country_id_fkey', 'authors', 'countries', ['birth_country_id'], ['id'])
+    op.execute(
+        """
+        UPDATE authors SET birth_country_id = coalesce(cities.country_id, regions.country_id)
+        FROM cities LEFT JOIN regions ON regions.id = cities.region_id
+        WHERE cities.id = authors.birth_city_id
+        """
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_constraint('authors_birth_country_id_fkey', 'authors', type_='foreignkey')
+    op.drop_column('authors', 'birth_country_id')
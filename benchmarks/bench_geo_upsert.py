@@ -0,0 +1,218 @@
+"""Round-trips and latency of create_geo_nodes (single MERGE) vs the old check-then-create version.
+
+Needs a Neo4j database, from NEO4J_URI / NEO4J_PASSWORD or --uri / --password. Only nodes whose name starts
+with "Bench" are written, and they are deleted afterwards.
+
+    python -m benchmarks.bench_geo_upsert --places 500 --workers 8
+"""
+import argparse
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List
+from neomodel import db
+from bookscraper_backend.countries import get_country_index
+from bookscraper_backend.setup import setup_db
+from graph_db import city_country_exists, city_region_exists, create_geo_nodes, query_pair, region_country_exists
+from graph_models import City, Country, Region
+from logger import logger
+import graph_migrations
+import graph_queries
+
+GeoDict = Dict[str, str | float]
+
+
+def synthetic_places(prefix: str, places: int, seed: int = 0) -> List[GeoDict]:
+    """Birthplaces over a few countries and regions, half of them with coordinates, each one twice (cold then warm)."""
+    rng = random.Random(seed)
+    geo_dicts: List[GeoDict] = []
+    for i in range(places):
+        geo_dict: GeoDict = {"country": f"{prefix} Country {rng.randrange(10)}", "city": f"{prefix} City {i}"}
+        if rng.random() < 0.7:
+            geo_dict["region"] = f"{prefix} Region {rng.randrange(50)}"
+        if i % 2:
+            geo_dict["latitude"] = rng.uniform(-90, 90)
+            geo_dict["longitude"] = rng.uniform(-180, 180)
+        geo_dicts.append(geo_dict)
+    return geo_dicts + geo_dicts
+
+
+def get_or_build_region(geo_dict: GeoDict) -> tuple[Region, bool]:
+    """Finds the region of the birthplace, or builds an unsaved node for it.
+
+    Args:
+        geo_dict (GeoDict): Dictionary of geographical attributes.
+
+    Returns:
+        tuple[Region, bool]: The region node, and whether it was built.
+    """
+    if not region_country_exists(geo_dict["region"], geo_dict["country"]):  # type: ignore
+        return Region(name=geo_dict["region"], country_name=geo_dict["country"]), True
+    region_node = graph_queries.run(
+        "region_in_country", {"region_name": geo_dict["region"], "country_name": geo_dict["country"]}
+    )[0][0]
+    return region_node, False
+
+
+def get_or_build_city(geo_dict: GeoDict) -> tuple[City, bool]:
+    """Finds the city of the birthplace, by its coordinates or else by its parent, or builds an unsaved node for it.
+
+    Args:
+        geo_dict (GeoDict): Dictionary of geographical attributes.
+
+    Returns:
+        tuple[City, bool]: The city node, and whether it was built.
+    """
+    city: str = geo_dict["city"]  # type: ignore
+    country: str = geo_dict["country"]  # type: ignore
+    region: str = geo_dict.get("region", "")  # type: ignore
+    city_country_pair_exists = city_country_exists(city, country)
+    city_region_pair_exists = city_region_exists(city, region)
+    latitude = geo_dict.get("latitude")
+    longitude = geo_dict.get("longitude")
+    if latitude and longitude:
+        lat_long_string = f"lat:{latitude} long:{longitude}"
+        city_node: City = City.nodes.get_or_none(lat_long_string=lat_long_string)
+        if city_node:
+            return city_node, False
+        return City(name=city, latitude=latitude, longitude=longitude, lat_long_string=lat_long_string), True
+    if city_region_pair_exists:
+        return query_pair("City", city, "Region", region)[0][0], False  # type: ignore
+    if city_country_pair_exists:
+        return query_pair("City", city, "Country", country)[0][0], False  # type: ignore
+    return City(name=city), True
+
+
+@db.transaction
+def create_geo_nodes_stepwise(geo_dict: GeoDict) -> tuple[City, Country, bool | None, bool | None]:
+    """Check-then-create version of create_geo_nodes, one query per existence check, lookup and connection.
+    The way birthplaces were stored before the single MERGE, kept here as the baseline.
+
+    Args:
+        geo_dict (GeoDict): Dictionary of geographical attributes.
+
+    Returns:
+        tuple[City, Country, bool | None, bool | None]: Same as create_geo_nodes.
+    """
+    # The first node we should create is country, which already has a uniqueness check. All good on this front then.
+    c = Country.get_or_create({"name": geo_dict["country"]})
+    country_node: Country = c[0]
+    country_code = geo_dict.get("country_code") or get_country_index().code(geo_dict["country"])  # type: ignore
+    if country_code and country_node.code != country_code:
+        country_node.code = country_code
+        country_node.save()
+    # Then, we create the city node.
+    city_node, created_city_node = get_or_build_city(geo_dict)
+    city_node.save()
+    logger.info("[bench_geo_upsert] City %s creation: %s", geo_dict['city'], created_city_node)
+    created_region_node = None
+    if "region" in geo_dict:
+        region_node, created_region_node = get_or_build_region(geo_dict)
+        logger.info("[bench_geo_upsert] Region %s creation: %s", geo_dict['region'], created_region_node)
+        region_node.save()
+        if not region_node.country.is_connected(country_node):
+            region_node.country.connect(country_node)
+            logger.debug("[bench_geo_upsert] %s wasn't connected to %s, connection done.", geo_dict['region'], geo_dict['country'])
+        # If there is region, then city connects to region:
+        if not city_node.region.is_connected(region_node):
+            city_node.region.connect(region_node)
+            logger.debug("[bench_geo_upsert] %s wasn't connected to %s, connection done.", geo_dict['city'], geo_dict['region'])
+    else:
+        # If there is no region, city connects to country:
+        if not city_node.country.is_connected(country_node):
+            city_node.country.connect(country_node)
+            logger.debug("[bench_geo_upsert] %s wasn't connected to %s, connection done.", geo_dict['city'], geo_dict['country'])
+    return city_node, country_node, created_city_node, created_region_node
+
+
+class QueryCounter:
+    """Counts calls to db.cypher_query, i.e. round-trips to the database."""
+
+    def __init__(self):
+        self.calls = 0
+        self._cypher_query = db.cypher_query
+
+    def __enter__(self):
+        def counted(*args, **kwargs):
+            self.calls += 1
+            return self._cypher_query(*args, **kwargs)
+
+        db.cypher_query = counted
+        return self
+
+    def __exit__(self, *exc):
+        db.cypher_query = self._cypher_query
+
+
+def cleanup() -> None:
+    db.cypher_query("MATCH (n) WHERE n.name STARTS WITH 'Bench' DETACH DELETE n")
+
+
+def duplicates(prefix: str) -> int:
+    results, _ = db.cypher_query(
+        """
+        MATCH (c:City)-[:WITHIN]->(parent) WHERE c.name STARTS WITH $prefix
+        WITH c.name AS name, parent, count(c) AS copies WHERE copies > 1
+        RETURN coalesce(sum(copies - 1), 0)
+        """,
+        {"prefix": prefix},
+    )
+    return results[0][0]
+
+
+def measure(name: str, upsert: Callable[[GeoDict], object], geo_dicts: List[GeoDict], workers: int) -> float:
+    latencies: List[float] = []
+
+    def timed(geo_dict: GeoDict) -> None:
+        start = time.perf_counter()
+        upsert(geo_dict)
+        latencies.append(time.perf_counter() - start)
+
+    with QueryCounter() as counter:
+        start = time.perf_counter()
+        for geo_dict in geo_dicts:
+            timed(geo_dict)
+        sequential = time.perf_counter() - start
+    latencies.sort()
+    print(
+        f"{name:>10}: {counter.calls / len(geo_dicts):5.1f} round-trips/place, "
+        f"p50 {latencies[len(latencies) // 2] * 1000:6.2f} ms, p95 {latencies[int(len(latencies) * 0.95)] * 1000:6.2f} ms, "
+        f"{len(geo_dicts) / sequential:7.1f} places/s"
+    )
+    cleanup()
+    prefix = geo_dicts[0]["city"].split(" City")[0]  # type: ignore
+    start = time.perf_counter()
+    errors = 0
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for future in [executor.submit(upsert, geo_dict) for geo_dict in geo_dicts]:
+            try:
+                future.result()
+            except Exception:
+                errors += 1
+    parallel = time.perf_counter() - start
+    print(
+        f"{'':>10}  {workers} workers: {len(geo_dicts) / parallel:7.1f} places/s, "
+        f"{duplicates(prefix)} duplicate cities, {errors} errors"
+    )
+    cleanup()
+    return len(geo_dicts) / sequential
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--uri")
+    parser.add_argument("--password")
+    parser.add_argument("--places", type=int, default=500)
+    parser.add_argument("--workers", type=int, default=8)
+    args = parser.parse_args()
+
+    setup_db(args.uri, args.password)
+    graph_migrations.run_migrations()
+    cleanup()
+    stepwise_rate = measure("stepwise", create_geo_nodes_stepwise, synthetic_places("BenchStep", args.places), args.workers)
+    merge_rate = measure("merge", create_geo_nodes, synthetic_places("BenchMerge", args.places), args.workers)
+    print(f"Single MERGE is {merge_rate / stepwise_rate:.1f}x faster sequentially.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""Lookups per second of the offline gazetteer vs the Nominatim path.
+
+Nominatim is replaced by a local HTTP stand-in answering /search like the real API, so this only measures our
+side of the network path (HTTP client, geopy parsing), not Nominatim's rate limit.
+
+    python -m benchmarks.bench_geocoders --cities 50000 --lookups 20000
+    python -m benchmarks.bench_geocoders --dump cities15000.txt
+"""
+import argparse
+import io
+import json
+import random
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, List
+import pycountry
+from bookscraper_backend.gazetteer import GazetteerGeocoder, GazetteerIndex, build_index
+from bookscraper_backend.geocoding import NominatimGeocoder
+
+
+class NominatimStandIn(BaseHTTPRequestHandler):
+    """Answers every search with a single place, like Nominatim's jsonv2 output."""
+
+    def do_GET(self):
+        body = json.dumps([{"lat": "41.8933203", "lon": "12.4829321", "display_name": "Roma, Lazio, Italia"}]).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def synthetic_dump(cities: int, seed: int = 0) -> tuple[str, List[str]]:
+    """GeoNames-like dump with random city names, and the birthplace strings to look up."""
+    rng = random.Random(seed)
+    countries = list(pycountry.countries)
+    lines, places = [], []
+    for i in range(cities):
+        country = rng.choice(countries)
+        name = f"City{i} {rng.choice(['North', 'South', 'Upper', 'Lower'])}"
+        columns = [str(i), name, name, "", str(rng.uniform(-90, 90)), str(rng.uniform(-180, 180)), "P", "PPL",
+                   country.alpha_2, "", "01", "", "", "", str(rng.randint(0, 10**6))]
+        lines.append("\t".join(columns))
+        places.append(f"{name}, {country.name}")
+    return "\n".join(lines), places
+
+
+def measure(name: str, geocode: Callable[[str], object], places: List[str]) -> float:
+    start = time.perf_counter()
+    found = sum(1 for place in places if geocode(place))
+    elapsed = time.perf_counter() - start
+    rate = len(places) / elapsed
+    print(f"{name:>12}: {rate:>12,.0f} lookups/s ({found}/{len(places)} found, {elapsed * 1e6 / len(places):.1f} us/lookup)")
+    return rate
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dump", help="Real GeoNames dump. Synthetic cities are generated otherwise.")
+    parser.add_argument("--cities", type=int, default=50_000)
+    parser.add_argument("--lookups", type=int, default=20_000)
+    parser.add_argument("--network-lookups", type=int, default=500)
+    args = parser.parse_args()
+
+    rng = random.Random(1)
+    if args.dump:
+        with open(args.dump, encoding="utf-8") as f:
+            rows = [line.split("\t") for line in f]
+        places = [f"{row[1]}, {row[8]}" for row in rows if len(row) > 8]
+        source = open(args.dump, encoding="utf-8")
+    else:
+        dump, places = synthetic_dump(args.cities)
+        source = io.StringIO(dump)
+    lookups = [rng.choice(places) for _ in range(args.lookups)]
+
+    with tempfile.TemporaryDirectory() as directory:
+        index_path = f"{directory}/gazetteer.idx"
+        start = time.perf_counter()
+        keys = build_index(source, index_path)
+        source.close()
+        print(f"Built index with {keys:,} keys in {time.perf_counter() - start:.2f}s")
+        index = GazetteerIndex(index_path)
+        gazetteer_rate = measure("gazetteer", GazetteerGeocoder(index).geocode, lookups)
+
+        server = ThreadingHTTPServer(("127.0.0.1", 0), NominatimStandIn)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        nominatim = NominatimGeocoder(domain=f"127.0.0.1:{server.server_port}", scheme="http")
+        nominatim_rate = measure("nominatim", nominatim.geocode, lookups[: args.network_lookups])
+        server.shutdown()
+        index.close()
+    print(f"Gazetteer is {gazetteer_rate / nominatim_rate:,.0f}x faster than the local network path.")
+
+
+if __name__ == "__main__":
+    main()
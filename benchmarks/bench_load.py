@@ -0,0 +1,223 @@
+"""Open-loop load test of POST /process-profile/ (or of the job endpoints), to find the arrival rate one worker
+process sustains.
+
+Requests go to backend_api.app in-process through httpx's ASGI transport, so there is no network in between,
+and Goodreads, Nominatim and the storage are the offline fakes and the memory backend. Give the fakes
+realistic latencies with the FAKE_* variables, e.g. FAKE_AUTHOR_LATENCY=0.4 FAKE_GEOCODE_LATENCY=0.05
+FAKE_LATENCY_SIGMA=0.5 for log-normal latencies with a long tail.
+
+Arrivals are a Poisson process at each rate, whether or not earlier requests have finished (open loop), and a
+request's latency counts from its scheduled arrival, so a saturated server shows up as growing latencies
+instead of a slower client. Every level reports throughput, latency percentiles, the time sync endpoints wait
+for a thread of the threadpool, the peak of requests in flight and the error rate.
+
+With --endpoint jobs, each request submits a job to POST /jobs/process-profile and polls GET /jobs/{id} until
+it's finished. Jobs run on the JobManager's JOB_WORKERS threads, not on the threadpool, so levels also report
+how long jobs waited between being submitted and starting.
+
+    python -m benchmarks.bench_load --rates 1 2 5 10 --duration 30 --mix 10:0.5 200:0.4 2000:0.1
+    JOB_WORKERS=8 python -m benchmarks.bench_load --endpoint jobs --rates 1 2 5
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import threading
+import time
+from typing import Any, Callable, Dict, List
+from benchmarks.stats import percentile
+
+# Seconds between polls of a job's status, with --endpoint jobs.
+JOB_POLL_INTERVAL = 0.05
+
+
+class ThreadpoolQueueTimer:
+    """Records how long sync endpoints wait between being handed to the threadpool and starting on a thread."""
+
+    def __init__(self):
+        self.delays: List[float] = []
+        self._lock = threading.Lock()
+
+    def install(self) -> None:
+        import fastapi.routing
+
+        run_in_threadpool = fastapi.routing.run_in_threadpool
+
+        async def timed_run_in_threadpool(func: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+            submitted = time.perf_counter()
+
+            def timed(*args: Any, **kwargs: Any) -> Any:
+                with self._lock:
+                    self.delays.append(time.perf_counter() - submitted)
+                return func(*args, **kwargs)
+
+            return await run_in_threadpool(timed, *args, **kwargs)
+
+        fastapi.routing.run_in_threadpool = timed_run_in_threadpool  # type: ignore
+
+    def take(self) -> List[float]:
+        with self._lock:
+            delays, self.delays = self.delays, []
+        return sorted(delays)
+
+
+def parse_mix(mix: List[str]) -> tuple[List[int], List[float]]:
+    """Shelf sizes and their weights, from "books:weight" items."""
+    sizes, weights = [], []
+    for item in mix:
+        books, _, weight = item.partition(":")
+        sizes.append(int(books))
+        weights.append(float(weight or 1))
+    return sizes, weights
+
+
+async def run_job(client, profile_url: str, timeout: float, job_waits: List[float]) -> str:
+    """Submits a job for the profile and polls it until it's finished. Returns the status of the request."""
+    response = await client.post("/jobs/process-profile", json={"profile_url": profile_url}, timeout=timeout)
+    if response.status_code != 202:
+        return str(response.status_code)
+    job_id = response.json()["job_id"]
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        job = (await client.get(f"/jobs/{job_id}", timeout=timeout)).json()
+        if job["status"] in ("done", "failed"):
+            job_waits.append((job["started_at"] or job["finished_at"]) - job["created_at"])
+            return "200" if job["status"] == "done" else "job_failed"
+        await asyncio.sleep(JOB_POLL_INTERVAL)
+    return "job_timeout"
+
+
+async def run_level(
+    client, rate: float, duration: float, sizes: List[int], weights: List[float], repeat_share: float,
+    rng: random.Random, timer: ThreadpoolQueueTimer, timeout: float, endpoint: str = "sync",
+) -> Dict[str, Any]:
+    """Offers requests at a rate for a duration, then waits for the last ones to finish."""
+    latencies: List[float] = []
+    job_waits: List[float] = []
+    statuses: Dict[str, int] = {}
+    in_flight = 0
+    peak_in_flight = 0
+    seen: List[str] = []
+
+    async def request(profile_url: str, scheduled: float) -> None:
+        nonlocal in_flight, peak_in_flight
+        in_flight += 1
+        peak_in_flight = max(peak_in_flight, in_flight)
+        try:
+            if endpoint == "jobs":
+                status = await run_job(client, profile_url, timeout, job_waits)
+            else:
+                response = await client.post("/process-profile/", json={"profile_url": profile_url}, timeout=timeout)
+                status = str(response.status_code)
+        except Exception as e:
+            status = type(e).__name__
+        finally:
+            in_flight -= 1
+        latencies.append(time.perf_counter() - scheduled)
+        statuses[status] = statuses.get(status, 0) + 1
+
+    timer.take()
+    tasks = []
+    start = time.perf_counter()
+    next_arrival = start
+    while next_arrival - start < duration:
+        delay = next_arrival - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if seen and rng.random() < repeat_share:
+            profile_url = rng.choice(seen)  # Someone asking again for a profile, answered by the result cache.
+        else:
+            books = rng.choices(sizes, weights)[0]
+            profile_url = f"https://www.goodreads.com/user/show/{rng.randrange(10**9)}-load?books={books}"
+            seen.append(profile_url)
+        tasks.append(asyncio.create_task(request(profile_url, next_arrival)))
+        next_arrival += rng.expovariate(rate)
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    queue_delays = timer.take()
+    job_waits.sort()
+    errors = sum(count for status, count in statuses.items() if status != "200")
+    return {
+        "offered_rate": rate,
+        "requests": len(tasks),
+        "throughput": (len(tasks) - errors) / elapsed,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p95_ms": percentile(latencies, 0.95) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "threadpool_wait_mean_ms": sum(queue_delays) / len(queue_delays) * 1000 if queue_delays else 0.0,
+        "threadpool_wait_p95_ms": percentile(queue_delays, 0.95) * 1000,
+        "job_wait_mean_ms": sum(job_waits) / len(job_waits) * 1000 if job_waits else 0.0,
+        "job_wait_p95_ms": percentile(job_waits, 0.95) * 1000,
+        "peak_in_flight": peak_in_flight,
+        "error_rate": errors / len(tasks) if tasks else 0.0,
+        "statuses": statuses,
+    }
+
+
+async def run(args: argparse.Namespace) -> List[Dict[str, Any]]:
+    import anyio.to_thread
+    import httpx
+    from bookscraper_backend.backend_api import app
+    from bookscraper_backend.jobs import JOB_WORKERS
+
+    if args.threads:
+        anyio.to_thread.current_default_thread_limiter().total_tokens = args.threads
+    timer = ThreadpoolQueueTimer()
+    timer.install()
+    sizes, weights = parse_mix(args.mix)
+    rng = random.Random(args.seed)
+    levels = []
+    print(f"Endpoint {args.endpoint}, {anyio.to_thread.current_default_thread_limiter().total_tokens:.0f} threadpool threads, {JOB_WORKERS} job workers.")
+    # httpx's ASGI transport doesn't run the lifespan, so it is entered here.
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://load-test") as client:
+            for rate in args.rates:
+                level = await run_level(
+                    client, rate, args.duration, sizes, weights, args.repeat_share, rng, timer, args.timeout, args.endpoint
+                )
+                level["job_workers"] = JOB_WORKERS
+                levels.append(level)
+                print(
+                    f"{rate:>8.1f} req/s offered: {level['throughput']:7.2f} req/s done, "
+                    f"p50 {level['p50_ms']:9.1f} ms, p95 {level['p95_ms']:9.1f} ms, p99 {level['p99_ms']:9.1f} ms, "
+                    f"threadpool wait mean {level['threadpool_wait_mean_ms']:8.1f} ms p95 {level['threadpool_wait_p95_ms']:8.1f} ms, "
+                    f"job wait mean {level['job_wait_mean_ms']:8.1f} ms p95 {level['job_wait_p95_ms']:8.1f} ms, "
+                    f"peak in flight {level['peak_in_flight']:4}, errors {level['error_rate']:6.1%}"
+                )
+    return levels
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--endpoint", choices=["sync", "jobs"], default="sync", help="POST /process-profile/ or the job endpoints.")
+    parser.add_argument("--rates", type=float, nargs="+", default=[1, 2, 5, 10, 20], help="Requests per second.")
+    parser.add_argument("--duration", type=float, default=30, help="Seconds of arrivals per rate.")
+    parser.add_argument("--mix", nargs="+", default=["10:0.5", "200:0.4", "2000:0.1"], help="books:weight items.")
+    parser.add_argument("--repeat-share", type=float, default=0.2, help="Share of requests for an already seen profile.")
+    parser.add_argument("--threads", type=int, help="Threadpool size. Starlette's default is 40.")
+    parser.add_argument("--timeout", type=float, default=300)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the results to this JSON file.")
+    args = parser.parse_args()
+
+    # The fakes and backends read their configuration when imported, so it's set before any of them is.
+    os.environ.setdefault("STORAGE_BACKEND", "memory")
+    os.environ.setdefault("SCRAPER_BACKEND", "fake")
+    os.environ.setdefault("GEOCODER", "fake")
+    os.environ.setdefault("GEOCODE_CACHE_PATH", "")
+    import logger  # noqa: F401 Configures the root logger, which is then quietened.
+
+    logging.getLogger().setLevel(logging.WARNING)
+
+    levels = asyncio.run(run(args))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"args": vars(args), "levels": levels}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,244 @@
+"""End-to-end benchmark of the resolution pipeline and the /process-profile/ endpoint, on synthetic shelves.
+
+Goodreads and Nominatim are the offline fakes of bookscraper_backend.fakes and the storage is the in-memory
+backend by default, so runs are repeatable and need nothing else. FAKE_* variables tune the fakes (latency,
+error rates, catalog size). With --storage neo4j or postgres the real database is used, cold runs then expect
+it to be empty of the fake authors and run once, as only the memory storage is emptied between repetitions.
+
+Each shelf size runs cold (empty storage, geocoding cache and shelf snapshots before every repetition) and
+warm (everything already resolved), measuring extract_authors, generate_country_count, process_country_count
+and POST /process-profile/. Results can be written as JSON and compared with a previous run:
+
+    python -m benchmarks.bench_pipeline --output baseline.json
+    python -m benchmarks.bench_pipeline --baseline baseline.json --threshold 0.2
+
+which exits with status 1 if a metric got worse than the baseline by more than the threshold.
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import resource
+import sys
+import threading
+import time
+from typing import Any, Callable, Dict, List
+from benchmarks.stats import percentile
+
+SIZES = [10, 1_000, 20_000]
+OPERATIONS = ["extract_authors", "generate_country_count", "process_country_count", "process_profile_endpoint"]
+# Metrics that are worse when they go up, and the ones worse when they go down.
+HIGHER_IS_WORSE = ["p50_ms", "p95_ms", "p99_ms", "round_trips_per_author", "peak_rss_mb"]
+LOWER_IS_WORSE = ["books_per_second"]
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is the high-water mark of the whole process, in KiB on Linux and bytes on macOS.
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+
+class RoundTripCounter:
+    """Round-trips to the storage: calls of the memory backend, Cypher queries on Neo4j, SQL statements on Postgres."""
+
+    def __init__(self, storage_name: str):
+        self.storage_name = storage_name
+        self.calls = 0
+        self._lock = threading.Lock()
+        if storage_name == "neo4j":
+            from neomodel import db
+
+            # neomodel's db is thread-local, so the method is patched on its class to count the queries of every
+            # thread, pipeline workers included.
+            database_class = type(db)
+            cypher_query = database_class.cypher_query
+
+            def counted(database, *args, **kwargs):
+                self._count()
+                return cypher_query(database, *args, **kwargs)
+
+            database_class.cypher_query = counted
+        elif storage_name == "postgres":
+            from sqlalchemy import event
+            from bookscraper_backend.database.setup import get_engine
+
+            event.listen(get_engine(), "before_cursor_execute", lambda *args: self._count())
+
+    def _count(self) -> None:
+        with self._lock:
+            self.calls += 1
+
+    def read(self) -> int:
+        if self.storage_name == "memory":
+            from bookscraper_backend.storage import get_storage
+
+            return get_storage().calls  # type: ignore
+        return self.calls
+
+
+def reset_caches() -> None:
+    """Forgets every author, geocoded place and shelf snapshot the process knows. Only the memory storage is reset."""
+    from bookscraper_backend import backend
+    from bookscraper_backend.storage import get_storage
+
+    if get_storage().name == "memory":
+        get_storage.cache_clear()
+    backend.get_geocode_cache.cache_clear()
+    backend.get_snapshot_store.cache_clear()
+
+
+def measure(
+    operation: Callable[[], Any],
+    repeats: int,
+    books: int,
+    authors: int,
+    counter: RoundTripCounter,
+    cold: bool,
+) -> Dict[str, float]:
+    """Times an operation over a number of repetitions, resetting the caches before each one if cold."""
+    latencies: List[float] = []
+    round_trips = 0
+    for _ in range(repeats):
+        if cold:
+            reset_caches()
+        before = counter.read()
+        start = time.perf_counter()
+        operation()
+        latencies.append(time.perf_counter() - start)
+        round_trips += counter.read() - before
+    latencies.sort()
+    return {
+        "repeats": repeats,
+        "books_per_second": books * repeats / sum(latencies) if sum(latencies) else 0.0,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p95_ms": percentile(latencies, 0.95) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "round_trips_per_author": round_trips / repeats / authors if authors else 0.0,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def run(sizes: List[int], repeats: int, storage_name: str) -> Dict[str, Dict[str, float]]:
+    from fastapi.testclient import TestClient
+    from bookscraper_backend import backend
+    from bookscraper_backend.backend_api import app
+
+    counter = RoundTripCounter(storage_name)
+    results: Dict[str, Dict[str, float]] = {}
+    with TestClient(app) as client:
+        for size in sizes:
+            profile_url = f"https://www.goodreads.com/user/show/{size}-bench?books={size}"
+            shelf = backend.get_scraper().process_goodreads_url(profile_url)
+            cont = backend.extract_authors(shelf)
+            authors = len(cont)
+
+            def endpoint() -> None:
+                response = client.post("/process-profile/", json={"profile_url": profile_url, "force_refresh": True})
+                response.raise_for_status()
+
+            country_count = backend.generate_country_count(cont)
+            operations: Dict[str, Callable[[], Any]] = {
+                "extract_authors": lambda: backend.extract_authors(shelf),
+                "generate_country_count": lambda: backend.generate_country_count(cont),
+                "process_country_count": lambda: backend.process_country_count(country_count),
+                "process_profile_endpoint": endpoint,
+            }
+            for cache in ("cold", "warm"):
+                # A real database keeps the authors of the previous repetition, so only its first one is cold.
+                cache_repeats = 1 if cache == "cold" and storage_name != "memory" else repeats
+                for name in OPERATIONS:
+                    # Warm repetitions start from a state where the shelf was already processed once.
+                    warm_up = endpoint if name == "process_profile_endpoint" else lambda: backend.generate_country_count(cont)
+                    if cache == "warm":
+                        warm_up()
+                    key = f"{name}/{size}/{cache}"
+                    results[key] = measure(operations[name], cache_repeats, size, authors, counter, cache == "cold")
+                    print(
+                        f"{key:>40}: {results[key]['books_per_second']:>12,.0f} books/s, "
+                        f"p50 {results[key]['p50_ms']:9.2f} ms, p95 {results[key]['p95_ms']:9.2f} ms, "
+                        f"p99 {results[key]['p99_ms']:9.2f} ms, {results[key]['round_trips_per_author']:.3f} round-trips/author, "
+                        f"peak RSS {results[key]['peak_rss_mb']:.0f} MB"
+                    )
+    return results
+
+
+def compare(
+    results: Dict[str, Dict[str, float]], baseline: Dict[str, Dict[str, float]], threshold: float, min_ms: float
+) -> List[str]:
+    """Metrics worse than in the baseline by more than threshold (a fraction).
+
+    Args:
+        results (Dict[str, Dict[str, float]]): Metrics per case of this run.
+        baseline (Dict[str, Dict[str, float]]): Metrics per case of the baseline run.
+        threshold (float): Allowed relative change, e.g. 0.2 for 20%.
+        min_ms (float): Timings of cases whose median is below this many milliseconds in both runs are noise,
+            and aren't compared.
+
+    Returns:
+        List[str]: A description of each regression.
+    """
+    regressions = []
+    for key, metrics in results.items():
+        previous = baseline.get(key)
+        if not previous:
+            continue
+        for metric in HIGHER_IS_WORSE + LOWER_IS_WORSE:
+            old, new = previous.get(metric), metrics.get(metric)
+            if old is None or new is None or not old:
+                continue
+            timing = metric.endswith("_ms") or metric == "books_per_second"
+            if timing and max(previous["p50_ms"], metrics["p50_ms"]) < min_ms:
+                continue
+            change = (new - old) / old
+            if (metric in HIGHER_IS_WORSE and change > threshold) or (metric in LOWER_IS_WORSE and -change > threshold):
+                regressions.append(f"{key} {metric}: {old:.3f} -> {new:.3f} ({change:+.0%})")
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES, help="Books per shelf.")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--overlap", type=float, default=0.5, help="Share of books by authors most shelves share.")
+    parser.add_argument("--storage", choices=["memory", "neo4j", "postgres"], default="memory")
+    parser.add_argument("--output", help="Write the results to this JSON file.")
+    parser.add_argument("--baseline", help="Compare with the results in this JSON file.")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Relative change counted as a regression.")
+    parser.add_argument("--min-ms", type=float, default=1.0, help="Latencies below this are not compared.")
+    args = parser.parse_args()
+    if args.storage != "memory" and args.repeats > 1:
+        print(f"Cold cases run once on {args.storage}, warm cases {args.repeats} times.")
+
+    # The fakes and backends read their configuration when imported, so it's set before any of them is.
+    os.environ["STORAGE_BACKEND"] = args.storage
+    os.environ.setdefault("SCRAPER_BACKEND", "fake")
+    os.environ.setdefault("GEOCODER", "fake")
+    os.environ.setdefault("GEOCODE_CACHE_PATH", "")
+    os.environ.setdefault("SNAPSHOT_BACKEND", "memory")
+    os.environ["FAKE_AUTHOR_OVERLAP"] = str(args.overlap)
+    import logger  # noqa: F401 Configures the root logger, which is then quietened.
+
+    logging.getLogger().setLevel(logging.WARNING)  # Per-author log lines would be most of what's measured.
+
+    results = run(args.sizes, args.repeats, args.storage)
+    if args.output:
+        with open(args.output, "w") as f:
+            document = {
+                "meta": {"python": platform.python_version(), "platform": platform.platform(), "args": vars(args)},
+                "results": results,
+            }
+            json.dump(document, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+        regressions = compare(results, baseline, args.threshold, args.min_ms)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+        print(f"No regression beyond {args.threshold:.0%} of {args.baseline}.")
+
+
+if __name__ == "__main__":
+    main()
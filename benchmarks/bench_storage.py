@@ -0,0 +1,68 @@
+"""Insert and lookup throughput of the Neo4j and Postgres storage backends, on the same synthetic authors.
+
+Each backend connects like the app does (NEO4J_* and DB_* variables), its schema must be up to date
+(graph migrations / alembic). Authors get ids from 900000000 up, and are left in the databases.
+
+    python -m benchmarks.bench_storage --authors 5000 --backends neo4j postgres
+"""
+import argparse
+import random
+import time
+from typing import Dict, List
+from bookscraper_backend.storage import StorageBackend, create_storage
+
+
+def synthetic_authors(authors: int, seed: int = 0) -> List[tuple[Dict[str, str], Dict[str, str | float] | None]]:
+    rng = random.Random(seed)
+    pairs: List[tuple[Dict[str, str], Dict[str, str | float] | None]] = []
+    for i in range(authors):
+        goodreads_id = str(900_000_000 + i)
+        author_dict = {"name": f"Bench Author {i}", "goodreads_id": goodreads_id, "goodreads_link": f"bench/{goodreads_id}"}
+        geo_dict: Dict[str, str | float] | None = None
+        if rng.random() < 0.9:
+            geo_dict = {"country": f"Bench Country {rng.randrange(50)}", "city": f"Bench City {rng.randrange(authors // 4 + 1)}"}
+            if rng.random() < 0.6:
+                geo_dict["region"] = f"Bench Region {rng.randrange(200)}"
+        pairs.append((author_dict, geo_dict))
+    return pairs
+
+
+def measure(storage: StorageBackend, pairs, lookup_batch: int) -> None:
+    start = time.perf_counter()
+    storage.insert_many(pairs)
+    insert_seconds = time.perf_counter() - start
+    ids = [author_dict["goodreads_id"] for author_dict, _ in pairs]
+    latencies = []
+    for batch_start in range(0, len(ids), lookup_batch):
+        start = time.perf_counter()
+        storage.fetch_countries_by_gr_ids(ids[batch_start : batch_start + lookup_batch])
+        latencies.append(time.perf_counter() - start)
+    latencies.sort()
+    single = []
+    for goodreads_id in ids[:200]:
+        start = time.perf_counter()
+        storage.get_author_place(goodreads_id)
+        single.append(time.perf_counter() - start)
+    single.sort()
+    print(
+        f"{storage.name:>9}: insert {len(pairs) / insert_seconds:8.0f} authors/s, "
+        f"lookup of {lookup_batch} p50 {latencies[len(latencies) // 2] * 1000:7.2f} ms, "
+        f"{len(ids) / sum(latencies):8.0f} authors/s, get_author_place p50 {single[len(single) // 2] * 1000:6.2f} ms"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--authors", type=int, default=5000)
+    parser.add_argument("--lookup-batch", type=int, default=500)
+    parser.add_argument("--backends", nargs="+", default=["neo4j", "postgres"])
+    args = parser.parse_args()
+    pairs = synthetic_authors(args.authors)
+    for backend in args.backends:
+        storage = create_storage(backend)
+        storage.setup()
+        measure(storage, pairs, args.lookup_batch)
+
+
+if __name__ == "__main__":
+    main()
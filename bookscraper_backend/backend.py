@@ -1,17 +1,41 @@
-import geopy.geocoders
-from geopy.location import Location
-from goodreads_scraper.scrape import process_goodreads_url, scrape_gr_author
-from typing import Dict, List
+from typing import Any, Callable, Dict, Iterable, Iterator, List
 from collections import Counter
-from graph_db import insert_everything, fetch_author_by_gr_id, get_author_place
-import pycountry
-import cProfile
-import pstats
-import geopy
+from concurrent.futures import ThreadPoolExecutor
+from bookscraper_backend.countries import get_country_index
+from bookscraper_backend.geocoding import FallbackGeocoder, GeocodeCache, Geocoder, MISSING, NominatimGeocoder
+from bookscraper_backend.gazetteer import GazetteerGeocoder, GazetteerIndex
+from bookscraper_backend.metrics import AUTHORS, GEOCODE_MISSES, PROFILES_IN_PROGRESS, STAGE_SECONDS
+from bookscraper_backend.pipeline import Stage, run_pipeline
+from bookscraper_backend.profiling import run_for_request
+from bookscraper_backend.read_model import SharedReadModel
+from bookscraper_backend.result_cache import ResultStore, normalize_profile_url
+from bookscraper_backend.scraping import Scraper, create_scraper
+from bookscraper_backend.singleflight import PostgresLockTable, SingleFlight, create_lock_table
+from bookscraper_backend.snapshots import apply_shelf, create_snapshot_store
+from bookscraper_backend.storage import get_storage
 from logger import logger
+import contextvars
+import functools
+import os
+import threading
+import time
 
-profiler = cProfile.Profile()
-profiler.enable()
+# Workers of each step of the resolution pipeline for authors missing from the database. Each step has one pool
+# of workers shared by every request of the process, see bookscraper_backend.pipeline.
+PIPELINE_SCRAPE_WORKERS = int(os.getenv("PIPELINE_SCRAPE_WORKERS", 4))
+PIPELINE_GEOCODE_WORKERS = int(os.getenv("PIPELINE_GEOCODE_WORKERS", 1))  # Nominatim allows 1 request per second.
+PIPELINE_PERSIST_WORKERS = int(os.getenv("PIPELINE_PERSIST_WORKERS", 1))
+PIPELINE_PERSIST_BATCH_SIZE = int(os.getenv("PIPELINE_PERSIST_BATCH_SIZE", 50))
+# Shelves scraped at the same time when processing many profiles at once.
+SHELF_SCRAPE_WORKERS = int(os.getenv("SHELF_SCRAPE_WORKERS", 4))
+
+# In-flight resolutions, shared by every request of this process.
+author_flight = SingleFlight("author")
+profile_flight = SingleFlight("profile")
+# Progress callbacks of every caller waiting on an in-flight profile, and the last progress reported for it.
+_profile_listeners: Dict[tuple[str, bool], List[Callable[[int, int], None]]] = {}
+_profile_progress: Dict[tuple[str, bool], tuple[int, int]] = {}
+_profile_progress_lock = threading.Lock()
 
 
 def extract_authors(books: List[Dict[str, str]]) -> Counter:
@@ -24,62 +48,466 @@ def extract_authors(books: List[Dict[str, str]]) -> Counter:
     Returns:
         Counter: Counter object with the book count per author.
     """
-    author_tuples = [
-        (book["author_id"], book["author_link"], book["author_name"]) for book in books
-    ]
-    author_tuple_counts = Counter(author_tuples)
+    with STAGE_SECONDS.time("extract_authors"):
+        author_tuples = [
+            (book["author_id"], book["author_link"], book["author_name"]) for book in books
+        ]
+        author_tuple_counts = Counter(author_tuples)
     return author_tuple_counts
 
 
-def generate_country_count(cont: Counter) -> Dict[str, int]:
-    """From a counter of books per author, generate a similar one of country: books read from that country.
+def scrape_shelf(profile_url: str) -> List[Dict[str, str]]:
+    """Scrapes the books of the read shelf of a GR profile."""
+    with STAGE_SECONDS.time("shelf_scrape"):
+        return get_scraper().process_goodreads_url(profile_url)
+
+
+def _stage_fields(stage: str, start: float, sampled: bool = False) -> Dict[str, Any]:
+    """Extra fields of a log record, with how long a stage took since start (a time.perf_counter value).
+    Stages run once per author are sampled, so the logger rate limits them.
+    """
+    fields = {"stage": stage, "duration_ms": round((time.perf_counter() - start) * 1000, 3)}
+    if sampled:
+        fields["sampled"] = True
+    return fields
+
+
+def _scrape_author(author: tuple[str, str, str]) -> tuple[Dict[str, str], str | None]:
+    author_id, author_link, author_name = author
+    author_dict = {
+        "name": author_name,
+        "goodreads_id": author_id,
+        "goodreads_link": author_link,
+    }
+    logger.debug("[backend] Didn't find %s in database, going to scrape from GR.", author_id)
+    start = time.perf_counter()
+    with STAGE_SECONDS.time("author_scrape"):
+        birthplace, _ = get_scraper().scrape_gr_author(author_link)  # Scrape the birthplace
+    logger.info("[backend] Scraped author %s.", author_id, extra=_stage_fields("author_scrape", start, sampled=True))
+    return author_dict, birthplace
+
+
+def _geocode_author(scraped: tuple[Dict[str, str], str | None]) -> tuple[Dict[str, str], Dict[str, str | float] | None]:
+    author_dict, birthplace = scraped
+    start = time.perf_counter()
+    geo_dict = process_birthplace(birthplace)
+    logger.info(
+        "[backend] Processed birthplace of author %s.", author_dict["goodreads_id"], extra=_stage_fields("geocode", start, sampled=True)
+    )
+    return author_dict, geo_dict
+
+
+def _persist_authors(
+    batch: List[tuple[Dict[str, str], Dict[str, str | float] | None]]
+) -> List[tuple[str, str | None]]:
+    start = time.perf_counter()
+    with STAGE_SECONDS.time("insert"):
+        countries = get_storage().insert_many(batch)
+    AUTHORS.inc("scraped", amount=len(batch))
+    logger.info("[backend] Inserted %s authors on db.", len(countries), extra=_stage_fields("insert", start))
+    if len(countries) < len(batch):
+        # Authors the storage couldn't keep still count for this request, with the country they were geocoded to.
+        skipped = [(author_dict, geo_dict) for author_dict, geo_dict in batch if author_dict["goodreads_id"] not in countries]
+        logger.warning("[backend] %s authors weren't stored and will be scraped again next time.", len(skipped))
+        for author_dict, geo_dict in skipped:
+            countries[author_dict["goodreads_id"]] = geo_dict["country"] if geo_dict else None  # type: ignore
+    return list(countries.items())
+
+
+def iter_resolve_missing_authors(
+    authors: Iterable[tuple[str, str, str]],
+    scrape_workers: int = PIPELINE_SCRAPE_WORKERS,
+    geocode_workers: int = PIPELINE_GEOCODE_WORKERS,
+    persist_workers: int = PIPELINE_PERSIST_WORKERS,
+    persist_batch_size: int = PIPELINE_PERSIST_BATCH_SIZE,
+) -> Iterator[tuple[str, str | None]]:
+    """Scrapes, geocodes and inserts authors that aren't in the database yet.
+    Each step runs on its own long-lived pool of workers, shared with the other requests, so scraping an author
+    overlaps with geocoding the previous one and writing the one before that, and database connections are reused.
+    An author that is already being resolved by another request (or, with SINGLEFLIGHT_BACKEND=postgres,
+    by another process) isn't scraped again: its result is shared.
 
+    Args:
+        authors (Iterable[tuple[str, str, str]]): Tuples of author id, link and name, like the keys of extract_authors.
+        scrape_workers (int): Concurrent scrapes of GR author pages, across the process.
+        geocode_workers (int): Concurrent geocoding calls, across the process.
+        persist_workers (int): Concurrent database writers, across the process.
+        persist_batch_size (int): Maximum number of authors inserted with a single insert_many call.
+
+    Yields:
+        tuple[str, str | None]: Author id and its country name (or None), as soon as the author is persisted.
+    """
+    stages = [
+        Stage("scrape", _scrape_author, workers=scrape_workers),
+        Stage("geocode", _geocode_author, workers=geocode_workers),
+        Stage("persist", _persist_authors, workers=persist_workers, batch_size=persist_batch_size),
+    ]
+    # Authors another request is already resolving are waited on instead of being scraped twice.
+    leading, following = [], []
+    for author in authors:
+        future, leader = author_flight.claim(author[0])
+        (leading if leader else following).append((author, future))
+    pending = {author[0] for author, _ in leading}
+    lock_table = get_lock_table()
+    locked: set[str] = set()
+    elsewhere = []
+    if lock_table and leading:
+        # Across processes, the lock table decides who scrapes. Authors locked by another process are read
+        # from the database once that process is done with them.
+        locked = lock_table.try_acquire(f"author:{author[0]}" for author, _ in leading)
+        elsewhere = [author for author, _ in leading if f"author:{author[0]}" not in locked]
+        leading = [(author, future) for author, future in leading if f"author:{author[0]}" in locked]
+    try:
+        for author_id, country in run_pipeline((author for author, _ in leading), stages):
+            author_flight.resolve(author_id, country)
+            pending.discard(author_id)
+            if locked:
+                lock_table.release([f"author:{author_id}"])  # type: ignore
+                locked.discard(f"author:{author_id}")
+            yield author_id, country
+        if elsewhere:
+            lock_table.wait_released(f"author:{author[0]}" for author in elsewhere)  # type: ignore
+            elsewhere_ids = {author[0]: author for author in elsewhere}
+            countries, still_missing = get_storage().fetch_countries_by_gr_ids(elsewhere_ids)
+            # If the other process failed, we resolve them ourselves.
+            countries.update(run_pipeline((elsewhere_ids[author_id] for author_id in still_missing), stages))
+            for author_id, country in countries.items():
+                author_flight.resolve(author_id, country)
+                pending.discard(author_id)
+                yield author_id, country
+    except Exception as e:
+        for author_id in pending:
+            author_flight.fail(author_id, e)
+        pending.clear()
+        raise
+    finally:
+        # Left pending if the caller closed the generator early: followers get an error, not our GeneratorExit.
+        for author_id in pending:
+            author_flight.fail(author_id, RuntimeError(f"Resolution of author {author_id} was abandoned."))
+        if locked:
+            lock_table.release(locked)  # type: ignore
+    for author, future in following:
+        yield author[0], future.result()
+
+
+def resolve_missing_authors(authors: Iterable[tuple[str, str, str]], **pipeline_options) -> Dict[str, str | None]:
+    """Same as iter_resolve_missing_authors, but waits for every author.
+
+    Returns:
+        Dict[str, str | None]: Country name (or None if unknown) per author id.
+    """
+    return dict(iter_resolve_missing_authors(authors, **pipeline_options))
+
+
+def resolve_author_countries(
+    cont: Counter, progress: Callable[[int, int], None] | None = None
+) -> Dict[str, str | None]:
+    """Resolves the birth country of every author in the counter.
+    Authors already in the database are resolved in bulk, the rest are scraped from GR and inserted.
 
     Args:
         cont (Counter): Counter object with the book count per author.
+        progress (Callable[[int, int], None] | None): Called with (authors resolved, total authors) as authors resolve.
+
+    Returns:
+        Dict[str, str | None]: Country name (or None if unknown) per author id.
+    """
+    links = {author_id: (author_link, author_name) for author_id, author_link, author_name in cont}
+    author_countries, missing = lookup_author_countries(links)
+    logger.info("[backend] Found %s authors in database, %s to scrape.", len(author_countries), len(missing))
+    if progress:
+        progress(len(author_countries), len(links))
+    missing_authors = [(author_id, *links[author_id]) for author_id in missing]
+    for author_id, country in iter_resolve_missing_authors(missing_authors):
+        author_countries[author_id] = country
+        if progress:
+            progress(len(author_countries), len(links))
+    return author_countries
+
+
+def iter_country_events(cont: Counter) -> Iterator[Dict[str, Any]]:
+    """Streaming version of generate_country_count + process_country_count.
+    First yields the totals of every author already in the database, then one delta per scraped author
+    as soon as it is persisted, and finally a summary with the complete count.
+    Only the running totals are kept, on top of the counter itself.
+
+    Args:
+        cont (Counter): Counter object with the book count per author.
+
+    Yields:
+        Dict[str, Any]: Events of type "cached", "delta" and "summary".
+    """
+    country_index = get_country_index()
+    book_counts: Dict[str, int] = {}
+    links = {}
+    for (author_id, author_link, author_name), count in cont.items():
+        book_counts[author_id] = book_counts.get(author_id, 0) + count
+        links[author_id] = (author_link, author_name)
+    total = len(links)
+    author_countries, missing = lookup_author_countries(links)
+    resolved = len(author_countries)
+    country_count: Dict[str, int] = {}
+    for author_id, country in author_countries.items():
+        if country:
+            country = country_index.canonical_name(country) or country
+            country_count[country] = country_count.get(country, 0) + book_counts[author_id]
+    del author_countries
+    yield {"type": "cached", "counts": dict(country_count), "authors_resolved": resolved, "authors_total": total}
+    missing_authors = ((author_id, *links[author_id]) for author_id in missing)
+    for author_id, country in iter_resolve_missing_authors(missing_authors):
+        resolved += 1
+        if not country:
+            continue
+        country = country_index.canonical_name(country) or country
+        delta = book_counts[author_id]
+        country_count[country] = country_count.get(country, 0) + delta
+        yield {"type": "delta", "country": country, "delta": delta, "authors_resolved": resolved, "authors_total": total}
+    yield {"type": "summary", "data": process_country_count(country_count), "authors_resolved": resolved, "authors_total": total}
+
+
+def iter_profile_events(profile_url: str) -> Iterator[Dict[str, Any]]:
+    """Streams the processing of a GR profile: a "shelf" event once the shelf is scraped, then iter_country_events.
+
+    Args:
+        profile_url (str): URL of the GR profile.
+
+    Yields:
+        Dict[str, Any]: Events of type "shelf", "cached", "delta" and "summary".
+    """
+    books = scrape_shelf(profile_url)
+    cont = extract_authors(books)
+    yield {"type": "shelf", "books": len(books), "authors": len(cont)}
+    del books
+    yield from iter_country_events(cont)
+
+
+def count_by_country(cont: Counter, author_countries: Dict[str, str | None]) -> Dict[str, int]:
+    """Sums the books of each author into their country.
+
+    Args:
+        cont (Counter): Counter object with the book count per author.
+        author_countries (Dict[str, str | None]): Country per author id, from resolve_author_countries.
 
     Returns:
         Dict[str, int]: Dictionary with the number of books read per country.
     """
     country_counter: Dict[str, int] = {}
-    for (author_id, author_link, author_name), count in cont.items():
-        author_dict = {
-            "name": author_name,
-            "goodreads_id": author_id,
-            "goodreads_link": author_link,
-        }
-        author = fetch_author_by_gr_id(author_id)
-        if author:
-            logger.info(f"[backend] Found {author_id} in database.")
-            country = get_author_place(author, "Country")
-        else:
-            logger.debug(f"[backend] Didn't find {author_id} in database, going to scrape from GR.")
-            birthplace, _ = scrape_gr_author(author_link)  # Scrape the birthplace
-            logger.info("[backend] Scraped author.")
-            geo_dict = process_birthplace(birthplace)
-            logger.info("[backend] Processed author birthplace.")
-            country = insert_everything(author_dict, geo_dict)
-            logger.info("[backend] Inserted everything on db.")
-        if country and country.name in country_counter:
-            country_counter[country.name] += count
+    for (author_id, _, _), count in cont.items():
+        country = author_countries.get(author_id)
+        if country and country in country_counter:
+            country_counter[country] += count
         elif country:
-            country_counter[country.name] = count
+            country_counter[country] = count
     return country_counter
 
 
-def process_country_count(country_count: Dict[str, int]) -> Dict[str, int]:
-    # TODO: Is this necessary?
-    # Get a list of all country names using pycountry
-    all_countries = [country.name for country in pycountry.countries]
+def generate_country_count(cont: Counter) -> Dict[str, int]:
+    """From a counter of books per author, generate a similar one of country: books read from that country.
+
+
+    Args:
+        cont (Counter): Counter object with the book count per author.
 
-    # Prepare a dictionary to store the results
-    complete_data = {}
+    Returns:
+        Dict[str, int]: Dictionary with the number of books read per country.
+    """
+    return count_by_country(cont, resolve_author_countries(cont))
+
+
+def process_profiles(profile_urls: List[str], shelf_workers: int = SHELF_SCRAPE_WORKERS) -> Dict[str, Any]:
+    """Processes many GR profiles at once, e.g. a whole book club.
+    Shelves are scraped concurrently and every unique author across all of them is resolved only once.
+
+    Args:
+        profile_urls (List[str]): URLs of the GR profiles.
+        shelf_workers (int): Shelves scraped at the same time.
+
+    Returns:
+        Dict[str, Any]: Country count per profile (or the error that profile had), the aggregate count of every
+        profile and how many books and unique authors there were.
+    """
+    profile_urls = list(dict.fromkeys(profile_urls))
+
+    def scrape(profile_url: str) -> Counter:
+        return extract_authors(scrape_shelf(profile_url))
+
+    shelves: Dict[str, Counter] = {}
+    errors: Dict[str, str] = {}
+    with ThreadPoolExecutor(max_workers=shelf_workers, thread_name_prefix="shelf") as pool:
+        futures = {
+            profile_url: pool.submit(contextvars.copy_context().run, run_for_request, scrape, profile_url)
+            for profile_url in profile_urls
+        }
+        for profile_url, future in futures.items():
+            try:
+                shelves[profile_url] = future.result()
+            except Exception as e:
+                logger.exception("[backend] Couldn't scrape shelf of %s.", profile_url)
+                errors[profile_url] = str(e)
+    merged: Counter = Counter()
+    for cont in shelves.values():
+        merged.update(cont)
+    logger.info("[backend] %s shelves with %s unique authors.", len(shelves), len(merged))
+    author_countries = resolve_author_countries(merged)
+    profiles: Dict[str, Any] = {
+        profile_url: {"data": process_country_count(count_by_country(cont, author_countries))}
+        for profile_url, cont in shelves.items()
+    }
+    profiles.update({profile_url: {"error": error} for profile_url, error in errors.items()})
+    return {
+        "profiles": profiles,
+        "aggregate": process_country_count(count_by_country(merged, author_countries)),
+        "books": sum(merged.values()),
+        "unique_authors": len(merged),
+    }
+
+
+@functools.lru_cache(maxsize=None)
+def get_scraper() -> Scraper:
+    """Source of shelves and author pages, Goodreads itself unless SCRAPER_BACKEND says otherwise."""
+    return create_scraper()
 
-    # Fill in the count for each country or set it to 0 if not present
-    for country in all_countries:
-        count = country_count.get(country, 0)  # Get the count or default to 0
-        complete_data[country] = count
 
+@functools.lru_cache(maxsize=None)
+def get_lock_table() -> PostgresLockTable | None:
+    """Cross-process lock table, if configured."""
+    return create_lock_table()
+
+
+@functools.lru_cache(maxsize=None)
+def get_read_model() -> SharedReadModel | None:
+    """Author -> country read model of the process, if READ_MODEL_PATH is set."""
+    path = os.getenv("READ_MODEL_PATH")
+    if not path:
+        return None
+    if get_storage().name != "neo4j":
+        logger.warning("[backend] The read model syncs from Neo4j, ignoring READ_MODEL_PATH for %s.", get_storage().name)
+        return None
+    return SharedReadModel(path)
+
+
+def lookup_author_countries(goodreads_ids: Iterable[Any]) -> tuple[Dict[Any, str | None], List[Any]]:
+    """Countries of the authors we already know, from the read model first and the database for the rest.
+
+    Args:
+        goodreads_ids (Iterable[Any]): Goodreads ids of the authors.
+
+    Returns:
+        tuple[Dict[Any, str | None], List[Any]]: Country (or None) of every known author, and the unknown ids.
+    """
+    read_model = get_read_model()
+    with STAGE_SECONDS.time("author_lookup"):
+        if not read_model:
+            countries, unknown = get_storage().fetch_countries_by_gr_ids(goodreads_ids)
+            AUTHORS.inc("database", amount=len(countries))
+            return countries, unknown
+        countries, unknown = read_model.lookup_many(goodreads_ids)
+        AUTHORS.inc("read_model", amount=len(countries))
+        logger.debug("[backend] Read model knew %s authors, %s left for the database.", len(countries), len(unknown))
+        if unknown:
+            database_countries, unknown = get_storage().fetch_countries_by_gr_ids(unknown)
+            AUTHORS.inc("database", amount=len(database_countries))
+            countries.update(database_countries)
+    return countries, unknown
+
+
+@functools.lru_cache(maxsize=None)
+def get_snapshot_store() -> ResultStore:
+    """Shelf snapshot store shared by the whole process."""
+    return create_snapshot_store()
+
+
+def process_profile(
+    profile_url: str, incremental: bool = True, progress: Callable[[int, int], None] | None = None
+) -> Dict[str, int]:
+    """Full processing of a GR profile: scrapes the shelf, resolves every author and counts books per country.
+    With incremental processing, the shelf is diffed against its last snapshot and only new authors are resolved.
+
+    Args:
+        profile_url (str): URL of the GR profile.
+        incremental (bool): Start from the last snapshot of this shelf, if there is one.
+        progress (Callable[[int, int], None] | None): Called with (authors resolved, authors to resolve).
+
+    Returns:
+        Dict[str, int]: Books read per country, with every country present.
+    """
+    # Concurrent requests for the same profile share a single processing, a forced refresh never joins an
+    # incremental one. Whoever leads it reports progress to every caller.
+    key = (normalize_profile_url(profile_url), incremental)
+    if progress:
+        with _profile_progress_lock:
+            _profile_listeners.setdefault(key, []).append(progress)
+            last = _profile_progress.get(key)
+        if last:
+            progress(*last)
+    try:
+        return profile_flight.do(key, lambda: _lead_profile(key, profile_url, incremental))
+    finally:
+        if progress:
+            with _profile_progress_lock:
+                _profile_listeners[key].remove(progress)
+                if not _profile_listeners[key]:
+                    del _profile_listeners[key]
+
+
+def _lead_profile(key: tuple[str, bool], profile_url: str, incremental: bool) -> Dict[str, int]:
+    def report(resolved: int, total: int) -> None:
+        with _profile_progress_lock:
+            _profile_progress[key] = (resolved, total)
+            listeners = list(_profile_listeners.get(key, ()))
+        for listener in listeners:
+            listener(resolved, total)
+
+    try:
+        return _process_profile(profile_url, incremental, report)
+    finally:
+        with _profile_progress_lock:
+            _profile_progress.pop(key, None)
+
+
+def _process_profile(
+    profile_url: str, incremental: bool, progress: Callable[[int, int], None] | None
+) -> Dict[str, int]:
+    with PROFILES_IN_PROGRESS.track():
+        start = time.perf_counter()
+        books = scrape_shelf(profile_url)
+        logger.info("[Process Profile] Extracted books!", extra=_stage_fields("shelf_scrape", start))
+        start = time.perf_counter()
+        cont = extract_authors(books)
+        logger.info("[Process Profile] Extracted authors!", extra=_stage_fields("extract_authors", start))
+        start = time.perf_counter()
+        snapshot_store = get_snapshot_store()
+        snapshot_key = normalize_profile_url(profile_url)
+        previous = snapshot_store.get(snapshot_key) if incremental else None
+        resolve = functools.partial(resolve_author_countries, progress=progress)
+        cc, snapshot = apply_shelf(previous[0] if previous else None, cont, resolve)
+        snapshot_store.set(snapshot_key, snapshot, time.time())
+        logger.info("[Process Profile] Counted countries!", extra=_stage_fields("resolve_authors", start))
+        start = time.perf_counter()
+        full_count = process_country_count(cc)
+        logger.info("[Process Profile] Processed country count!", extra=_stage_fields("process_country_count", start))
+        return full_count
+
+
+def process_country_count(country_count: Dict[str, int]) -> Dict[str, int]:
+    """Puts the country count in the output format: every country known to pycountry, with zero if no books were read.
+    Country names are matched through the country index, so "England" is counted in the United Kingdom. Former
+    countries like the Soviet Union are only in the output if books were read from them.
+
+    Args:
+        country_count (Dict[str, int]): Books read per country, as stored in the database.
+
+    Returns:
+        Dict[str, int]: Books read per pycountry country name.
+    """
+    country_index = get_country_index()
+    complete_data = country_index.zero_counts()
+    for country, count in country_count.items():
+        canonical_name = country_index.canonical_name(country)
+        if canonical_name:
+            complete_data[canonical_name] = complete_data.get(canonical_name, 0) + count
+        else:
+            logger.warning("[backend] Couldn't match country %s, its %s books are not counted.", country, count)
     return complete_data
 
 
@@ -91,13 +519,20 @@ def process_birthplace(birthplace: str | None) -> Dict[str, str | float]| None:
 
     Returns:
         Dict[str, str] | None: Dictionary with at least country and city geographical attributes.
+        The ISO alpha-2 country code is included when the country is known.
     """
     if birthplace:
         
         split_birthplace = birthplace.split(",")
         geo_dict: Dict[str, str| float] = {}
         geo_dict["city"] = split_birthplace[0].strip()
-        geo_dict["country"] = split_birthplace[-1].strip()
+        country = split_birthplace[-1].strip()
+        country_index = get_country_index()
+        # Store countries under their canonical name, so "The United States" and "USA" are the same node.
+        geo_dict["country"] = country_index.canonical_name(country) or country
+        country_code = country_index.code(country)
+        if country_code:
+            geo_dict["country_code"] = country_code
         lat_long = get_lat_long_place(birthplace)
         if len(split_birthplace) > 2:
             geo_dict["region"] = split_birthplace[1].strip()
@@ -107,22 +542,58 @@ def process_birthplace(birthplace: str | None) -> Dict[str, str | float]| None:
         return geo_dict
     return None
 
-def get_lat_long_place(place: str) -> tuple[int, int]| None:
-    geolocator = geopy.geocoders.Nominatim(user_agent="book_explorer")
-    location: Location | None  = geolocator.geocode(place, exactly_one= True)
-    if location:
-        latitude = location.latitude
-        longitude = location.longitude
-        return latitude, longitude
-    return None
+@functools.lru_cache(maxsize=None)
+def get_geocoder() -> Geocoder:
+    """Geocoder shared by every geocoding call.
+    If GAZETTEER_INDEX points to an index built by bookscraper_backend.gazetteer, birthplaces are resolved offline
+    and Nominatim is only asked about the misses (unless GEOCODER_FALLBACK is "none").
+    GEOCODER=fake replaces all of them with the offline stand-in of bookscraper_backend.fakes.
+    """
+    if os.getenv("GEOCODER") == "fake":
+        from bookscraper_backend.fakes import FakeGeocoder
+
+        return FakeGeocoder()
+    nominatim = NominatimGeocoder(user_agent="book_explorer")
+    gazetteer_path = os.getenv("GAZETTEER_INDEX")
+    if not gazetteer_path:
+        return nominatim
+    logger.info("[backend] Using offline gazetteer at %s.", gazetteer_path)
+    gazetteer = GazetteerGeocoder(GazetteerIndex(gazetteer_path), country_code=get_country_index().code)
+    if os.getenv("GEOCODER_FALLBACK", "nominatim") == "none":
+        return gazetteer
+    return FallbackGeocoder([gazetteer, nominatim])
+
+
+@functools.lru_cache(maxsize=None)
+def get_geocode_cache() -> GeocodeCache:
+    """Geocoding cache shared by the whole process. GEOCODE_CACHE_PATH set to an empty string keeps it in memory only."""
+    return GeocodeCache(path=os.getenv("GEOCODE_CACHE_PATH", "./cache/geocode.sqlite") or None)
+
+
+def get_lat_long_place(place: str) -> tuple[float, float] | None:
+    """Geocodes a place, going through the geocoding cache first. Misses are cached as well.
+
+    Args:
+        place (str): Place to geocode, usually the birthplace string from GR.
+
+    Returns:
+        tuple[float, float] | None: Latitude and longitude if the place was found.
+    """
+    cache = get_geocode_cache()
+    cached = cache.get(place)
+    if cached is not MISSING:
+        return cached  # type: ignore
+    with STAGE_SECONDS.time("geocode"):
+        lat_long = get_geocoder().geocode(place)
+    if lat_long is None:
+        GEOCODE_MISSES.inc()
+    cache.set(place, lat_long)
+    return lat_long
 
 
 if __name__ == "__main__":
     user_profile = "https://www.goodreads.com/user/show/71341746-tamir-einhorn-salem"
-    books = process_goodreads_url(user_profile)
+    books = scrape_shelf(user_profile)
     cont = extract_authors(books)
     cc = generate_country_count(cont)
     df = process_country_count(cc)
-    profiler.disable()
-    stats = pstats.Stats(profiler)
-    stats.dump_stats("./profile/my_profile.prof")
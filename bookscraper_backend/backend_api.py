@@ -1,51 +1,226 @@
-from fastapi import FastAPI, HTTPException
-from bookscraper_backend.backend import (
-    process_country_count,
-    extract_authors,
-    generate_country_count,
-)
-from goodreads_scraper.scrape import process_goodreads_url
-from pydantic import BaseModel, HttpUrl
-from fastapi.middleware.wsgi import WSGIMiddleware
-from werkzeug.middleware.profiler import ProfilerMiddleware
-from bookscraper_backend.setup import setup_db
-from graph_db import create_constraints
+from fastapi import Depends, FastAPI, Header, HTTPException, Query
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse, StreamingResponse
+from bookscraper_backend.backend import get_read_model, iter_profile_events, process_profile, process_profiles
+from bookscraper_backend.jobs import JobManager, JobManagerStopped, JobQueueFull
+from bookscraper_backend.pipeline import shutdown_pools
+from bookscraper_backend.result_cache import create_profile_cache
+from pydantic import BaseModel, Field, HttpUrl
+from bookscraper_backend import metrics, profiling
+from bookscraper_backend.countries import get_country_index
+from bookscraper_backend.database.setup import pool_metrics
+from bookscraper_backend.storage import StorageUnavailable, get_storage
 from contextlib import asynccontextmanager
-from logger import logger
-import os
+from logger import logger, request_id
+from typing import Any, AsyncIterator, Dict, Generator, Iterator, List, Literal
+import anyio
+import json
+import uuid
 
 class ProfileRequest(BaseModel):
     profile_url: HttpUrl
+    force_refresh: bool = False  # Skip the result cache and process the profile again.
+
+
+class ProfilesRequest(BaseModel):
+    profile_urls: List[HttpUrl] = Field(min_length=1, max_length=100)
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    neo4j_uri = os.getenv("NEO4J_URI")
-    neo4j_password = os.getenv("NEO4J_PASSWORD")
-    setup_db(uri=neo4j_uri,password=neo4j_password)
-    create_constraints()
+    get_storage().setup()
+    get_country_index()  # Build the country index once, before the first request.
+    read_model = get_read_model()
+    if read_model:
+        read_model.start_sync()
+    job_manager.start()
     yield
+    job_manager.shutdown()
+    shutdown_pools()
+    if read_model:
+        read_model.stop_sync()
 
 app = FastAPI(lifespan=lifespan)
-# Add Werkzeug Profiler Middleware
-app_with_profiler = WSGIMiddleware(
-    ProfilerMiddleware(app, restrictions=[30], profile_dir="./profile")
-)
+profile_cache = create_profile_cache()
+job_manager = JobManager(lambda profile_url, progress: process_profile(profile_url, progress=progress))
+# Profiles requests sent with the admin token, see bookscraper_backend.profiling.
+app.add_middleware(profiling.ProfilingMiddleware)
+app.add_middleware(metrics.MetricsMiddleware)
+
+
+class RequestIdMiddleware:
+    """Gives every request an id, the caller's X-Request-ID or a new one, for its log records and its response."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        headers = dict(scope.get("headers", []))
+        current_id = headers.get(b"x-request-id", b"").decode("latin-1")[:64] or uuid.uuid4().hex
+
+        async def send_with_id(message) -> None:
+            if message["type"] == "http.response.start":
+                message["headers"] = [*message.get("headers", []), (b"x-request-id", current_id.encode("latin-1"))]
+            await send(message)
+
+        token = request_id.set(current_id)
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            request_id.reset(token)
+
+
+# Outermost, so the id is set for everything the other middlewares log.
+app.add_middleware(RequestIdMiddleware)
 
 
 @app.post("/process-profile/")
 def profile(request: ProfileRequest):
     try:
-        logger.info(f"[Process Profile Request]: Starting for {request.profile_url}!")
-        books = process_goodreads_url(str(request.profile_url))
-        logger.info("[Process Profile] Extracted books!")
-        cont = extract_authors(books)
-        logger.info("[Process Profile] Extracted authors!")
-        cc = generate_country_count(cont)
-        logger.info("[Process Profile] Counted countries!")
-        full_count = process_country_count(cc)
-        logger.info("[Process Profile] Processed country count!")
-        return {"data": full_count}
+        logger.info("[Process Profile Request]: Starting for %s!", request.profile_url)
+        profile_url = str(request.profile_url)
+        # Runs on the request's own thread, not on the job workers, so sync requests don't wait behind queued jobs.
+        # A forced refresh skips the shelf snapshot too, so every author is resolved again.
+        with profiling.request_thread():
+            full_count, cache_meta = profile_cache.get_or_compute(
+                profile_url,
+                lambda: process_profile(profile_url, incremental=not request.force_refresh),
+                force_refresh=request.force_refresh,
+            )
+        logger.info("[Process Profile Request]: Done for %s, cached: %s.", request.profile_url, cache_meta["cached"])
+        return {"data": full_count, "cache": cache_meta}
+    except Exception as e:
+        logger.exception(str(e))
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+async def _stream_events(events: Generator[Dict[str, Any], None, None], stream_format: str) -> AsyncIterator[str]:
+    """Formats the events as they come, pulling each one on a worker thread.
+    If the client goes away, Starlette cancels the stream and the events are closed, which stops their pipeline.
+    """
+    lines = _format_events(events, stream_format)
+    try:
+        while True:
+            line = await anyio.to_thread.run_sync(profiling.run_for_request, next, lines, None)
+            if line is None:
+                break
+            yield line
+    finally:
+        with anyio.CancelScope(shield=True):
+            await anyio.to_thread.run_sync(profiling.run_for_request, events.close)
+
+
+def _format_events(events: Iterator[Dict[str, Any]], stream_format: str) -> Iterator[str]:
+    try:
+        for event in events:
+            yield _format_event(event, stream_format)
+    except Exception as e:
+        logger.exception(str(e))
+        yield _format_event({"type": "error", "detail": str(e)}, stream_format)
+
+
+def _format_event(event: Dict[str, Any], stream_format: str) -> str:
+    if stream_format == "sse":
+        return f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+    return json.dumps(event) + "\n"
+
+
+@app.post("/process-profile/stream")
+def profile_stream(request: ProfileRequest, format: Literal["ndjson", "sse"] = "ndjson"):
+    """Same as /process-profile/, but streams partial counts while the authors resolve.
+    Events: shelf, cached (totals of authors already known), delta (one per scraped author), summary (final count).
+    """
+    logger.info("[Process Profile Stream]: Starting for %s!", request.profile_url)
+    events = iter_profile_events(str(request.profile_url))
+    media_type = "text/event-stream" if format == "sse" else "application/x-ndjson"
+    return StreamingResponse(_stream_events(events, format), media_type=media_type)
+
+
+@app.post("/process-profiles/")
+def profiles(request: ProfilesRequest):
+    try:
+        logger.info("[Process Profiles Request]: Starting for %s profiles!", len(request.profile_urls))
+        with profiling.request_thread():
+            result = process_profiles([str(profile_url) for profile_url in request.profile_urls])
+        logger.info("[Process Profiles Request]: Done, %s unique authors.", result["unique_authors"])
+        return result
     except Exception as e:
         logger.exception(str(e))
         raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.post("/jobs/process-profile", status_code=202)
+def submit_profile_job(request: ProfileRequest):
+    try:
+        job, created = job_manager.submit(str(request.profile_url))
+    except (JobQueueFull, JobManagerStopped) as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    return {"job_id": job.id, "status": job.status, "created": created}
+
+
+@app.get("/jobs/{job_id}")
+def get_profile_job(job_id: str):
+    job = job_manager.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found.")
+    return job.to_dict()
+
+
+@app.get("/db/health")
+def db_health():
+    """Round-trip to the database of STORAGE_BACKEND. 503 if it can't be reached."""
+    storage = get_storage()
+    try:
+        storage.ping()
+    except StorageUnavailable as e:
+        logger.warning("[DB Health]: Health check of %s failed: %s", storage.name, e)
+        return JSONResponse(
+            status_code=503,
+            content={"status": "unavailable", "backend": storage.name, "error": str(e), "pool": pool_metrics()},
+        )
+    return {"status": "ok", "backend": storage.name, "pool": pool_metrics()}
+
+
+@app.get("/db/pool")
+def db_pool():
+    return pool_metrics()
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    """Metrics of this process in the Prometheus text format."""
+    return PlainTextResponse(metrics.REGISTRY.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+def require_profiling_token(x_profile_token: str | None = Header(default=None)) -> None:
+    if not profiling.profiling_enabled():
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not profiling.check_token(x_profile_token):
+        raise HTTPException(status_code=403, detail="Invalid profiling token.")
+
+
+@app.post("/admin/profiles/sample", status_code=202, dependencies=[Depends(require_profiling_token)])
+def sample_profile(
+    seconds: float = Query(default=10, gt=0, le=profiling.PROFILE_MAX_WINDOW),
+    interval: float = Query(default=profiling.PROFILE_SAMPLE_INTERVAL, ge=0.001, le=1),
+):
+    """Samples every thread of this process for a number of seconds. The profile is listed once it's done."""
+    name = profiling.sample_window(seconds, interval)
+    if name is None:
+        raise HTTPException(status_code=409, detail="Another profile is being captured.")
+    return {"name": name, "seconds": seconds, "files": [f"{name}.prof", f"{name}.collapsed"]}
+
+
+@app.get("/admin/profiles", dependencies=[Depends(require_profiling_token)])
+def list_profiles():
+    return profiling.list_profiles()
+
+
+@app.get("/admin/profiles/{name}", dependencies=[Depends(require_profiling_token)])
+def download_profile(name: str):
+    path = profiling.profile_path(name)
+    if not path:
+        raise HTTPException(status_code=404, detail=f"Profile {name} not found.")
+    return FileResponse(path, filename=name, media_type="application/octet-stream")
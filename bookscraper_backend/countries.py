@@ -0,0 +1,175 @@
+import datetime
+import difflib
+import functools
+import unicodedata
+from typing import Dict, NamedTuple
+import pycountry
+from logger import logger
+
+# Spellings GR uses (or used) that pycountry doesn't know, by ISO alpha-2 code of the country we count them as.
+# Former names of a country that still exists (Persia, Ceylon, Zaire, West Germany...) are counted as that country.
+# Countries that broke up or were absorbed are not aliases: they are in FORMER_COUNTRIES.
+GOODREADS_ALIASES: Dict[str, str] = {
+    "united states": "US",
+    "united states of america": "US",
+    "usa": "US",
+    "u.s.a.": "US",
+    "united kingdom": "GB",
+    "uk": "GB",
+    "great britain": "GB",
+    "england": "GB",
+    "scotland": "GB",
+    "wales": "GB",
+    "northern ireland": "GB",
+    "russia": "RU",
+    "czech republic": "CZ",
+    "west germany": "DE",
+    "german empire": "DE",
+    "turkey": "TR",
+    "persia": "IR",
+    "iran": "IR",
+    "burma": "MM",
+    "ceylon": "LK",
+    "zaire": "CD",
+    "rhodesia": "ZW",
+    "siam": "TH",
+    "holland": "NL",
+    "netherlands": "NL",
+    "south korea": "KR",
+    "north korea": "KP",
+    "korea": "KR",
+    "vietnam": "VN",
+    "syria": "SY",
+    "venezuela": "VE",
+    "bolivia": "BO",
+    "tanzania": "TZ",
+    "laos": "LA",
+    "moldova": "MD",
+    "palestine": "PS",
+    "ivory coast": "CI",
+    "cape verde": "CV",
+    "macedonia": "MK",
+    "swaziland": "SZ",
+    "east timor": "TL",
+    "vatican city": "VA",
+    "philippines": "PH",
+    "bahamas": "BS",
+    "gambia": "GM",
+    "congo": "CG",
+}
+
+
+
+class FormerCountry(NamedTuple):
+    """A country that no longer exists, counted under its own name. Like the countries table, which keeps former
+    countries apart with their end_date, we don't guess which of their successors an author was born in.
+    """
+
+    name: str
+    end_date: datetime.date
+
+
+_SOVIET_UNION = FormerCountry("Soviet Union", datetime.date(1991, 12, 26))
+_YUGOSLAVIA = FormerCountry("Yugoslavia", datetime.date(1992, 4, 27))
+
+# Spellings of former countries GR uses (or used), by the country they stand for.
+FORMER_COUNTRIES: Dict[str, FormerCountry] = {
+    "ussr": _SOVIET_UNION,
+    "soviet union": _SOVIET_UNION,
+    "russian empire": FormerCountry("Russian Empire", datetime.date(1917, 9, 14)),
+    "czechoslovakia": FormerCountry("Czechoslovakia", datetime.date(1992, 12, 31)),
+    "yugoslavia": _YUGOSLAVIA,
+    "kingdom of yugoslavia": _YUGOSLAVIA,
+    "prussia": FormerCountry("Prussia", datetime.date(1947, 2, 25)),
+    "east germany": FormerCountry("East Germany", datetime.date(1990, 10, 3)),
+    "austria-hungary": FormerCountry("Austria-Hungary", datetime.date(1918, 10, 31)),
+    "ottoman empire": FormerCountry("Ottoman Empire", datetime.date(1922, 11, 1)),
+    "mandatory palestine": FormerCountry("Mandatory Palestine", datetime.date(1948, 5, 14)),
+}
+
+# How similar (0 to 1) an unknown spelling must be to a known one to be matched by the fuzzy fallback.
+FUZZY_CUTOFF = 0.85
+
+
+def normalize_name(name: str) -> str:
+    """Lowercase, accent free, single spaced version of a place name. "São  Paulo" and "sao paulo" are the same key."""
+    decomposed = unicodedata.normalize("NFKD", name.casefold())
+    return " ".join("".join(c for c in decomposed if not unicodedata.combining(c)).split())
+
+
+def _country_key(name: str) -> str:
+    key = normalize_name(name)
+    return key[4:] if key.startswith("the ") else key
+
+
+class CountryIndex:
+    """Maps every spelling of a country we know (GR spellings, former names, pycountry names and alpha-3 codes)
+    to the pycountry country, or the FormerCountry, it stands for. Build it once, through get_country_index.
+
+    Alpha-2 codes aren't spellings: birthplaces are free text, and their last part is often a US state
+    ("Atlanta, GA", "Philadelphia, PA") that would otherwise become Gabon or Panama.
+    """
+
+    def __init__(self, aliases: Dict[str, str] = GOODREADS_ALIASES, former_countries: Dict[str, FormerCountry] = FORMER_COUNTRIES):
+        self._countries: Dict[str, object] = {}
+        by_alpha_2 = {country.alpha_2: country for country in pycountry.countries}
+        for country in pycountry.countries:
+            for attribute in ("name", "official_name", "common_name", "alpha_3"):
+                spelling = getattr(country, attribute, None)
+                if spelling:
+                    self._countries.setdefault(_country_key(spelling), country)
+        for alias, alpha_2 in aliases.items():
+            self._countries[_country_key(alias)] = by_alpha_2[alpha_2]
+        for spelling, former_country in former_countries.items():
+            self._countries[_country_key(spelling)] = former_country
+            self._countries.setdefault(_country_key(former_country.name), former_country)
+        # Output template: every current country with a zero count, in pycountry's order.
+        self._zero_counts = {country.name: 0 for country in pycountry.countries}
+        self._keys = list(self._countries)
+        self._fuzzy_match = functools.lru_cache(maxsize=4096)(self._closest_key)
+        logger.info("[countries] Indexed %s country spellings.", len(self._countries))
+
+    def _closest_key(self, key: str) -> str | None:
+        matches = difflib.get_close_matches(key, self._keys, n=1, cutoff=FUZZY_CUTOFF)
+        if matches:
+            logger.debug("[countries] Fuzzy matched %s to %s.", key, matches[0])
+            return matches[0]
+        return None
+
+    def resolve(self, name: str):
+        """Finds the country for a spelling, exactly if possible and through a cached fuzzy match otherwise.
+
+        Args:
+            name (str): Country spelling, like "The United States" or "USSR".
+
+        Returns:
+            pycountry country | FormerCountry | None: The country, if the spelling is close enough to one we know.
+        """
+        key = _country_key(name)
+        if not key:
+            return None
+        country = self._countries.get(key)
+        if country is None:
+            closest = self._fuzzy_match(key)
+            country = self._countries[closest] if closest else None
+        return country
+
+    def code(self, name: str) -> str | None:
+        """ISO alpha-2 code for a country spelling, if known. Former countries have none."""
+        country = self.resolve(name)
+        return getattr(country, "alpha_2", None)
+
+    def canonical_name(self, name: str) -> str | None:
+        """pycountry name (or FormerCountry name) for a country spelling, if known. This is the name used in the API output."""
+        country = self.resolve(name)
+        return country.name if country else None  # type: ignore
+
+    def zero_counts(self) -> Dict[str, int]:
+        """Fresh copy of the output template, with every current country set to zero."""
+        return dict(self._zero_counts)
+
+
+@functools.lru_cache(maxsize=None)
+def get_country_index() -> CountryIndex:
+    """The process wide CountryIndex, built on first use."""
+    return CountryIndex()
@@ -1,5 +1,6 @@
 from typing import Optional
 from sqlalchemy import (
+    DateTime,
     String,
     Integer,
     ForeignKey,
@@ -14,6 +15,7 @@ from sqlalchemy.orm import (
     mapped_column,
     relationship,
 )
+from sqlalchemy.sql import func
 
 import datetime
 
@@ -108,3 +110,14 @@ class Author(BaseModel):
     goodreads_link: Mapped[Optional[str]] = mapped_column(unique=True)
     birth_city_id: Mapped[Optional[int]] = mapped_column(ForeignKey(City.id))
     birth_city: Mapped[Optional["City"]] = relationship(back_populates="authors")
+    # Country of the birth city (directly or through its region), so author -> country lookups are one join.
+    birth_country_id: Mapped[Optional[int]] = mapped_column(ForeignKey(Country.id))
+
+
+
+class ResolutionLock(Base):
+    """Row based lock, so only one process at a time resolves a given author or profile."""
+    __tablename__ = "resolution_locks"
+    key: Mapped[str] = mapped_column(String, primary_key=True)
+    owner: Mapped[str] = mapped_column(String)
+    acquired_at: Mapped[datetime.datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
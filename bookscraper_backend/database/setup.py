@@ -1,24 +1,133 @@
+import functools
 import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator
 from sqlalchemy import (
+    Engine,
     create_engine,
     URL
 )
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
 from sqlalchemy.orm import (
+    Session,
     sessionmaker
 )
+from sqlalchemy.pool import QueuePool
+from logger import logger
+
 DB_USER = os.getenv("DB_USER", "user")
 DB_PASSWORD = os.getenv("DB_PASSWORD", "password")
-DB_PORT = os.getenv("DB_PORT", 5432)
-db_url = URL.create(
-    "postgresql",
-    username=DB_USER,
-    password=DB_PASSWORD,
-    port=DB_PORT, #type: ignore
-    host="localhost",
-    database="db",
-)
-engine = create_engine(
-    db_url
-)
-Session = sessionmaker(bind=engine)
-db_session = Session()
+DB_HOST = os.getenv("DB_HOST", "localhost")
+DB_PORT = int(os.getenv("DB_PORT", 5432))
+DB_NAME = os.getenv("DB_NAME", "db")
+# Connections kept open, and extra ones opened under load (closed once returned).
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 5))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 10))
+# Seconds a request waits for a connection before failing.
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 30))
+# Seconds after which a connection is replaced, before the server or a proxy drops it.
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", 30 * 60))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that also records how long checkouts wait for a connection.
+    The pool events only fire once a connection is handed out, so the wait is timed around QueuePool._do_get, a
+    private method of SQLAlchemy 2.x. tests/test_db_setup.py fails if it goes away.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.checkouts = 0
+        self.timeouts = 0
+        self.total_wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self._stats_lock = threading.Lock()
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            with self._stats_lock:
+                self.timeouts += 1
+            raise
+        finally:
+            waited = time.perf_counter() - start
+            with self._stats_lock:
+                self.checkouts += 1
+                self.total_wait_seconds += waited
+                self.max_wait_seconds = max(self.max_wait_seconds, waited)
+
+
+def database_url() -> URL:
+    return URL.create(
+        "postgresql",
+        username=DB_USER,
+        password=DB_PASSWORD,
+        port=DB_PORT,
+        host=DB_HOST,
+        database=DB_NAME,
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def get_engine() -> Engine:
+    """Engine of the process, created on first use rather than on import. Its pool is shared by every thread."""
+    logger.info("[Postgres Setup] Creating engine for %s:%s/%s.", DB_HOST, DB_PORT, DB_NAME)
+    return create_engine(
+        database_url(),
+        poolclass=TimedQueuePool,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=DB_POOL_PRE_PING,
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def get_session_factory() -> sessionmaker[Session]:
+    """Creates sessions bound to the engine. Each session borrows a pooled connection while it is in use."""
+    return sessionmaker(bind=get_engine(), expire_on_commit=False)
+
+
+@contextmanager
+def session_scope() -> Iterator[Session]:
+    """A session committed when the block succeeds, rolled back when it raises, and closed either way."""
+    session = get_session_factory()()
+    try:
+        yield session
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+
+
+def get_session() -> Iterator[Session]:
+    """FastAPI dependency: one session per request, returned to the pool when the request is done."""
+    with session_scope() as session:
+        yield session
+
+
+def pool_metrics() -> Dict[str, Any]:
+    """State of the connection pool. Empty if no connection was ever requested."""
+    if get_engine.cache_info().currsize == 0:
+        return {}
+    pool: TimedQueuePool = get_engine().pool  # type: ignore
+    with pool._stats_lock:
+        return {
+            "size": pool.size(),
+            "checked_out": pool.checkedout(),
+            "checked_in": pool.checkedin(),
+            "overflow": max(pool.overflow(), 0),
+            "max_overflow": DB_MAX_OVERFLOW,
+            "checkouts": pool.checkouts,
+            "timeouts": pool.timeouts,
+            "mean_wait_seconds": pool.total_wait_seconds / pool.checkouts if pool.checkouts else 0.0,
+            "max_wait_seconds": pool.max_wait_seconds,
+        }
@@ -0,0 +1,219 @@
+"""Offline stand-ins for Goodreads and Nominatim, so the whole pipeline can run on one machine for repeatable
+benchmarks and load tests.
+
+Shelves and authors come from a synthetic catalog: every author has a deterministic name and birthplace,
+shelves mix a pool of popular authors (shared between shelves) with the long tail, and birth countries follow
+a Zipf-like distribution. Latency and error rates of each service are configurable.
+
+Selected with SCRAPER_BACKEND=fake, GEOCODER=fake and STORAGE_BACKEND=memory, and configured with the FAKE_*
+variables below. A profile URL can ask for a shelf size with a "books" query parameter, e.g.
+https://www.goodreads.com/user/show/1-bench?books=20000.
+"""
+import bisect
+import hashlib
+import os
+import random
+import threading
+import time
+from typing import Any, Dict, List
+from urllib.parse import parse_qs, urlparse
+import pycountry
+
+FAKE_SEED = int(os.getenv("FAKE_SEED", 0))
+FAKE_AUTHORS = int(os.getenv("FAKE_AUTHORS", 100_000))
+FAKE_POPULAR_AUTHORS = int(os.getenv("FAKE_POPULAR_AUTHORS", 1_000))
+FAKE_SHELF_SIZE = int(os.getenv("FAKE_SHELF_SIZE", 200))
+# Share of the books of a shelf written by the popular authors, which most shelves have in common.
+FAKE_AUTHOR_OVERLAP = float(os.getenv("FAKE_AUTHOR_OVERLAP", 0.5))
+FAKE_NO_BIRTHPLACE_RATE = float(os.getenv("FAKE_NO_BIRTHPLACE_RATE", 0.15))
+FAKE_REGION_RATE = float(os.getenv("FAKE_REGION_RATE", 0.5))
+# Exponent of the Zipf-like distribution of birth countries. 0 is uniform.
+FAKE_COUNTRY_SKEW = float(os.getenv("FAKE_COUNTRY_SKEW", 1.1))
+# Seconds per call.
+FAKE_SHELF_LATENCY = float(os.getenv("FAKE_SHELF_LATENCY", 0))
+FAKE_AUTHOR_LATENCY = float(os.getenv("FAKE_AUTHOR_LATENCY", 0))
+FAKE_GEOCODE_LATENCY = float(os.getenv("FAKE_GEOCODE_LATENCY", 0))
+# Spread of the latencies: each call takes its latency times a log-normal factor of median 1 and this sigma,
+# which gives the long tail of real services. 0 keeps latencies fixed.
+FAKE_LATENCY_SIGMA = float(os.getenv("FAKE_LATENCY_SIGMA", 0))
+# Share of calls that raise FakeServiceError.
+FAKE_SCRAPE_ERROR_RATE = float(os.getenv("FAKE_SCRAPE_ERROR_RATE", 0))
+FAKE_GEOCODE_ERROR_RATE = float(os.getenv("FAKE_GEOCODE_ERROR_RATE", 0))
+# Share of places the geocoder doesn't find.
+FAKE_GEOCODE_MISS_RATE = float(os.getenv("FAKE_GEOCODE_MISS_RATE", 0.05))
+
+# Fake author ids start here, so they don't look like small real ids.
+AUTHOR_ID_BASE = 10_000_000
+
+
+class FakeServiceError(RuntimeError):
+    pass
+
+
+def _stable_hash(text: str) -> int:
+    return int.from_bytes(hashlib.blake2b(text.encode(), digest_size=8).digest(), "little")
+
+
+class SyntheticCatalog:
+    """Deterministic authors, birthplaces and shelves. The same seed always gives the same data."""
+
+    def __init__(
+        self,
+        authors: int = FAKE_AUTHORS,
+        popular_authors: int = FAKE_POPULAR_AUTHORS,
+        no_birthplace_rate: float = FAKE_NO_BIRTHPLACE_RATE,
+        region_rate: float = FAKE_REGION_RATE,
+        country_skew: float = FAKE_COUNTRY_SKEW,
+        seed: int = FAKE_SEED,
+    ):
+        """
+        Args:
+            authors (int): Authors in the catalog.
+            popular_authors (int): Authors in the pool shelves share.
+            no_birthplace_rate (float): Share of authors without a birthplace on GR.
+            region_rate (float): Share of birthplaces with a region ("city, region, country").
+            country_skew (float): Exponent of the Zipf-like distribution of birth countries.
+            seed (int): Seed of everything random.
+        """
+        self.authors = authors
+        self.popular_authors = max(1, min(popular_authors, authors))
+        self.no_birthplace_rate = no_birthplace_rate
+        self.region_rate = region_rate
+        self.seed = seed
+        # Birthplaces are split on commas, so countries whose name has one go by their common name or are left out.
+        names = [getattr(country, "common_name", country.name) for country in pycountry.countries]
+        self.countries = sorted(name for name in names if "," not in name)
+        random.Random(seed).shuffle(self.countries)
+        self._cumulative_weights: List[float] = []
+        total = 0.0
+        for rank in range(len(self.countries)):
+            total += 1 / (rank + 1) ** country_skew
+            self._cumulative_weights.append(total)
+
+    def author(self, index: int) -> tuple[str, str, str]:
+        """Id, link and name of the author at this index of the catalog."""
+        author_id = str(AUTHOR_ID_BASE + index)
+        return author_id, f"https://www.goodreads.com/author/show/{author_id}.Fake_Author_{index}", f"Fake Author {index}"
+
+    def index_of(self, author_link: str) -> int:
+        author_id = urlparse(author_link).path.rsplit("/", 1)[-1].split(".", 1)[0]
+        return int(author_id) - AUTHOR_ID_BASE
+
+    def birthplace(self, index: int) -> str | None:
+        rng = random.Random(self.seed * 1_000_003 + index)
+        if rng.random() < self.no_birthplace_rate:
+            return None
+        country_position = bisect.bisect_left(self._cumulative_weights, rng.random() * self._cumulative_weights[-1])
+        country = self.countries[min(country_position, len(self.countries) - 1)]
+        city = f"Fakecity {rng.randrange(500)}"
+        if rng.random() < self.region_rate:
+            return f"{city}, Fakeregion {rng.randrange(20)}, {country}"
+        return f"{city}, {country}"
+
+    def shelf(self, profile_url: str, size: int, overlap: float) -> List[Dict[str, str]]:
+        """Books of a profile's shelf: a share of them by popular authors, the rest by any author of the catalog."""
+        rng = random.Random(self.seed * 1_000_003 + _stable_hash(profile_url))
+        books = []
+        for position in range(size):
+            if rng.random() < overlap:
+                index = rng.randrange(self.popular_authors)
+            else:
+                index = rng.randrange(self.authors)
+            author_id, author_link, author_name = self.author(index)
+            books.append(
+                {
+                    "title": f"Fake Book {position}",
+                    "author_id": author_id,
+                    "author_link": author_link,
+                    "author_name": author_name,
+                }
+            )
+        return books
+
+
+class FakeService:
+    """Latency and injected errors, shared by the fakes. Both are drawn from a seeded generator."""
+
+    def __init__(self, error_rate: float, seed: int, latency_sigma: float = FAKE_LATENCY_SIGMA):
+        self.error_rate = error_rate
+        self.latency_sigma = latency_sigma
+        self.calls = 0
+        self.errors = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _call(self, what: str, latency: float) -> None:
+        if latency and self.latency_sigma:
+            with self._lock:
+                latency *= self._rng.lognormvariate(0, self.latency_sigma)
+        if latency:
+            time.sleep(latency)
+        with self._lock:
+            self.calls += 1
+            failed = self._rng.random() < self.error_rate
+            if failed:
+                self.errors += 1
+        if failed:
+            raise FakeServiceError(f"Injected failure of {what}.")
+
+
+class FakeGoodreads(FakeService):
+    """Scraper serving shelves and author pages from a SyntheticCatalog."""
+
+    def __init__(
+        self,
+        catalog: SyntheticCatalog | None = None,
+        shelf_size: int = FAKE_SHELF_SIZE,
+        author_overlap: float = FAKE_AUTHOR_OVERLAP,
+        shelf_latency: float = FAKE_SHELF_LATENCY,
+        author_latency: float = FAKE_AUTHOR_LATENCY,
+        error_rate: float = FAKE_SCRAPE_ERROR_RATE,
+        seed: int = FAKE_SEED,
+    ):
+        """
+        Args:
+            catalog (SyntheticCatalog | None): Authors and shelves. Defaults to one configured from the environment.
+            shelf_size (int): Books per shelf, unless the profile URL has a "books" query parameter.
+            author_overlap (float): Share of the books written by popular authors.
+            shelf_latency (float): Seconds to scrape a shelf.
+            author_latency (float): Seconds to scrape an author page.
+            error_rate (float): Share of scrapes that fail.
+            seed (int): Seed of the injected errors.
+        """
+        super().__init__(error_rate, seed)
+        self.catalog = catalog or SyntheticCatalog()
+        self.shelf_size = shelf_size
+        self.author_overlap = author_overlap
+        self.shelf_latency = shelf_latency
+        self.author_latency = author_latency
+
+    def process_goodreads_url(self, profile_url: str) -> List[Dict[str, str]]:
+        self._call("shelf scrape", self.shelf_latency)
+        size = int(parse_qs(urlparse(profile_url).query).get("books", [self.shelf_size])[0])
+        return self.catalog.shelf(profile_url, size, self.author_overlap)
+
+    def scrape_gr_author(self, author_link: str) -> tuple[str | None, Any]:
+        self._call("author scrape", self.author_latency)
+        return self.catalog.birthplace(self.catalog.index_of(author_link)), None
+
+
+class FakeGeocoder(FakeService):
+    """Geocoder giving every place stable made-up coordinates, except for a share of places it doesn't find."""
+
+    def __init__(
+        self,
+        latency: float = FAKE_GEOCODE_LATENCY,
+        error_rate: float = FAKE_GEOCODE_ERROR_RATE,
+        miss_rate: float = FAKE_GEOCODE_MISS_RATE,
+        seed: int = FAKE_SEED,
+    ):
+        super().__init__(error_rate, seed)
+        self.latency = latency
+        self.miss_rate = miss_rate
+
+    def geocode(self, place: str) -> tuple[float, float] | None:
+        self._call("geocoding", self.latency)
+        digest = _stable_hash(place)
+        if (digest % 10_000) / 10_000 < self.miss_rate:
+            return None
+        return (digest >> 16) % 180_000 / 1000 - 90, (digest >> 40) % 360_000 / 1000 - 180
@@ -0,0 +1,199 @@
+"""Offline geocoder built from a GeoNames dump (e.g. cities15000.txt from https://download.geonames.org/export/dump/).
+
+The dump is compiled into a compact index file:
+    header | sorted 64 bit hashes of "name|country code" | fixed size records (latitude, longitude, admin region)
+which is memory-mapped read-only, so lookups are a binary search over the mapped hashes and every process
+using the same file shares a single copy of it.
+
+Build it with:
+    python -m bookscraper_backend.gazetteer cities15000.txt gazetteer.idx --admin1 admin1CodesASCII.txt
+"""
+import argparse
+import bisect
+import hashlib
+import mmap
+import struct
+import sys
+from array import array
+from typing import Callable, Dict, Iterator, NamedTuple, TextIO
+from bookscraper_backend.countries import get_country_index, normalize_name
+from logger import logger
+
+MAGIC = b"BXGZ"
+VERSION = 1
+HEADER = struct.Struct("<4sIQ")  # magic, version, number of entries
+RECORD = struct.Struct("<dd32s")  # latitude, longitude, admin region name (utf-8, truncated)
+
+# GeoNames dump columns we use.
+NAME, ASCII_NAME, ALTERNATE_NAMES, LATITUDE, LONGITUDE, COUNTRY_CODE, ADMIN1_CODE, POPULATION = 1, 2, 3, 4, 5, 8, 10, 14
+
+
+class GazetteerEntry(NamedTuple):
+    latitude: float
+    longitude: float
+    admin_region: str | None
+
+
+def _hash_key(name: str, country_code: str) -> int:
+    key = f"{normalize_name(name)}|{country_code.upper()}".encode()
+    return int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), "little")
+
+
+def load_admin1_names(source: TextIO) -> Dict[str, str]:
+    """Reads admin1CodesASCII.txt, which maps "US.CA" to "California"."""
+    names = {}
+    for line in source:
+        columns = line.rstrip("\n").split("\t")
+        if len(columns) >= 2:
+            names[columns[0]] = columns[1]
+    return names
+
+
+def _iter_dump_entries(
+    source: TextIO, admin1_names: Dict[str, str], alternate_names: bool
+) -> Iterator[tuple[int, int, GazetteerEntry]]:
+    for line in source:
+        columns = line.rstrip("\n").split("\t")
+        if len(columns) <= POPULATION:
+            continue
+        country_code = columns[COUNTRY_CODE]
+        entry = GazetteerEntry(
+            float(columns[LATITUDE]),
+            float(columns[LONGITUDE]),
+            admin1_names.get(f"{country_code}.{columns[ADMIN1_CODE]}"),
+        )
+        population = int(columns[POPULATION] or 0)
+        names = {columns[NAME], columns[ASCII_NAME]}
+        if alternate_names and columns[ALTERNATE_NAMES]:
+            names.update(columns[ALTERNATE_NAMES].split(","))
+        for name in names:
+            if name:
+                # Every city is reachable with and without its country. Without a country, the most populous wins.
+                yield _hash_key(name, country_code), population, entry
+                yield _hash_key(name, ""), population, entry
+
+
+def build_index(source: TextIO, output_path: str, admin1_names: Dict[str, str] | None = None, alternate_names: bool = False) -> int:
+    """Compiles a GeoNames dump into an index file GazetteerIndex can map.
+
+    Args:
+        source (TextIO): GeoNames dump, tab separated.
+        output_path (str): Where to write the index.
+        admin1_names (Dict[str, str] | None): Admin region names by "country code.admin1 code", from load_admin1_names.
+        alternate_names (bool): Also index the alternate names of each city. Much bigger index, better recall.
+
+    Returns:
+        int: Number of keys in the index.
+    """
+    best: Dict[int, tuple[int, GazetteerEntry]] = {}
+    for key, population, entry in _iter_dump_entries(source, admin1_names or {}, alternate_names):
+        if key not in best or population > best[key][0]:
+            best[key] = (population, entry)
+    keys = sorted(best)
+    hashes = array("Q", keys)
+    with open(output_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, len(keys)))
+        f.write(hashes.tobytes())
+        for key in keys:
+            entry = best[key][1]
+            admin = (entry.admin_region or "").encode()[: RECORD.size - 16]
+            f.write(RECORD.pack(entry.latitude, entry.longitude, admin))
+    logger.info("[gazetteer] Wrote %s keys to %s.", len(keys), output_path)
+    return len(keys)
+
+
+class GazetteerIndex:
+    """Read-only, memory-mapped view of an index file written by build_index."""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.size = HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a gazetteer index (version {VERSION}).")
+        hashes_end = HEADER.size + 8 * self.size
+        self._hashes = memoryview(self._mmap)[HEADER.size : hashes_end].cast("Q")
+        self._records_offset = hashes_end
+
+    def __len__(self) -> int:
+        return self.size
+
+    def lookup(self, name: str, country_code: str = "") -> GazetteerEntry | None:
+        """Finds a city by name, within a country if its ISO alpha-2 code is given.
+
+        Args:
+            name (str): City name, in any case and with or without accents.
+            country_code (str): ISO alpha-2 code of the country, or an empty string to look in every country.
+
+        Returns:
+            GazetteerEntry | None: Coordinates and admin region of the city, if it is in the index.
+        """
+        key = _hash_key(name, country_code)
+        position = bisect.bisect_left(self._hashes, key)
+        if position == self.size or self._hashes[position] != key:
+            return None
+        latitude, longitude, admin = RECORD.unpack_from(self._mmap, self._records_offset + position * RECORD.size)
+        admin_region = admin.rstrip(b"\0").decode(errors="ignore") or None
+        return GazetteerEntry(latitude, longitude, admin_region)
+
+    def close(self) -> None:
+        self._hashes.release()
+        self._mmap.close()
+
+
+class GazetteerGeocoder:
+    """Offline geocoder for GR birthplaces ("city, [region,] country") backed by a GazetteerIndex."""
+
+    def __init__(self, index: GazetteerIndex, country_code: Callable[[str], str | None] | None = None):
+        """
+        Args:
+            index (GazetteerIndex): Mapped index file.
+            country_code (Callable[[str], str | None] | None): Turns the country part of the birthplace into an
+            ISO alpha-2 code. Defaults to the shared CountryIndex.
+        """
+        self.index = index
+        self.country_code = country_code or get_country_index().code
+
+    def geocode(self, place: str) -> tuple[float, float] | None:
+        """Coordinates of the city of a birthplace, None when the index can't tell which city it is.
+        The index only keeps the most populous city of each name within a country, so a birthplace with a region
+        is only answered if that city is in the same region (which needs an index built with --admin1), and a
+        birthplace with a country we can't map isn't looked up in other countries. Those are left to the fallback.
+        """
+        parts = [part.strip() for part in place.split(",") if part.strip()]
+        if not parts:
+            return None
+        if len(parts) == 1:
+            entry = self.index.lookup(parts[0])
+        else:
+            code = self.country_code(parts[-1])
+            if not code:
+                return None
+            entry = self.index.lookup(parts[0], code)
+        if not entry:
+            return None
+        if len(parts) > 2 and normalize_name(entry.admin_region or "") != normalize_name(parts[1]):
+            logger.debug("[gazetteer] %s isn't in %s, leaving %s to the fallback.", parts[0], parts[1], place)
+            return None
+        return entry.latitude, entry.longitude
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Build the offline gazetteer index from a GeoNames dump.")
+    parser.add_argument("dump", help="GeoNames cities dump, e.g. cities15000.txt")
+    parser.add_argument("output", help="Index file to write.")
+    parser.add_argument("--admin1", help="GeoNames admin1CodesASCII.txt, to store admin region names.")
+    parser.add_argument("--alternate-names", action="store_true", help="Index alternate names too.")
+    args = parser.parse_args(argv)
+    admin1_names = {}
+    if args.admin1:
+        with open(args.admin1, encoding="utf-8") as f:
+            admin1_names = load_admin1_names(f)
+    with open(args.dump, encoding="utf-8") as f:
+        size = build_index(f, args.output, admin1_names, args.alternate_names)
+    print(f"Indexed {size} keys into {args.output}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
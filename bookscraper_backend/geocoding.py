@@ -0,0 +1,201 @@
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, List, Protocol
+import geopy.geocoders
+from geopy.location import Location
+from logger import logger
+
+LatLong = tuple[float, float]
+
+# Marks a key that isn't cached at all, as opposed to a cached miss (None).
+MISSING = object()
+
+DAY = 24 * 60 * 60
+
+
+class Geocoder(Protocol):
+    """Anything that can turn a birthplace string into coordinates."""
+
+    def geocode(self, place: str) -> LatLong | None:
+        ...
+
+
+class NominatimGeocoder:
+    """Geocoder backed by the Nominatim API, through geopy. A single geopy client is reused for every call."""
+
+    def __init__(self, user_agent: str = "book_explorer", **nominatim_options):
+        """
+        Args:
+            user_agent (str): User agent Nominatim will see.
+            nominatim_options: Passed to geopy's Nominatim, e.g. domain and scheme to point to another server.
+        """
+        self._geolocator = geopy.geocoders.Nominatim(user_agent=user_agent, **nominatim_options)
+
+    def geocode(self, place: str) -> LatLong | None:
+        location: Location | None = self._geolocator.geocode(place, exactly_one=True)
+        if location:
+            return location.latitude, location.longitude
+        return None
+
+
+class FallbackGeocoder:
+    """Asks each geocoder in order and returns the first location found."""
+
+    def __init__(self, geocoders: List[Geocoder]):
+        self.geocoders = geocoders
+
+    def geocode(self, place: str) -> LatLong | None:
+        for geocoder in self.geocoders:
+            lat_long = geocoder.geocode(place)
+            if lat_long:
+                return lat_long
+        return None
+
+
+def normalize_place(place: str) -> str:
+    """Normalizes a birthplace string so that trivially different spellings share a cache entry.
+
+    Args:
+        place (str): Birthplace string, like "London, England, The United Kingdom".
+
+    Returns:
+        str: Lowercase string with normalized unicode, single spaces and no spaces around commas.
+    """
+    place = unicodedata.normalize("NFKC", place).casefold()
+    return ",".join(" ".join(part.split()) for part in place.split(","))
+
+
+class GeocodeCache:
+    """Two tier cache for geocoding results: an in-memory LRU in front of an optional SQLite file.
+    Misses (None) are cached too, with a shorter TTL, so garbage birthplaces aren't looked up again and again.
+    """
+
+    def __init__(
+        self,
+        path: str | None = None,
+        max_entries: int = 10_000,
+        ttl: float = 90 * DAY,
+        negative_ttl: float = 7 * DAY,
+    ):
+        """
+        Args:
+            path (str | None): SQLite file for the persistent tier. If None, only the in-memory tier is used.
+            max_entries (int): Maximum number of entries kept in memory.
+            ttl (float): Seconds a found location is kept.
+            negative_ttl (float): Seconds a miss is kept.
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._memory: OrderedDict[str, tuple[LatLong | None, float]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"memory_hits": 0, "disk_hits": 0, "negative_hits": 0, "misses": 0, "expired": 0, "writes": 0}
+        self._connection = None
+        if path:
+            if os.path.dirname(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+            self._connection = sqlite3.connect(path, check_same_thread=False)
+            self._connection.execute(
+                """CREATE TABLE IF NOT EXISTS geocode_cache (
+                    key TEXT PRIMARY KEY,
+                    latitude REAL,
+                    longitude REAL,
+                    expires_at REAL NOT NULL
+                )"""
+            )
+            self._connection.commit()
+
+    def _remember(self, key: str, value: LatLong | None, expires_at: float) -> None:
+        self._memory[key] = (value, expires_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _hit(self, tier: str, value: LatLong | None) -> LatLong | None:
+        self._stats[tier] += 1
+        if value is None:
+            self._stats["negative_hits"] += 1
+        return value
+
+    def get(self, place: str) -> LatLong | None | object:
+        """Looks up a place, first in memory and then on disk.
+
+        Args:
+            place (str): Birthplace string, normalized or not.
+
+        Returns:
+            LatLong | None | object: The cached location, None for a cached miss or MISSING if there's nothing valid.
+        """
+        key = normalize_place(place)
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry:
+                value, expires_at = entry
+                if expires_at > now:
+                    self._memory.move_to_end(key)
+                    return self._hit("memory_hits", value)
+                del self._memory[key]
+                self._stats["expired"] += 1
+            if self._connection:
+                row = self._connection.execute(
+                    "SELECT latitude, longitude, expires_at FROM geocode_cache WHERE key = ?", (key,)
+                ).fetchone()
+                if row and row[2] > now:
+                    value = (row[0], row[1]) if row[0] is not None else None
+                    self._remember(key, value, row[2])
+                    return self._hit("disk_hits", value)
+                if row:
+                    self._stats["expired"] += 1
+            self._stats["misses"] += 1
+            return MISSING
+
+    def set(self, place: str, value: LatLong | None, ttl: float | None = None) -> None:
+        """Stores a geocoding result in both tiers.
+
+        Args:
+            place (str): Birthplace string, normalized or not.
+            value (LatLong | None): Latitude and longitude, or None if the geocoder didn't find the place.
+            ttl (float | None): Seconds to keep this entry. Defaults to the cache TTL for found places
+            and to the negative TTL for misses.
+        """
+        if ttl is None:
+            ttl = self.ttl if value is not None else self.negative_ttl
+        key = normalize_place(place)
+        expires_at = time.time() + ttl
+        latitude, longitude = value if value is not None else (None, None)
+        with self._lock:
+            self._remember(key, value, expires_at)
+            if self._connection:
+                self._connection.execute(
+                    "INSERT OR REPLACE INTO geocode_cache (key, latitude, longitude, expires_at) VALUES (?, ?, ?, ?)",
+                    (key, latitude, longitude, expires_at),
+                )
+                self._connection.commit()
+            self._stats["writes"] += 1
+
+    def stats(self) -> Dict[str, float]:
+        """Hit/miss counters of the cache, plus the overall hit rate.
+
+        Returns:
+            Dict[str, float]: Counters per tier, misses, expired entries and writes.
+        """
+        with self._lock:
+            stats: Dict[str, float] = dict(self._stats)
+            stats["memory_entries"] = len(self._memory)
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_rate"] = (stats["memory_hits"] + stats["disk_hits"]) / lookups if lookups else 0.0
+        return stats
+
+    def clear(self) -> None:
+        """Drops every entry from both tiers."""
+        with self._lock:
+            self._memory.clear()
+            if self._connection:
+                self._connection.execute("DELETE FROM geocode_cache")
+                self._connection.commit()
+        logger.info("[geocoding] Cache cleared.")
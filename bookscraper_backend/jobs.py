@@ -0,0 +1,205 @@
+import contextvars
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict
+from bookscraper_backend.profiling import run_for_request
+from bookscraper_backend.result_cache import normalize_profile_url
+from logger import logger
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", 4))
+# Maximum number of jobs waiting for a worker. Submissions beyond this are rejected.
+JOB_QUEUE_DEPTH = int(os.getenv("JOB_QUEUE_DEPTH", 100))
+# Seconds finished jobs (and their results) are kept around.
+JOB_RETENTION = float(os.getenv("JOB_RETENTION", 60 * 60))
+
+ProgressCallback = Callable[[int, int], None]
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+
+
+class JobQueueFull(Exception):
+    pass
+
+
+class JobManagerStopped(Exception):
+    pass
+
+
+class Job:
+    """A profile processing job, with its progress and, once finished, its result or error."""
+
+    def __init__(self, profile_url: str, key: str):
+        self.id = uuid.uuid4().hex
+        self.profile_url = profile_url
+        self.key = key
+        self.status = QUEUED
+        self.resolved = 0
+        self.total: int | None = None
+        self.result: Any = None
+        self.error: str | None = None
+        self.created_at = time.time()
+        self.started_at: float | None = None
+        self.finished_at: float | None = None
+        self._finished = threading.Event()
+
+    def update_progress(self, resolved: int, total: int) -> None:
+        self.resolved = resolved
+        self.total = total
+
+    def wait(self, timeout: float | None = None) -> Any:
+        """Blocks until the job finishes and returns its result.
+
+        Raises:
+            TimeoutError: If the job didn't finish in time.
+            RuntimeError: If the job failed.
+        """
+        if not self._finished.wait(timeout):
+            raise TimeoutError(f"Job {self.id} didn't finish in {timeout} seconds.")
+        if self.status == FAILED:
+            raise RuntimeError(self.error)
+        return self.result
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.id,
+            "profile_url": self.profile_url,
+            "status": self.status,
+            "progress": {"authors_resolved": self.resolved, "authors_total": self.total},
+            "result": {"data": self.result} if self.status == DONE else None,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class JobManager:
+    """Runs profile jobs on a bounded pool of workers, from start() to shutdown().
+    A profile that is already queued or running isn't queued again: the existing job is returned instead.
+    """
+
+    def __init__(
+        self,
+        work: Callable[[str, ProgressCallback], Any],
+        workers: int = JOB_WORKERS,
+        queue_depth: int = JOB_QUEUE_DEPTH,
+        retention: float = JOB_RETENTION,
+    ):
+        """
+        Args:
+            work (Callable[[str, ProgressCallback], Any]): Processes a profile URL, reporting (resolved, total) progress.
+            workers (int): Jobs running at the same time.
+            queue_depth (int): Jobs waiting for a worker before new submissions are rejected.
+            retention (float): Seconds finished jobs are kept.
+        """
+        self.work = work
+        self.workers = workers
+        self.queue_depth = queue_depth
+        self.retention = retention
+        self._executor: ThreadPoolExecutor | None = None
+        self._jobs: Dict[str, Job] = {}
+        self._active: Dict[str, Job] = {}  # Queued or running job per profile key.
+        self._lock = threading.Lock()
+
+    def _purge(self) -> None:
+        cutoff = time.time() - self.retention
+        expired = [job_id for job_id, job in self._jobs.items() if job.finished_at and job.finished_at < cutoff]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+    def _finish(self, job: Job) -> None:
+        job.finished_at = time.time()
+        with self._lock:
+            if self._active.get(job.key) is job:
+                del self._active[job.key]
+        job._finished.set()
+
+    def _run(self, job: Job) -> None:
+        with self._lock:
+            if job.status != QUEUED:  # Failed by shutdown while it waited.
+                return
+            job.status = RUNNING
+            job.started_at = time.time()
+        try:
+            job.result = self.work(job.profile_url, job.update_progress)
+            job.status = DONE
+        except Exception as e:
+            logger.exception("[jobs] Job %s for %s failed.", job.id, job.profile_url)
+            job.error = str(e)
+            job.status = FAILED
+        finally:
+            self._finish(job)
+
+    def start(self) -> None:
+        """Starts the workers. Jobs can only be submitted between start and shutdown."""
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="job")
+
+    def submit(self, profile_url: str) -> tuple[Job, bool]:
+        """Queues a job for the profile, unless one is already queued or running.
+
+        Args:
+            profile_url (str): URL of the GR profile.
+
+        Raises:
+            JobQueueFull: If there are already queue_depth jobs waiting.
+            JobManagerStopped: If the manager isn't started or is shut down.
+
+        Returns:
+            tuple[Job, bool]: The job and whether it was created by this call.
+        """
+        key = normalize_profile_url(profile_url)
+        with self._lock:
+            self._purge()
+            if self._executor is None:
+                raise JobManagerStopped("The job manager isn't running.")
+            existing = self._active.get(key)
+            if existing:
+                return existing, False
+            if self.queued() >= self.queue_depth:
+                raise JobQueueFull(f"There are already {self.queue_depth} jobs waiting.")
+            job = Job(profile_url, key)
+            self._jobs[job.id] = job
+            self._active[key] = job
+            executor = self._executor
+        try:
+            # The job runs in the context of the request that created it, so its logs carry that request's id.
+            executor.submit(contextvars.copy_context().run, run_for_request, self._run, job)
+        except RuntimeError:
+            # Shut down since we checked: forget the job, so no one waits for it.
+            with self._lock:
+                self._jobs.pop(job.id, None)
+                if self._active.get(key) is job:
+                    del self._active[key]
+            raise JobManagerStopped("The job manager is shut down.") from None
+        logger.info("[jobs] Queued job %s for %s.", job.id, profile_url)
+        return job, True
+
+    def get(self, job_id: str) -> Job | None:
+        with self._lock:
+            self._purge()
+            return self._jobs.get(job_id)
+
+    def queued(self) -> int:
+        return sum(1 for job in self._active.values() if job.status == QUEUED)
+
+    def shutdown(self) -> None:
+        """Stops the workers. Running jobs finish, jobs still waiting for a worker are failed."""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is None:
+            return
+        executor.shutdown(wait=False, cancel_futures=True)
+        with self._lock:
+            cancelled = [job for job in self._active.values() if job.status == QUEUED]
+            for job in cancelled:
+                job.error = "The job manager shut down before the job started."
+                job.status = FAILED
+        for job in cancelled:
+            self._finish(job)
+        if cancelled:
+            logger.warning("[jobs] Failed %s queued jobs on shutdown.", len(cancelled))
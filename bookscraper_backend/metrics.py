@@ -0,0 +1,299 @@
+"""Process metrics in the Prometheus text format, served by GET /metrics.
+
+Counters, gauges and histograms are updated where things happen and cost a dictionary lookup and a lock
+each, so instrumenting the per-author steps doesn't show up next to the network calls they measure.
+Stats that other modules already keep (graph query counts, geocoding cache, connection pool) are read by
+collectors when /metrics is scraped, instead of being counted twice.
+"""
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Iterator, List, Sequence
+
+# Upper bounds, in seconds, of the buckets of stage durations: from a read model hit to a 20k book shelf.
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+Sample = tuple[str, Dict[str, str], float]  # Name, labels and value of one line of the exposition.
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(str(value))}"' for name, value in labels.items()) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Metric:
+    """A named metric with a fixed set of label names. Values are kept per tuple of label values."""
+
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _labels(self, values: tuple) -> Dict[str, str]:
+        return dict(zip(self.labelnames, values))
+
+    def samples(self) -> List[Sample]:
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, help, labelnames)
+        self._values: Dict[tuple, float] = {}
+
+    def inc(self, *labelvalues: str, amount: float = 1) -> None:
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def value(self, *labelvalues: str) -> float:
+        with self._lock:
+            return self._values.get(labelvalues, 0)
+
+    def samples(self) -> List[Sample]:
+        with self._lock:
+            return [(self.name, self._labels(key), value) for key, value in self._values.items()]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, *labelvalues: str, amount: float = 1) -> None:
+        self.inc(*labelvalues, amount=-amount)
+
+    def set(self, value: float, *labelvalues: str) -> None:
+        with self._lock:
+            self._values[labelvalues] = value
+
+    @contextmanager
+    def track(self, *labelvalues: str) -> Iterator[None]:
+        """Counts the block as in progress while it runs."""
+        self.inc(*labelvalues)
+        try:
+            yield
+        finally:
+            self.dec(*labelvalues)
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._counts: Dict[tuple, List[int]] = {}  # Per bucket, not cumulative, the last one is +Inf.
+        self._sums: Dict[tuple, float] = {}
+
+    def observe(self, value: float, *labelvalues: str) -> None:
+        position = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._counts.get(labelvalues)
+            if counts is None:
+                counts = self._counts[labelvalues] = [0] * (len(self.buckets) + 1)
+                self._sums[labelvalues] = 0.0
+            counts[position] += 1
+            self._sums[labelvalues] += value
+
+    def time(self, *labelvalues: str) -> "_Timer":
+        """Context manager observing how long its block took, whether it succeeded or not."""
+        return _Timer(self, labelvalues)
+
+    def count(self, *labelvalues: str) -> int:
+        with self._lock:
+            return sum(self._counts.get(labelvalues, []))
+
+    def samples(self) -> List[Sample]:
+        samples: List[Sample] = []
+        with self._lock:
+            for key, counts in self._counts.items():
+                labels = self._labels(key)
+                cumulative = 0
+                for bound, count in zip((*self.buckets, float("inf")), counts):
+                    cumulative += count
+                    samples.append((f"{self.name}_bucket", {**labels, "le": _format_value(bound)}, cumulative))
+                samples.append((f"{self.name}_sum", labels, self._sums[key]))
+                samples.append((f"{self.name}_count", labels, cumulative))
+        return samples
+
+
+class _Timer:
+    # A plain class rather than a @contextmanager generator, which costs several times more per block.
+    __slots__ = ("histogram", "labelvalues", "start")
+
+    def __init__(self, histogram: Histogram, labelvalues: tuple):
+        self.histogram = histogram
+        self.labelvalues = labelvalues
+
+    def __enter__(self) -> None:
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc) -> None:
+        self.histogram.observe(time.perf_counter() - self.start, *self.labelvalues)
+
+
+class MetricFamily:
+    """Metric built by a collector when metrics are scraped."""
+
+    def __init__(self, name: str, kind: str, help: str, samples: Iterable[tuple[Dict[str, str], float]]):
+        self.name = name
+        self.kind = kind
+        self.help = help
+        self._samples = [(name, labels, value) for labels, value in samples]
+
+    def samples(self) -> List[Sample]:
+        return self._samples
+
+
+class Registry:
+    """Metrics and collectors exposed together."""
+
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+        self._collectors: List[Callable[[], Iterable[MetricFamily]]] = []
+
+    def register(self, metric: Metric) -> Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered.")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, help, labelnames))  # type: ignore
+
+    def gauge(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self.register(Gauge(name, help, labelnames))  # type: ignore
+
+    def histogram(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help, labelnames, buckets))  # type: ignore
+
+    def add_collector(self, collector: Callable[[], Iterable[MetricFamily]]) -> None:
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        """Every metric in the Prometheus text exposition format (version 0.0.4)."""
+        families: List[Metric | MetricFamily] = list(self._metrics.values())
+        for collector in self._collectors:
+            families.extend(collector())
+        lines = []
+        for family in families:
+            samples = family.samples()
+            if not samples:
+                continue
+            lines.append(f"# HELP {family.name} {family.help}")
+            lines.append(f"# TYPE {family.name} {family.kind}")
+            lines.extend(f"{name}{_format_labels(labels)} {_format_value(value)}" for name, labels, value in samples)
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    "bookscraper_stage_seconds",
+    "Duration of each step of processing a profile: shelf_scrape, extract_authors, author_lookup, author_scrape, geocode, insert.",
+    ["stage"],
+)
+AUTHORS = REGISTRY.counter(
+    "bookscraper_authors_total", "Authors of processed shelves, by where their country came from.", ["source"]
+)
+GEOCODE_MISSES = REGISTRY.counter("bookscraper_geocode_misses_total", "Places the geocoder couldn't find.")
+PROFILES_IN_PROGRESS = REGISTRY.gauge("bookscraper_profiles_in_progress", "Profiles being processed.")
+HTTP_REQUESTS_IN_FLIGHT = REGISTRY.gauge("bookscraper_http_requests_in_flight", "HTTP requests being served.")
+HTTP_REQUESTS = REGISTRY.counter(
+    "bookscraper_http_requests_total", "HTTP requests served, by endpoint and status.", ["endpoint", "status"]
+)
+HTTP_REQUEST_SECONDS = REGISTRY.histogram(
+    "bookscraper_http_request_seconds", "Time to serve HTTP requests, by endpoint.", ["endpoint"]
+)
+
+
+def _graph_query_families() -> Iterable[MetricFamily]:
+    from graph_queries import query_stats
+
+    stats = query_stats()
+    yield MetricFamily(
+        "bookscraper_neo4j_queries_total", "counter", "Neo4j queries, by query template.",
+        (({"query": name}, values["calls"]) for name, values in stats.items()),
+    )
+    yield MetricFamily(
+        "bookscraper_neo4j_query_errors_total", "counter", "Failed Neo4j queries, by query template.",
+        (({"query": name}, values["errors"]) for name, values in stats.items()),
+    )
+    yield MetricFamily(
+        "bookscraper_neo4j_query_seconds_total", "counter", "Time spent in Neo4j queries, by query template.",
+        (({"query": name}, values["total_seconds"]) for name, values in stats.items()),
+    )
+
+
+def _geocode_cache_families() -> Iterable[MetricFamily]:
+    from bookscraper_backend.backend import get_geocode_cache
+
+    if get_geocode_cache.cache_info().currsize == 0:
+        return
+    stats = get_geocode_cache().stats()
+    events = ["memory_hits", "disk_hits", "negative_hits", "misses", "expired", "writes"]
+    yield MetricFamily(
+        "bookscraper_geocode_cache_events_total", "counter", "Geocoding cache lookups and writes, by outcome.",
+        (({"event": event}, stats[event]) for event in events),
+    )
+    yield MetricFamily("bookscraper_geocode_cache_entries", "gauge", "Places in the memory tier of the geocoding cache.", [({}, stats["memory_entries"])])
+    yield MetricFamily("bookscraper_geocode_cache_hit_ratio", "gauge", "Share of geocoding cache lookups that hit.", [({}, stats["hit_rate"])])
+
+
+def _pool_families() -> Iterable[MetricFamily]:
+    from bookscraper_backend.database.setup import pool_metrics
+
+    for name, value in pool_metrics().items():
+        kind = "counter" if name in ("checkouts", "timeouts") else "gauge"
+        metric = f"bookscraper_db_pool_{name}_total" if kind == "counter" else f"bookscraper_db_pool_{name}"
+        yield MetricFamily(metric, kind, f"Postgres connection pool: {name.replace('_', ' ')}.", [({}, value)])
+
+
+REGISTRY.add_collector(_graph_query_families)
+REGISTRY.add_collector(_geocode_cache_families)
+REGISTRY.add_collector(_pool_families)
+
+
+class MetricsMiddleware:
+    """ASGI middleware counting HTTP requests in flight, and timing them by endpoint once they're done."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        status = "500"
+
+        async def send_with_status(message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = str(message["status"])
+            await send(message)
+
+        start = time.perf_counter()
+        HTTP_REQUESTS_IN_FLIGHT.inc()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            HTTP_REQUESTS_IN_FLIGHT.dec()
+            # The router puts the matched endpoint in the scope, its name keeps the label set small.
+            endpoint = getattr(scope.get("endpoint"), "__name__", "unmatched")
+            HTTP_REQUESTS.inc(endpoint, status)
+            HTTP_REQUEST_SECONDS.observe(time.perf_counter() - start, endpoint)
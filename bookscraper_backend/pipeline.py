@@ -0,0 +1,201 @@
+import collections
+import contextvars
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Deque, Dict, Iterable, Iterator, List
+from bookscraper_backend.profiling import run_for_request
+from logger import logger
+
+# How often the consumer wakes up to check for errors and the end of the stream, if nothing woke it before.
+_POLL_INTERVAL = 0.1
+# Put on the output queue when the pipeline drains or fails, so the consumer checks right away.
+_WAKE = object()
+# Items (or batches) a drainer takes before letting the other runs sharing the pool have a turn.
+_TAKES_PER_TURN = 8
+
+# Long-lived worker pools, one per stage, shared by every pipeline of the process. Threads are reused across
+# requests, so whatever they keep per thread (like neomodel's connection) is only set up once.
+_pools: Dict[tuple[str, int], ThreadPoolExecutor] = {}
+_pools_lock = threading.Lock()
+
+
+class Stage:
+    """A step of the pipeline, run by a bounded pool of worker threads.
+    The pool belongs to the stage name and is shared by every pipeline running that stage, so workers is the
+    concurrency of the step across the whole process, not per pipeline.
+
+    If batch_size is set, fn receives a list of up to batch_size items and should return a list of outputs.
+    Otherwise fn receives a single item and returns a single output.
+    """
+
+    def __init__(self, name: str, fn: Callable[[Any], Any], workers: int = 1, batch_size: int | None = None):
+        if workers < 1:
+            raise ValueError(f"Stage {name} needs at least one worker.")
+        self.name = name
+        self.fn = fn
+        self.workers = workers
+        self.batch_size = batch_size
+
+
+def stage_pool(stage: Stage) -> ThreadPoolExecutor:
+    """The worker pool of a stage, started on first use."""
+    key = (stage.name, stage.workers)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = _pools[key] = ThreadPoolExecutor(max_workers=stage.workers, thread_name_prefix=f"pipeline-{stage.name}")
+        return pool
+
+
+def shutdown_pools() -> None:
+    """Stops the worker pools once their queued work is done. They are started again if a pipeline runs later."""
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.shutdown(wait=True)
+
+
+class _Run:
+    """State of one run_pipeline call: the items waiting at each stage, what is in flight and the outputs to yield.
+
+    Each stage of a run has at most workers drainers queued or running on the stage's pool. A drainer takes the
+    waiting items one (or one batch) at a time, and goes back to the end of the pool's queue every few takes, so
+    concurrent runs sharing the pool take turns.
+    """
+
+    def __init__(self, stages: List[Stage]):
+        self.stages = stages
+        self.pools = [stage_pool(stage) for stage in stages]
+        self.waiting: List[Deque[Any]] = [collections.deque() for _ in stages]
+        self.drainers = [0] * len(stages)
+        self.outputs: queue.Queue = queue.Queue()
+        self.errors: List[BaseException] = []
+        self.stopped = False
+        self.in_flight = 0  # Items handed to a stage and not out of the last one yet.
+        self.running: set[int] = set()  # Threads executing a drainer of this run right now.
+        self.changed = threading.Condition()
+
+    def submit(self, index: int, items: List[Any]) -> None:
+        """Hands items to a stage, starting a drainer if the stage has fewer than its workers."""
+        with self.changed:
+            self.in_flight += len(items)
+            self.waiting[index].extend(items)
+            start = self.drainers[index] < self.stages[index].workers
+            if start:
+                self.drainers[index] += 1
+        if start:
+            self._schedule(index)
+
+    def _schedule(self, index: int) -> None:
+        # Drainers run in a copy of the submitting context, so their logs keep the request id, and a profile of the
+        # request samples them.
+        self.pools[index].submit(contextvars.copy_context().run, run_for_request, self._drain, index)
+
+    def _take(self, index: int) -> list:
+        """The next item (or batch) waiting at a stage. Empty when there is none, and the drainer is then done."""
+        with self.changed:
+            waiting = self.waiting[index]
+            size = self.stages[index].batch_size or 1
+            taken = [waiting.popleft() for _ in range(min(size, len(waiting)))]
+            if not taken or self.stopped:
+                self.drainers[index] -= 1
+                return []
+            return taken
+
+    def _drain(self, index: int) -> None:
+        stage = self.stages[index]
+        with self.changed:
+            if self.stopped:
+                self.drainers[index] -= 1
+                return
+            self.running.add(threading.get_ident())
+        try:
+            for _ in range(_TAKES_PER_TURN):
+                taken = self._take(index)
+                if not taken:
+                    return
+                outputs = stage.fn(taken) if stage.batch_size else [stage.fn(taken[0])]
+                if index + 1 < len(self.stages):
+                    self.submit(index + 1, outputs)
+                else:
+                    for output in outputs:
+                        self.outputs.put(output)
+                self._add(-len(taken))
+            self._schedule(index)  # Still a drainer of the stage, at the back of the queue.
+        except BaseException as e:
+            logger.exception("[pipeline] Stage %s failed.", stage.name)
+            self.errors.append(e)
+            self.stop_soon()
+        finally:
+            with self.changed:
+                self.running.discard(threading.get_ident())
+                self.changed.notify_all()
+
+    def _add(self, count: int) -> None:
+        with self.changed:
+            self.in_flight += count
+            drained = self.in_flight == 0
+        if drained:
+            self.outputs.put(_WAKE)
+
+    def stop_soon(self) -> None:
+        with self.changed:
+            self.stopped = True
+        self.outputs.put(_WAKE)
+
+    def stop(self) -> None:
+        """Skips the waiting items of this run, and waits for the ones a worker is already on.
+        A worker of the run can stop it too (e.g. the garbage collector closes the consumer on that thread),
+        and then doesn't wait for itself.
+        """
+        current = threading.get_ident()
+        with self.changed:
+            self.stopped = True
+            while self.running - {current}:
+                self.changed.wait()
+
+
+def run_pipeline(items: Iterable[Any], stages: List[Stage], queue_size: int = 100) -> Iterator[Any]:
+    """Streams the items through the stages. Every stage works concurrently on different items, on its own pool
+    of workers, while at most queue_size items are in flight or waiting to be yielded, so memory stays bounded.
+    Outputs are yielded as soon as they leave the last stage, in completion order.
+    If any stage raises, the whole pipeline is stopped and the first exception is raised to the caller.
+
+    Args:
+        items (Iterable[Any]): Inputs of the first stage.
+        stages (List[Stage]): Stages, in order.
+        queue_size (int): Maximum number of items in the pipeline at once.
+
+    Yields:
+        Any: Outputs of the last stage.
+    """
+    run = _Run(stages)
+    items = iter(items)
+    exhausted = False
+    try:
+        while True:
+            # Tops the pipeline up to queue_size items, counting the outputs the caller hasn't taken yet.
+            while not exhausted and not run.stopped and run.in_flight + run.outputs.qsize() < queue_size:
+                try:
+                    item = next(items)
+                except StopIteration:
+                    exhausted = True
+                    break
+                run.submit(0, [item])
+            if run.errors:
+                break
+            if exhausted and run.in_flight == 0 and run.outputs.empty():
+                break
+            try:
+                output = run.outputs.get(timeout=_POLL_INTERVAL)
+            except queue.Empty:
+                continue
+            if output is not _WAKE:
+                yield output
+    finally:
+        # Either we are done, or the consumer stopped early: in both cases no work of this run goes on after it.
+        run.stop()
+    if run.errors:
+        raise run.errors[0]
@@ -0,0 +1,311 @@
+"""Opt-in profiling of the running app, off unless PROFILE_ADMIN_TOKEN is set.
+
+Profiles are captured by a sampling profiler: a background thread reads the stack of threads at a fixed
+interval, so the profiled code runs at full speed and the cost is one short pause per interval. Threads waiting
+for work are left out.
+
+There are two ways to capture a profile:
+    - a single request, sent with an X-Profile-Token header (or profile_token query parameter) holding the
+      admin token. The response names the profile in its X-Profile header. Only the threads working for that
+      request are sampled: the ones running code under request_thread with its request id (its endpoint, job and
+      pipeline threads), and the event loop thread, which async code of other requests shares.
+    - a time window, started with POST /admin/profiles/sample, sampling every thread of the process.
+Only one capture runs at a time. Each one is written to PROFILE_DIR as a .prof file, readable by pstats and
+snakeviz (sample counts stand in for call counts), and as collapsed stacks for flamegraph.pl or speedscope.
+"""
+import hmac
+import marshal
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List
+from urllib.parse import parse_qs
+import anyio.to_thread
+from logger import logger, request_id
+
+PROFILE_DIR = os.getenv("PROFILE_DIR", "./profile")
+PROFILE_ADMIN_TOKEN = os.getenv("PROFILE_ADMIN_TOKEN")
+# Seconds between two samples.
+PROFILE_SAMPLE_INTERVAL = float(os.getenv("PROFILE_SAMPLE_INTERVAL", 0.005))
+PROFILE_MAX_WINDOW = float(os.getenv("PROFILE_MAX_WINDOW", 300))
+TOKEN_HEADER = "x-profile-token"
+TOKEN_QUERY_PARAMETER = "profile_token"
+PROFILE_NAME = re.compile(r"^[\w.-]+\.(prof|collapsed)$")
+
+# Innermost frames of threads that are waiting for work rather than doing any.
+IDLE_FRAMES = {
+    ("threading.py", "wait"),
+    ("selectors.py", "select"),
+    ("thread.py", "_worker"),
+    ("socket.py", "accept"),
+}
+
+Frame = tuple[str, int, str]  # File, first line and name of a function, like the keys of pstats.
+
+# Id of the request each thread is working for right now, by thread ident. See request_thread.
+_request_threads: Dict[int, str] = {}
+
+
+def profiling_enabled() -> bool:
+    return bool(PROFILE_ADMIN_TOKEN)
+
+
+def check_token(token: str | None) -> bool:
+    """Whether a token is the admin token. Always False when profiling is disabled."""
+    if not PROFILE_ADMIN_TOKEN or not token:
+        return False
+    return hmac.compare_digest(token.encode(), PROFILE_ADMIN_TOKEN.encode())
+
+
+@contextmanager
+def request_thread() -> Iterator[None]:
+    """Marks the current thread as working for the request in logger.request_id while the block runs, so a profile
+    of that request samples it. Request work handed to another thread runs under it, in a copy of the request context.
+    """
+    current = request_id.get()
+    ident = threading.get_ident()
+    previous = _request_threads.get(ident)
+    if current:
+        _request_threads[ident] = current
+    try:
+        yield
+    finally:
+        if previous is None:
+            _request_threads.pop(ident, None)
+        else:
+            _request_threads[ident] = previous
+
+
+def run_for_request(fn: Callable[..., Any], *args: Any) -> Any:
+    """Calls fn(*args) under request_thread."""
+    with request_thread():
+        return fn(*args)
+
+
+class StackSampler:
+    """Counts the stacks of every thread, sampled every interval seconds from a background thread."""
+
+    def __init__(
+        self,
+        interval: float = PROFILE_SAMPLE_INTERVAL,
+        include_idle: bool = False,
+        request: str | None = None,
+        threads: frozenset[int] = frozenset(),
+    ):
+        """
+        Args:
+            interval (float): Seconds between two samples.
+            include_idle (bool): Also count threads waiting for work.
+            request (str | None): Only sample the threads working for this request id, and threads.
+            threads (frozenset[int]): Idents of threads sampled along with the request's.
+        """
+        self.interval = interval
+        self.include_idle = include_idle
+        self.request = request
+        self.threads = threads
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+
+    def _run(self) -> None:
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            self.samples += 1
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id != own_id and self._sampled(thread_id):
+                    self._record(frame)
+
+    def _sampled(self, thread_id: int) -> bool:
+        if self.request is None or thread_id in self.threads:
+            return True
+        return _request_threads.get(thread_id) == self.request
+
+    def _record(self, frame: Any) -> None:
+        stack: List[Frame] = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append((code.co_filename, code.co_firstlineno, code.co_name))
+            frame = frame.f_back
+        if not stack:
+            return
+        if not self.include_idle and (os.path.basename(stack[0][0]), stack[0][2]) in IDLE_FRAMES:
+            return
+        stack.reverse()
+        self.stacks[tuple(stack)] += 1
+
+    def collapsed(self) -> str:
+        """One line per distinct stack, outermost frame first: "frame;frame;frame count"."""
+        lines = []
+        for stack, count in self.stacks.most_common():
+            frames = ";".join(f"{name} ({os.path.basename(filename)}:{line})" for filename, line, name in stack)
+            lines.append(f"{frames} {count}")
+        return "\n".join(lines) + "\n"
+
+    def pstats_dict(self) -> Dict[Frame, tuple]:
+        """The samples as the dictionary pstats loads from a .prof file. Times are samples times the interval."""
+        own: Counter = Counter()
+        cumulative: Counter = Counter()
+        edges: Dict[Frame, Counter] = {}
+        edge_own: Dict[Frame, Counter] = {}
+        for stack, count in self.stacks.items():
+            own[stack[-1]] += count
+            for frame in set(stack):  # Once per stack, recursion included.
+                cumulative[frame] += count
+            for caller, callee in set(zip(stack, stack[1:])):
+                edges.setdefault(callee, Counter())[caller] += count
+            if len(stack) > 1:
+                edge_own.setdefault(stack[-1], Counter())[stack[-2]] += count
+        stats = {}
+        for frame, count in cumulative.items():
+            callers = {
+                caller: (calls, calls, edge_own.get(frame, Counter())[caller] * self.interval, calls * self.interval)
+                for caller, calls in edges.get(frame, {}).items()
+            }
+            stats[frame] = (count, count, own[frame] * self.interval, count * self.interval, callers)
+        return stats
+
+    def save(self, name: str, directory: str | None = None) -> List[str]:
+        """Writes name.prof and name.collapsed, to PROFILE_DIR unless another directory is given.
+
+        Returns:
+            List[str]: Paths of the written files.
+        """
+        directory = directory or PROFILE_DIR
+        os.makedirs(directory, exist_ok=True)
+        prof_path = os.path.join(directory, f"{name}.prof")
+        with open(prof_path, "wb") as f:
+            marshal.dump(self.pstats_dict(), f)
+        collapsed_path = os.path.join(directory, f"{name}.collapsed")
+        with open(collapsed_path, "w") as f:
+            f.write(self.collapsed())
+        logger.info("[profiling] Wrote %s samples of %s stacks to %s.", self.samples, len(self.stacks), prof_path)
+        return [prof_path, collapsed_path]
+
+
+_capture_lock = threading.Lock()
+
+
+def _profile_name(kind: str, label: str) -> str:
+    label = re.sub(r"[^\w-]+", "_", label).strip("_")[:60]
+    return f"{time.strftime('%Y%m%dT%H%M%S')}-{int(time.time() * 1000) % 1000:03d}-{kind}-{label}".rstrip("-")
+
+
+def start_capture(
+    kind: str, label: str, interval: float = PROFILE_SAMPLE_INTERVAL, request: str | None = None
+) -> tuple[str, StackSampler] | None:
+    """Starts a capture, unless one is already running.
+
+    Args:
+        kind (str): What is captured, part of the profile name.
+        label (str): Describes the capture, part of the profile name.
+        interval (float): Seconds between two samples.
+        request (str | None): Id of the request to capture, sampled along with the calling thread. Every thread
+            is sampled without one.
+
+    Returns:
+        tuple[str, StackSampler] | None: Name of the profile and its sampler, None if another capture is running.
+    """
+    if not _capture_lock.acquire(blocking=False):
+        return None
+    sampler = StackSampler(interval, request=request, threads=frozenset({threading.get_ident()}) if request else frozenset())
+    sampler.start()
+    return _profile_name(kind, label), sampler
+
+
+def finish_capture(name: str, sampler: StackSampler) -> List[str]:
+    """Stops a capture started by start_capture and writes its files."""
+    try:
+        sampler.stop()
+        return sampler.save(name)
+    finally:
+        _capture_lock.release()
+
+
+def sample_window(seconds: float, interval: float = PROFILE_SAMPLE_INTERVAL) -> str | None:
+    """Samples every thread for a number of seconds, in the background.
+
+    Returns:
+        str | None: Name the profile will be written under, None if another capture is running.
+    """
+    capture = start_capture("window", f"{seconds:g}s", interval)
+    if capture is None:
+        return None
+    name, sampler = capture
+    timer = threading.Timer(seconds, finish_capture, args=(name, sampler))
+    timer.daemon = True
+    timer.start()
+    return name
+
+
+def list_profiles(directory: str | None = None) -> List[Dict[str, Any]]:
+    """Profile files in the directory (PROFILE_DIR by default), newest first."""
+    directory = directory or PROFILE_DIR
+    if not os.path.isdir(directory):
+        return []
+    profiles = []
+    for entry in os.scandir(directory):
+        if entry.is_file() and PROFILE_NAME.match(entry.name):
+            stat = entry.stat()
+            profiles.append({"name": entry.name, "size": stat.st_size, "modified": stat.st_mtime})
+    return sorted(profiles, key=lambda profile: profile["modified"], reverse=True)
+
+
+def profile_path(name: str, directory: str | None = None) -> str | None:
+    """Path of a profile file, None if the name isn't one (or tries to leave the directory)."""
+    if not PROFILE_NAME.match(name):
+        return None
+    path = os.path.join(directory or PROFILE_DIR, name)
+    return path if os.path.isfile(path) else None
+
+
+class ProfilingMiddleware:
+    """ASGI middleware profiling the requests that carry the admin token, from the request until the last byte of
+    the response is sent. Other requests go straight through.
+    With a request id set (see RequestIdMiddleware), only that request's threads and the event loop are sampled.
+    """
+
+    def __init__(self, app: Any):
+        self.app = app
+
+    def _requested(self, scope: Dict[str, Any]) -> bool:
+        for header, value in scope.get("headers", []):
+            if header == TOKEN_HEADER.encode():
+                return check_token(value.decode("latin-1"))
+        query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+        return check_token(query.get(TOKEN_QUERY_PARAMETER, [None])[0])
+
+    async def __call__(self, scope: Dict[str, Any], receive: Any, send: Any) -> None:
+        if scope["type"] != "http" or not profiling_enabled() or not self._requested(scope):
+            await self.app(scope, receive, send)
+            return
+        capture = start_capture("request", f"{scope['method']}-{scope['path']}", request=request_id.get())
+        status = capture[0] if capture else "busy"
+
+        async def send_with_header(message: Dict[str, Any]) -> None:
+            if message["type"] == "http.response.start":
+                message["headers"] = [*message.get("headers", []), (b"x-profile", status.encode())]
+            await send(message)
+
+        if capture is None:
+            logger.info("[profiling] Another capture is running, not profiling %s.", scope["path"])
+            await self.app(scope, receive, send_with_header)
+            return
+        try:
+            await self.app(scope, receive, send_with_header)
+        finally:
+            # Joining the sampler and writing the files blocks, so it's kept off the event loop.
+            await anyio.to_thread.run_sync(finish_capture, *capture)
@@ -0,0 +1,260 @@
+"""In-process read model of author -> country, so authors we already resolved don't cost a database query.
+
+The model is a file:
+    header | country names | sorted 64 bit author keys | country number per key (uint16) | Bloom filter bits
+which is memory-mapped read-only, so every worker process reading the same file shares one copy of it.
+A lookup is a Bloom filter probe, which rejects most unknown authors, then a binary search over the mapped keys.
+
+The file is synced from the graph with the updated_at watermark of the authors: the first sync reads every
+author, the next ones only the authors written since the last one. Syncs replace the file atomically and
+readers pick up the new file on their next lookup.
+"""
+import bisect
+import fcntl
+import hashlib
+import mmap
+import os
+import struct
+import threading
+import time
+from array import array
+from typing import Dict, Hashable, Iterable, Iterator, List, Protocol
+from graph_db import fetch_author_changes, graph_timestamp, iter_author_countries
+from logger import logger
+
+MAGIC = b"BXRM"
+VERSION = 1
+HEADER = struct.Struct("<4sIQqIQI")  # magic, version, entries, watermark, country names size, Bloom bits, Bloom hashes
+NO_COUNTRY = 0xFFFF  # Country number of authors without a known birth country.
+
+READ_MODEL_SYNC_INTERVAL = float(os.getenv("READ_MODEL_SYNC_INTERVAL", 30))
+# Changes are read from this many milliseconds before the watermark, for transactions that committed late.
+READ_MODEL_SYNC_LAG = int(os.getenv("READ_MODEL_SYNC_LAG", 60_000))
+BLOOM_BITS_PER_KEY = 10
+BLOOM_HASHES = 7
+
+
+def author_key(goodreads_id: Hashable) -> int:
+    """64 bit key of a GR author id: the id itself, as they are numeric, or a hash of it otherwise."""
+    text = str(goodreads_id)
+    if text.isdigit() and int(text) < 2**63:
+        return int(text)
+    return int.from_bytes(hashlib.blake2b(text.encode(), digest_size=8).digest(), "little") | 2**63
+
+
+def _bloom_positions(key: int, bits: int, hashes: int) -> Iterator[int]:
+    digest = hashlib.blake2b(key.to_bytes(8, "little"), digest_size=16).digest()
+    h1, h2 = int.from_bytes(digest[:8], "little"), int.from_bytes(digest[8:], "little") | 1
+    for i in range(hashes):
+        yield (h1 + i * h2) % bits
+
+
+def write_read_model(path: str, countries_by_key: Dict[int, str | None], watermark: int) -> None:
+    """Writes a read model file, replacing the previous one atomically.
+
+    Args:
+        path (str): Where to write the model.
+        countries_by_key (Dict[int, str | None]): Country name (or None) per author key.
+        watermark (int): updated_at up to which the model is complete.
+    """
+    keys = sorted(countries_by_key)
+    names = sorted({country for country in countries_by_key.values() if country})
+    if len(names) >= NO_COUNTRY:
+        raise ValueError(f"The read model holds at most {NO_COUNTRY - 1} countries.")
+    numbers = {name: number for number, name in enumerate(names)}
+    names_block = "\n".join(names).encode()
+    bloom_bits = max(64, len(keys) * BLOOM_BITS_PER_KEY)
+    bloom = bytearray((bloom_bits + 7) // 8)
+    for key in keys:
+        for position in _bloom_positions(key, bloom_bits, BLOOM_HASHES):
+            bloom[position >> 3] |= 1 << (position & 7)
+    country_numbers = array("H", (numbers.get(countries_by_key[key], NO_COUNTRY) for key in keys))  # type: ignore
+    temporary = f"{path}.{os.getpid()}.tmp"
+    with open(temporary, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, len(keys), watermark, len(names_block), bloom_bits, BLOOM_HASHES))
+        f.write(names_block)
+        f.write(b"\0" * (-f.tell() % 8))  # Keys are 8 byte aligned, so they can be cast in place.
+        f.write(array("Q", keys).tobytes())
+        f.write(country_numbers.tobytes())
+        f.write(bytes(bloom))
+    os.replace(temporary, path)
+    logger.info("[read_model] Wrote %s authors, watermark %s, to %s.", len(keys), watermark, path)
+
+
+class ReadModel:
+    """Read-only, memory-mapped view of a file written by write_read_model."""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            self.stat = os.fstat(f.fileno())
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.size, self.watermark, names_size, self._bloom_bits, self._bloom_hashes = HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a read model (version {VERSION}).")
+        names_end = HEADER.size + names_size
+        names = bytes(self._mmap[HEADER.size : names_end]).decode()
+        self.countries: List[str] = names.split("\n") if names else []
+        keys_start = names_end + (-names_end % 8)
+        keys_end = keys_start + 8 * self.size
+        numbers_end = keys_end + 2 * self.size
+        view = memoryview(self._mmap)
+        self._keys = view[keys_start:keys_end].cast("Q")
+        self._numbers = view[keys_end:numbers_end].cast("H")
+        self._bloom = view[numbers_end:]
+
+    def __len__(self) -> int:
+        return self.size
+
+    def might_contain(self, key: int) -> bool:
+        return all(self._bloom[position >> 3] & (1 << (position & 7)) for position in _bloom_positions(key, self._bloom_bits, self._bloom_hashes))
+
+    def lookup(self, key: int) -> tuple[bool, str | None]:
+        """Finds an author by key.
+
+        Returns:
+            tuple[bool, str | None]: Whether the author is in the model and its country, if it has one.
+        """
+        if not self.might_contain(key):
+            return False, None
+        position = bisect.bisect_left(self._keys, key)
+        if position == self.size or self._keys[position] != key:
+            return False, None
+        number = self._numbers[position]
+        return True, None if number == NO_COUNTRY else self.countries[number]
+
+    def items(self) -> Iterator[tuple[int, str | None]]:
+        for key, number in zip(self._keys, self._numbers):
+            yield key, None if number == NO_COUNTRY else self.countries[number]
+
+
+class AuthorCountrySource(Protocol):
+    """Where the read model is synced from."""
+
+    def now(self) -> int:
+        """Current value of the updated_at clock."""
+
+    def snapshot(self) -> Iterable[tuple[str, str | None]]:
+        """Every author and its country."""
+
+    def changes(self, since: int) -> Iterable[tuple[str, str | None, int]]:
+        """Authors, their country and updated_at, written after the watermark."""
+
+
+class GraphAuthorSource:
+    """The country projection of the Author nodes in the graph."""
+
+    def now(self) -> int:
+        return graph_timestamp()
+
+    def snapshot(self) -> Iterable[tuple[str, str | None]]:
+        return iter_author_countries()
+
+    def changes(self, since: int) -> Iterable[tuple[str, str | None, int]]:
+        return fetch_author_changes(since)
+
+
+class SharedReadModel:
+    """The current read model file of a path, reloaded when another process replaces it, and its syncing.
+    Every process can sync, a file lock makes sure only one of them does at a time.
+    """
+
+    def __init__(self, path: str, source: AuthorCountrySource | None = None, reload_interval: float = 1.0):
+        """
+        Args:
+            path (str): Read model file.
+            source (AuthorCountrySource | None): Where to sync from. Defaults to the graph.
+            reload_interval (float): Seconds between checks for a new file.
+        """
+        self.path = path
+        self.source = source or GraphAuthorSource()
+        self.reload_interval = reload_interval
+        self._model: ReadModel | None = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def current(self, force: bool = False) -> ReadModel | None:
+        """The model of the newest file, or None if there isn't one yet."""
+        now = time.monotonic()
+        if not force and now - self._checked_at < self.reload_interval:
+            return self._model
+        with self._lock:
+            self._checked_at = now
+            try:
+                stat = os.stat(self.path)
+            except FileNotFoundError:
+                return self._model
+            model = self._model
+            if model is None or (stat.st_ino, stat.st_mtime_ns) != (model.stat.st_ino, model.stat.st_mtime_ns):
+                # The previous mapping is left to the garbage collector, lookups may still be using it.
+                self._model = ReadModel(self.path)
+                logger.debug("[read_model] Loaded %s authors from %s.", len(self._model), self.path)
+            return self._model
+
+    def lookup_many(self, goodreads_ids: Iterable[Hashable]) -> tuple[Dict[Hashable, str | None], List[Hashable]]:
+        """Same contract as graph_db.fetch_countries_by_gr_ids, without leaving the process.
+
+        Returns:
+            tuple[Dict[Hashable, str | None], List[Hashable]]: Country (or None) of the authors in the model,
+            and the ids that aren't in it.
+        """
+        model = self.current()
+        if model is None:
+            return {}, list(goodreads_ids)
+        countries: Dict[Hashable, str | None] = {}
+        unknown: List[Hashable] = []
+        for goodreads_id in goodreads_ids:
+            found, country = model.lookup(author_key(goodreads_id))
+            if found:
+                countries[goodreads_id] = country
+            else:
+                unknown.append(goodreads_id)
+        return countries, unknown
+
+    def sync(self) -> bool:
+        """Brings the file up to date with the source, unless another process is already doing it.
+
+        Returns:
+            bool: Whether a new file was written.
+        """
+        with open(f"{self.path}.lock", "w") as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return False
+            model = self.current(force=True)
+            if model is None:
+                watermark = self.source.now()
+                countries = {author_key(gr_id): country for gr_id, country in self.source.snapshot()}
+                write_read_model(self.path, countries, watermark)
+                return True
+            changes = list(self.source.changes(model.watermark - READ_MODEL_SYNC_LAG))
+            stale = [(gr_id, country) for gr_id, country, _ in changes if model.lookup(author_key(gr_id)) != (True, country)]
+            if not stale:
+                return False
+            countries = dict(model.items())
+            for gr_id, country in stale:
+                countries[author_key(gr_id)] = country
+            write_read_model(self.path, countries, max(model.watermark, *(updated_at for _, _, updated_at in changes)))
+            return True
+
+    def start_sync(self, interval: float = READ_MODEL_SYNC_INTERVAL) -> None:
+        """Syncs in a background thread, every interval seconds."""
+
+        def loop() -> None:
+            while not self._stop.is_set():
+                try:
+                    self.sync()
+                except Exception:
+                    logger.exception("[read_model] Sync of %s failed.", self.path)
+                self._stop.wait(interval)
+
+        self._thread = threading.Thread(target=loop, name="read-model-sync", daemon=True)
+        self._thread.start()
+
+    def stop_sync(self) -> None:
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
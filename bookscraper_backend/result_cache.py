@@ -0,0 +1,192 @@
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Protocol
+from urllib.parse import urlparse
+from logger import logger
+
+# Seconds a profile result is served as fresh.
+PROFILE_CACHE_TTL = float(os.getenv("PROFILE_CACHE_TTL", 60 * 60))
+# Seconds after the TTL during which the stale result is still served while it gets refreshed in the background.
+PROFILE_CACHE_MAX_STALE = float(os.getenv("PROFILE_CACHE_MAX_STALE", 24 * 60 * 60))
+
+_GR_USER_PATH = re.compile(r"/user/show/(\d+)")
+
+
+def normalize_profile_url(profile_url: str) -> str:
+    """Cache key of a GR profile. Every URL of the same GR user id gives the same key, whatever the slug or query.
+
+    Args:
+        profile_url (str): Profile URL, like https://www.goodreads.com/user/show/71341746-tamir-einhorn-salem.
+
+    Returns:
+        str: "goodreads:user:<id>" for GR user URLs, the lowercase host and path otherwise.
+    """
+    parsed = urlparse(profile_url.strip())
+    match = _GR_USER_PATH.match(parsed.path)
+    if match:
+        return f"goodreads:user:{match.group(1)}"
+    host = parsed.netloc.lower().removeprefix("www.")
+    return f"{host}{parsed.path.rstrip('/')}"
+
+
+class ResultStore(Protocol):
+    """Where cached results live. Values are stored with the time they were computed."""
+
+    def get(self, key: str) -> tuple[Any, float] | None:
+        ...
+
+    def set(self, key: str, value: Any, stored_at: float) -> None:
+        ...
+
+
+class LRUResultStore:
+    """In-process store, bounded to the most recently used entries."""
+
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max_entries
+        self._entries: OrderedDict[str, tuple[Any, float]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> tuple[Any, float] | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry:
+                self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key: str, value: Any, stored_at: float) -> None:
+        with self._lock:
+            self._entries[key] = (value, stored_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+class SQLiteResultStore:
+    """Store in a SQLite file, so cached results survive restarts and are shared by every worker on the machine.
+    Values must be JSON serializable.
+    """
+
+    def __init__(self, path: str, table: str = "profile_results"):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.table = table
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} (key TEXT PRIMARY KEY, value TEXT NOT NULL, stored_at REAL NOT NULL)"
+        )
+        self._connection.commit()
+
+    def get(self, key: str) -> tuple[Any, float] | None:
+        with self._lock:
+            row = self._connection.execute(f"SELECT value, stored_at FROM {self.table} WHERE key = ?", (key,)).fetchone()
+        if row:
+            return json.loads(row[0]), row[1]
+        return None
+
+    def set(self, key: str, value: Any, stored_at: float) -> None:
+        with self._lock:
+            self._connection.execute(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, stored_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value), stored_at),
+            )
+            self._connection.commit()
+
+
+class ProfileResultCache:
+    """Stale-while-revalidate cache of profile results.
+    Fresh results are served as they are. Stale ones are served right away while a single background refresh runs.
+    Results older than the TTL plus the maximum staleness are recomputed before answering.
+    """
+
+    def __init__(self, store: ResultStore, ttl: float = PROFILE_CACHE_TTL, max_stale: float = PROFILE_CACHE_MAX_STALE):
+        """
+        Args:
+            store (ResultStore): Where results are kept.
+            ttl (float): Seconds a result is fresh.
+            max_stale (float): Seconds after the TTL a stale result can still be served.
+        """
+        self.store = store
+        self.ttl = ttl
+        self.max_stale = max_stale
+        self._refreshing: set[str] = set()
+        self._lock = threading.Lock()
+
+    def _compute(self, key: str, compute: Callable[[], Any]) -> tuple[Any, float]:
+        value = compute()
+        stored_at = time.time()
+        self.store.set(key, value, stored_at)
+        return value, stored_at
+
+    def _refresh_in_background(self, key: str, compute: Callable[[], Any]) -> bool:
+        with self._lock:
+            if key in self._refreshing:
+                return True
+            self._refreshing.add(key)
+
+        def refresh() -> None:
+            try:
+                self._compute(key, compute)
+                logger.info("[result_cache] Refreshed %s.", key)
+            except Exception:
+                logger.exception("[result_cache] Background refresh of %s failed.", key)
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        threading.Thread(target=refresh, name=f"refresh-{key}", daemon=True).start()
+        return True
+
+    def get_or_compute(
+        self, profile_url: str, compute: Callable[[], Any], force_refresh: bool = False
+    ) -> tuple[Any, Dict[str, Any]]:
+        """Returns the result for a profile, from the cache when possible.
+
+        Args:
+            profile_url (str): Profile URL, normalized into the cache key.
+            compute (Callable[[], Any]): Computes the result when needed.
+            force_refresh (bool): Ignore the cache and recompute now.
+
+        Returns:
+            tuple[Any, Dict[str, Any]]: The result and its freshness metadata
+            (cached, stale, refreshing, age_seconds, computed_at).
+        """
+        key = normalize_profile_url(profile_url)
+        entry = None if force_refresh else self.store.get(key)
+        now = time.time()
+        if entry:
+            value, stored_at = entry
+            age = now - stored_at
+            if age <= self.ttl + self.max_stale:
+                stale = age > self.ttl
+                refreshing = self._refresh_in_background(key, compute) if stale else False
+                return value, {
+                    "cached": True,
+                    "stale": stale,
+                    "refreshing": refreshing,
+                    "age_seconds": round(age, 3),
+                    "computed_at": stored_at,
+                }
+        value, stored_at = self._compute(key, compute)
+        return value, {"cached": False, "stale": False, "refreshing": False, "age_seconds": 0.0, "computed_at": stored_at}
+
+
+def create_profile_cache() -> ProfileResultCache:
+    """Builds the profile cache from the environment.
+    PROFILE_CACHE_BACKEND is "memory" (default) or "sqlite", in which case PROFILE_CACHE_PATH is the database file.
+    """
+    backend = os.getenv("PROFILE_CACHE_BACKEND", "memory")
+    if backend == "sqlite":
+        store: ResultStore = SQLiteResultStore(os.getenv("PROFILE_CACHE_PATH", "./cache/profiles.sqlite"))
+    elif backend == "memory":
+        store = LRUResultStore(int(os.getenv("PROFILE_CACHE_MAX_ENTRIES", 1024)))
+    else:
+        raise ValueError(f"Unknown PROFILE_CACHE_BACKEND {backend}.")
+    logger.info("[result_cache] Using %s profile cache.", backend)
+    return ProfileResultCache(store)
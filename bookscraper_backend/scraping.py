@@ -0,0 +1,42 @@
+import os
+from typing import Any, Dict, List, Protocol
+
+
+class Scraper(Protocol):
+    """Where shelves and author pages come from."""
+
+    def process_goodreads_url(self, profile_url: str) -> List[Dict[str, str]]:
+        """Books of the read shelf of a GR profile, each with author_id, author_link and author_name."""
+        ...
+
+    def scrape_gr_author(self, author_link: str) -> tuple[str | None, Any]:
+        """Birthplace (and the rest of what goodreads_scraper returns) of a GR author."""
+        ...
+
+
+class GoodreadsScraper:
+    """The real thing, goodreads_scraper hitting goodreads.com.
+    goodreads_scraper (and selenium with it) is imported on first use, so the offline backends work without it.
+    """
+
+    def process_goodreads_url(self, profile_url: str) -> List[Dict[str, str]]:
+        from goodreads_scraper.scrape import process_goodreads_url
+
+        return process_goodreads_url(profile_url)
+
+    def scrape_gr_author(self, author_link: str) -> tuple[str | None, Any]:
+        from goodreads_scraper.scrape import scrape_gr_author
+
+        return scrape_gr_author(author_link)
+
+
+def create_scraper() -> Scraper:
+    """SCRAPER_BACKEND is "goodreads" (default) or "fake", the offline stand-in of bookscraper_backend.fakes."""
+    backend = os.getenv("SCRAPER_BACKEND", "goodreads")
+    if backend == "goodreads":
+        return GoodreadsScraper()
+    if backend == "fake":
+        from bookscraper_backend.fakes import FakeGoodreads
+
+        return FakeGoodreads()
+    raise ValueError(f"Unknown SCRAPER_BACKEND {backend}.")
@@ -0,0 +1,161 @@
+import datetime
+import os
+import socket
+import threading
+import time
+import uuid
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Hashable, Iterable
+from sqlalchemy import delete, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+from bookscraper_backend.database.db_models import ResolutionLock
+from logger import logger
+
+# Seconds after which a lock left behind by a dead process is ignored.
+SINGLEFLIGHT_LOCK_TTL = float(os.getenv("SINGLEFLIGHT_LOCK_TTL", 10 * 60))
+
+
+class SingleFlight:
+    """Coalesces concurrent work on the same key inside a process.
+    The first caller for a key becomes its leader and does the work, every other caller waits for the leader's result.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._calls: Dict[Hashable, Future] = {}
+        self._lock = threading.Lock()
+
+    def claim(self, key: Hashable) -> tuple[Future, bool]:
+        """Joins the in-flight call for the key, or starts one.
+
+        Args:
+            key (Hashable): What is being resolved, e.g. an author id.
+
+        Returns:
+            tuple[Future, bool]: Future with the result of the call, and whether the caller is the leader.
+            The leader must call resolve or fail for the key.
+        """
+        with self._lock:
+            future = self._calls.get(key)
+            if future:
+                return future, False
+            future = Future()
+            self._calls[key] = future
+            return future, True
+
+    def resolve(self, key: Hashable, value: Any) -> None:
+        with self._lock:
+            future = self._calls.pop(key, None)
+        if future:
+            future.set_result(value)
+
+    def fail(self, key: Hashable, error: BaseException) -> None:
+        with self._lock:
+            future = self._calls.pop(key, None)
+        if future:
+            future.set_exception(error)
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        """Runs fn for the key, unless another thread is already running it, in which case its result is shared."""
+        future, leader = self.claim(key)
+        if not leader:
+            logger.debug("[singleflight] Waiting on in-flight %s %s.", self.name, key)
+            return future.result()
+        try:
+            value = fn()
+        except Exception as e:
+            self.fail(key, e)
+            raise
+        except BaseException:
+            # Interrupts (and generator exits) belong to this thread, the followers only learn the call is gone.
+            self.fail(key, RuntimeError(f"The {self.name} call for {key} was abandoned."))
+            raise
+        self.resolve(key, value)
+        return value
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._calls)
+
+
+class PostgresLockTable:
+    """Locks shared by every process through the resolution_locks table, so that only one process resolves
+    a key at a time. A lock is a row: inserting it acquires the lock, deleting it releases it.
+    """
+
+    def __init__(self, session_factory: Callable[[], Session], ttl: float = SINGLEFLIGHT_LOCK_TTL):
+        """
+        Args:
+            session_factory (Callable[[], Session]): Creates sessions to the Postgres database.
+            ttl (float): Seconds after which a lock is considered abandoned.
+        """
+        self.session_factory = session_factory
+        self.ttl = ttl
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+    def try_acquire(self, keys: Iterable[str]) -> set[str]:
+        """Acquires every free lock among the keys, in a single statement.
+
+        Args:
+            keys (Iterable[str]): Keys to lock.
+
+        Returns:
+            set[str]: Keys this process now holds. The rest are held by someone else.
+        """
+        keys = list(dict.fromkeys(keys))
+        if not keys:
+            return set()
+        expired = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(seconds=self.ttl)
+        statement = (
+            insert(ResolutionLock)
+            .values([{"key": key, "owner": self.owner} for key in keys])
+            .on_conflict_do_nothing(index_elements=["key"])
+            .returning(ResolutionLock.key)
+        )
+        with self.session_factory() as session:
+            session.execute(delete(ResolutionLock).where(ResolutionLock.key.in_(keys), ResolutionLock.acquired_at < expired))
+            acquired = set(session.scalars(statement))
+            session.commit()
+        return acquired
+
+    def release(self, keys: Iterable[str]) -> None:
+        keys = list(keys)
+        if not keys:
+            return
+        with self.session_factory() as session:
+            session.execute(
+                delete(ResolutionLock).where(ResolutionLock.key.in_(keys), ResolutionLock.owner == self.owner)
+            )
+            session.commit()
+
+    def wait_released(self, keys: Iterable[str], timeout: float = 60, poll_interval: float = 0.5) -> bool:
+        """Waits until nobody holds any of the keys.
+
+        Returns:
+            bool: False if some keys were still locked after the timeout.
+        """
+        pending = list(keys)
+        deadline = time.monotonic() + timeout
+        while pending:
+            with self.session_factory() as session:
+                pending = list(session.scalars(select(ResolutionLock.key).where(ResolutionLock.key.in_(pending))))
+            if not pending:
+                break
+            if time.monotonic() > deadline:
+                logger.warning("[singleflight] %s locks still held after %s seconds.", len(pending), timeout)
+                return False
+            time.sleep(poll_interval)
+        return True
+
+
+def create_lock_table() -> PostgresLockTable | None:
+    """Cross-process locks, if SINGLEFLIGHT_BACKEND is "postgres". Only in-process coalescing happens otherwise."""
+    backend = os.getenv("SINGLEFLIGHT_BACKEND", "local")
+    if backend == "local":
+        return None
+    if backend == "postgres":
+        from bookscraper_backend.database.setup import get_session_factory
+
+        return PostgresLockTable(get_session_factory())
+    raise ValueError(f"Unknown SINGLEFLIGHT_BACKEND {backend}.")
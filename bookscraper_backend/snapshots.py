@@ -0,0 +1,69 @@
+import os
+from collections import Counter
+from typing import Any, Callable, Dict
+from bookscraper_backend.result_cache import LRUResultStore, ResultStore, SQLiteResultStore
+from logger import logger
+
+# A snapshot is what we knew about a shelf the last time it was processed:
+# {"authors": {author_id: [author_link, author_name, book_count, country]}, "country_count": {country: book_count}}
+Snapshot = Dict[str, Any]
+
+
+def apply_shelf(
+    snapshot: Snapshot | None, cont: Counter, resolve: Callable[[Counter], Dict[Any, str | None]]
+) -> tuple[Dict[str, int], Snapshot]:
+    """Updates the country count of a shelf from its previous snapshot.
+    Only authors that weren't in the snapshot are resolved, authors that left the shelf or whose book count
+    changed update the country count by their delta. Cost scales with the change, not with the shelf.
+
+    Args:
+        snapshot (Snapshot | None): Previous snapshot of the shelf, if there is one.
+        cont (Counter): Current counter of books per author, from extract_authors.
+        resolve (Callable[[Counter], Dict[Any, str | None]]): Resolves authors to countries, like resolve_author_countries.
+
+    Returns:
+        tuple[Dict[str, int], Snapshot]: Books read per country and the new snapshot of the shelf.
+    """
+    old_authors: Dict[str, list] = snapshot["authors"] if snapshot else {}
+    country_count: Dict[str, int] = dict(snapshot["country_count"]) if snapshot else {}
+    current: Dict[str, tuple[Any, str, str, int]] = {}
+    for (author_id, author_link, author_name), count in cont.items():
+        current[str(author_id)] = (author_id, author_link, author_name, count)
+
+    def add(country: str | None, delta: int) -> None:
+        if country:
+            country_count[country] = country_count.get(country, 0) + delta
+            if country_count[country] <= 0:
+                del country_count[country]
+
+    for key, (_, _, old_count, country) in old_authors.items():
+        if key not in current:
+            add(country, -old_count)
+    # Authors kept from the snapshot aren't resolved again, even without a country: theirs came from storage,
+    # which would answer None again. force_refresh rebuilds the whole snapshot instead.
+    added = Counter({(author_id, link, name): count for key, (author_id, link, name, count) in current.items() if key not in old_authors})
+    resolved = {str(author_id): country for author_id, country in resolve(added).items()} if added else {}
+    authors: Dict[str, list] = {}
+    for key, (_, author_link, author_name, count) in current.items():
+        if key in old_authors:
+            country = old_authors[key][3]
+            add(country, count - old_authors[key][2])
+        else:
+            country = resolved.get(key)
+            add(country, count)
+        authors[key] = [author_link, author_name, count, country]
+    removed = len(old_authors.keys() - current.keys())
+    logger.info("[snapshots] Shelf diff: %s added, %s removed, %s kept.", len(added), removed, len(current) - len(added))
+    return country_count, {"authors": authors, "country_count": country_count}
+
+
+def create_snapshot_store() -> ResultStore:
+    """Builds the shelf snapshot store from the environment.
+    SNAPSHOT_BACKEND is "memory" (default) or "sqlite", in which case SNAPSHOT_PATH is the database file.
+    """
+    backend = os.getenv("SNAPSHOT_BACKEND", "memory")
+    if backend == "sqlite":
+        return SQLiteResultStore(os.getenv("SNAPSHOT_PATH", "./cache/snapshots.sqlite"), table="shelf_snapshots")
+    if backend == "memory":
+        return LRUResultStore(int(os.getenv("SNAPSHOT_MAX_ENTRIES", 1024)))
+    raise ValueError(f"Unknown SNAPSHOT_BACKEND {backend}.")
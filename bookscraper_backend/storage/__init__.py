@@ -0,0 +1,85 @@
+"""Storage of authors and their birthplaces.
+
+STORAGE_BACKEND picks the implementation: "neo4j" (default), the graph in graph_db, "postgres", the tables
+in bookscraper_backend.database.db_models, or "memory", dictionaries of the process for tests and benchmarks.
+All of them implement StorageBackend.
+"""
+import functools
+import os
+from typing import Any, Dict, Hashable, Iterable, Protocol
+
+AuthorDict = Dict[str, str]
+GeoDict = Dict[str, str | float]
+
+# Upper bound of authors sent in a single bulk statement.
+STORAGE_CHUNK_SIZE = int(os.getenv("STORAGE_CHUNK_SIZE", 1000))
+
+
+class StorageUnavailable(Exception):
+    pass
+
+
+class StorageBackend(Protocol):
+    """The graph_db API the backend relies on. Places (cities, regions, countries) are returned as the backend's
+    own records, which all have a name.
+    """
+
+    name: str
+
+    def setup(self) -> None:
+        """Connects and brings the schema up to date."""
+
+    def ping(self) -> None:
+        """Makes a round-trip to the database.
+
+        Raises:
+            StorageUnavailable: If the database can't be reached.
+        """
+
+    def fetch_author_by_gr_id(self, goodreads_id: Hashable) -> Any | None:
+        """The author with this Goodreads id, if it is stored."""
+
+    def get_author_place(self, goodreads_id: Hashable, desired_entity: str = "Country") -> Any | None:
+        """The Region or Country the author was born in."""
+
+    def create_geo_nodes(self, geo_dict: GeoDict) -> tuple[Any, Any, bool | None, bool | None]:
+        """Creates or gets the places of a birthplace: (city, country, created city, created region)."""
+
+    def insert_everything(self, author_dict: AuthorDict, geo_dict: GeoDict | None) -> Any | None:
+        """Stores an author and its birthplace, returning the country if there is one."""
+
+    def fetch_countries_by_gr_ids(
+        self, goodreads_ids: Iterable[Hashable], chunk_size: int = STORAGE_CHUNK_SIZE
+    ) -> tuple[Dict[Hashable, str | None], list[Hashable]]:
+        """Country name (or None) of every stored author, and the ids that aren't stored."""
+
+    def insert_many(
+        self, pairs: list[tuple[AuthorDict, GeoDict | None]], chunk_size: int = STORAGE_CHUNK_SIZE
+    ) -> Dict[Hashable, str | None]:
+        """Bulk insert_everything, returning the country name (or None) per stored author id.
+        Authors the backend can't store are left out.
+        """
+
+
+def create_storage(backend: str | None = None) -> StorageBackend:
+    """Builds the storage backend named by the argument or by STORAGE_BACKEND."""
+    backend = backend or os.getenv("STORAGE_BACKEND", "neo4j")
+    if backend == "neo4j":
+        from bookscraper_backend.storage.graph import Neo4jStorage
+
+        return Neo4jStorage()
+    if backend == "postgres":
+        from bookscraper_backend.storage.postgres import PostgresStorage
+
+        return PostgresStorage()
+    if backend == "memory":
+        from bookscraper_backend.storage.memory import MemoryStorage
+
+        return MemoryStorage()
+    raise ValueError(f"Unknown STORAGE_BACKEND {backend}.")
+
+
+@functools.lru_cache(maxsize=None)
+def get_storage() -> StorageBackend:
+    """Storage backend shared by the whole process."""
+    return create_storage()
@@ -0,0 +1,51 @@
+import os
+from typing import Dict, Hashable, Iterable
+from bookscraper_backend.setup import setup_db
+from bookscraper_backend.storage import STORAGE_CHUNK_SIZE, AuthorDict, GeoDict, StorageUnavailable
+from graph_models import Author, City, Country
+from logger import logger
+from neo4j.exceptions import DriverError, Neo4jError
+from neomodel import StructuredNode, db
+import graph_db
+
+
+class Neo4jStorage:
+    """Authors and places as nodes of the graph, see graph_db."""
+
+    name = "neo4j"
+
+    def setup(self) -> None:
+        setup_db(uri=os.getenv("NEO4J_URI"), password=os.getenv("NEO4J_PASSWORD"))
+        graph_db.create_constraints()
+
+    def ping(self) -> None:
+        try:
+            db.cypher_query("RETURN 1")
+        except (DriverError, Neo4jError) as e:
+            raise StorageUnavailable(f"Neo4j is unreachable: {e}") from e
+
+    def fetch_author_by_gr_id(self, goodreads_id: Hashable) -> Author | None:
+        return graph_db.fetch_author_by_gr_id(goodreads_id)  # type: ignore
+
+    def get_author_place(self, goodreads_id: Hashable, desired_entity: str = "Country") -> StructuredNode | None:
+        author = self.fetch_author_by_gr_id(goodreads_id)
+        if not author:
+            logger.debug("[storage] Author %s isn't stored.", goodreads_id)
+            return None
+        return graph_db.get_author_place(author, desired_entity)
+
+    def create_geo_nodes(self, geo_dict: GeoDict) -> tuple[City, Country, bool | None, bool | None]:
+        return graph_db.create_geo_nodes(geo_dict)
+
+    def insert_everything(self, author_dict: AuthorDict, geo_dict: GeoDict | None) -> Country | None:
+        return graph_db.insert_everything(author_dict, geo_dict)
+
+    def fetch_countries_by_gr_ids(
+        self, goodreads_ids: Iterable[Hashable], chunk_size: int = STORAGE_CHUNK_SIZE
+    ) -> tuple[Dict[Hashable, str | None], list[Hashable]]:
+        return graph_db.fetch_countries_by_gr_ids(goodreads_ids, chunk_size)
+
+    def insert_many(
+        self, pairs: list[tuple[AuthorDict, GeoDict | None]], chunk_size: int = STORAGE_CHUNK_SIZE
+    ) -> Dict[Hashable, str | None]:
+        return graph_db.insert_many(pairs, chunk_size)
@@ -0,0 +1,168 @@
+import os
+import threading
+import time
+from typing import Dict, Hashable, Iterable, NamedTuple
+from bookscraper_backend.countries import get_country_index
+from bookscraper_backend.storage import STORAGE_CHUNK_SIZE, AuthorDict, GeoDict
+
+# Seconds every call sleeps, to stand in for the round-trip to a real database.
+MEMORY_STORAGE_LATENCY = float(os.getenv("MEMORY_STORAGE_LATENCY", 0))
+
+
+class MemoryCountry(NamedTuple):
+    name: str
+    code: str | None
+
+
+class MemoryRegion(NamedTuple):
+    name: str
+    country: str
+
+
+class MemoryCity(NamedTuple):
+    name: str
+    parent: tuple[str, ...]  # ("country", name) or ("region", country, name)
+    latitude: float | None = None
+    longitude: float | None = None
+
+
+class MemoryAuthor(NamedTuple):
+    goodreads_id: str
+    name: str
+    goodreads_link: str | None
+    city: MemoryCity | None
+    country: str | None
+
+
+class MemoryStorage:
+    """Authors and places in dictionaries of the process, with the same uniqueness rules as the graph:
+    countries by name, regions by name within their country, cities by coordinates or by name within their parent.
+    Meant for tests and benchmarks that shouldn't need a database.
+    """
+
+    name = "memory"
+
+    def __init__(self, latency: float = MEMORY_STORAGE_LATENCY):
+        """
+        Args:
+            latency (float): Seconds every call sleeps, like a round-trip to the database would take.
+        """
+        self.latency = latency
+        self.countries: Dict[str, MemoryCountry] = {}
+        self.regions: Dict[tuple[str, str], MemoryRegion] = {}
+        self.cities: Dict[tuple, MemoryCity] = {}
+        self.authors: Dict[str, MemoryAuthor] = {}
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def _round_trip(self, count: int = 1) -> None:
+        # Outside of the lock, so concurrent calls wait for their round-trips in parallel like on a real database.
+        if self.latency:
+            time.sleep(self.latency * count)
+        with self._lock:
+            self.calls += count
+
+    def setup(self) -> None:
+        pass
+
+    def ping(self) -> None:
+        pass
+
+    def _create_geo_nodes(self, geo_dict: GeoDict) -> tuple[MemoryCity, MemoryCountry, bool, bool | None]:
+        country_name = str(geo_dict["country"])
+        code = geo_dict.get("country_code") or get_country_index().code(country_name)
+        country = self.countries.get(country_name)
+        if country is None or (code and country.code != code):
+            country = self.countries[country_name] = MemoryCountry(country_name, code or None)  # type: ignore
+        created_region = None
+        parent: tuple[str, ...] = ("country", country_name)
+        if "region" in geo_dict:
+            region_key = (country_name, str(geo_dict["region"]))
+            created_region = region_key not in self.regions
+            self.regions.setdefault(region_key, MemoryRegion(region_key[1], country_name))
+            parent = ("region", *region_key)
+        latitude, longitude = geo_dict.get("latitude"), geo_dict.get("longitude")
+        if latitude and longitude:
+            city_key: tuple = ("lat_long", f"lat:{latitude} long:{longitude}")
+            new_city = MemoryCity(str(geo_dict["city"]), parent, float(latitude), float(longitude))
+        else:
+            city_key = (*parent, str(geo_dict["city"]))
+            new_city = MemoryCity(str(geo_dict["city"]), parent)
+        created_city = city_key not in self.cities
+        city = self.cities.setdefault(city_key, new_city)
+        return city, country, created_city, created_region
+
+    def _city_country(self, city: MemoryCity) -> str:
+        return city.parent[1]
+
+    def _insert(self, author_dict: AuthorDict, geo_dict: GeoDict | None) -> MemoryCountry | None:
+        city, country = None, None
+        if geo_dict:
+            city, country, _, _ = self._create_geo_nodes(geo_dict)
+        goodreads_id = str(author_dict["goodreads_id"])
+        existing = self.authors.get(goodreads_id)
+        if existing and not city:
+            return None  # Nothing new about an author we already have.
+        self.authors[goodreads_id] = MemoryAuthor(
+            goodreads_id,
+            author_dict["name"],
+            author_dict.get("goodreads_link"),
+            city,
+            self._city_country(city) if city else None,
+        )
+        return self.countries[self._city_country(city)] if city else country
+
+    def fetch_author_by_gr_id(self, goodreads_id: Hashable) -> MemoryAuthor | None:
+        self._round_trip()
+        with self._lock:
+            return self.authors.get(str(goodreads_id))
+
+    def get_author_place(self, goodreads_id: Hashable, desired_entity: str = "Country") -> MemoryCountry | MemoryRegion | None:
+        self._round_trip()
+        with self._lock:
+            author = self.authors.get(str(goodreads_id))
+            if not author or not author.city:
+                return None
+            if desired_entity == "Country":
+                return self.countries.get(author.country)  # type: ignore
+            if desired_entity == "Region":
+                return self.regions.get(author.city.parent[1:]) if author.city.parent[0] == "region" else None  # type: ignore
+            raise ValueError(f"Authors aren't born in a {desired_entity}.")
+
+    def create_geo_nodes(self, geo_dict: GeoDict) -> tuple[MemoryCity, MemoryCountry, bool | None, bool | None]:
+        self._round_trip()
+        with self._lock:
+            return self._create_geo_nodes(geo_dict)
+
+    def insert_everything(self, author_dict: AuthorDict, geo_dict: GeoDict | None) -> MemoryCountry | None:
+        self._round_trip()
+        with self._lock:
+            return self._insert(author_dict, geo_dict)
+
+    def fetch_countries_by_gr_ids(
+        self, goodreads_ids: Iterable[Hashable], chunk_size: int = STORAGE_CHUNK_SIZE
+    ) -> tuple[Dict[Hashable, str | None], list[Hashable]]:
+        goodreads_ids = list(goodreads_ids)
+        countries: Dict[Hashable, str | None] = {}
+        missing: list[Hashable] = []
+        self._round_trip(-(-len(goodreads_ids) // chunk_size))
+        with self._lock:
+            for goodreads_id in goodreads_ids:
+                author = self.authors.get(str(goodreads_id))
+                if author:
+                    countries[goodreads_id] = author.country
+                else:
+                    missing.append(goodreads_id)
+        return countries, missing
+
+    def insert_many(
+        self, pairs: list[tuple[AuthorDict, GeoDict | None]], chunk_size: int = STORAGE_CHUNK_SIZE
+    ) -> Dict[Hashable, str | None]:
+        countries: Dict[Hashable, str | None] = {}
+        self._round_trip(-(-len(pairs) // chunk_size))
+        with self._lock:
+            for author_dict, geo_dict in pairs:
+                self._insert(author_dict, geo_dict)
+                # Like the graph, the country the author is linked to: a city found by its coordinates keeps its own.
+                countries[author_dict["goodreads_id"]] = self.authors[str(author_dict["goodreads_id"])].country
+        return countries
@@ -0,0 +1,216 @@
+from typing import Any, Callable, Dict, Hashable, Iterable, List
+from sqlalchemy import func, literal_column, select, text
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+from bookscraper_backend.database.db_models import Author, City, Country, Region
+from bookscraper_backend.storage import STORAGE_CHUNK_SIZE, AuthorDict, GeoDict, StorageUnavailable
+from logger import logger
+
+# True for the rows an INSERT ... ON CONFLICT DO UPDATE inserted, False for the existing rows it updated.
+CREATED = literal_column("xmax = 0").label("created")
+# Name of the country an author row ends up linked to, which ON CONFLICT may have kept from before.
+LINKED_COUNTRY = literal_column(
+    "(SELECT countries.name FROM countries WHERE countries.id = authors.birth_country_id)"
+).label("country_name")
+
+
+def _as_int_id(goodreads_id: Hashable) -> int | None:
+    text_id = str(goodreads_id)
+    return int(text_id) if text_id.isdigit() else None
+
+
+class PostgresStorage:
+    """Authors and places as rows of the tables in db_models. Every write is a few INSERT ... ON CONFLICT
+    statements for a whole batch, one per table, and lookups join authors to countries through the
+    birth_country_id column.
+    """
+
+    name = "postgres"
+
+    def __init__(self, session_factory: Callable[[], Session] | None = None):
+        """
+        Args:
+            session_factory (Callable[[], Session] | None): Creates sessions. Defaults to the pooled one of database.setup.
+        """
+        self._session_factory = session_factory
+
+    @property
+    def session_factory(self) -> Callable[[], Session]:
+        if self._session_factory is None:
+            from bookscraper_backend.database.setup import get_session_factory
+
+            self._session_factory = get_session_factory()
+        return self._session_factory
+
+    def setup(self) -> None:
+        # The schema is managed by alembic, so there is only the connection to check.
+        with self.session_factory() as session:
+            session.execute(text("SELECT 1"))
+        logger.info("[storage] Connected to Postgres.")
+
+    def ping(self) -> None:
+        try:
+            with self.session_factory() as session:
+                session.execute(text("SELECT 1"))
+        except SQLAlchemyError as e:
+            raise StorageUnavailable(f"Postgres is unreachable: {e}") from e
+
+    def _upsert_places(self, session: Session, geo_dicts: List[GeoDict]) -> List[tuple[int, int, bool, bool | None]]:
+        """Upserts the countries, regions and cities of the birthplaces, one statement per table.
+
+        Returns:
+            List[tuple[int, int, bool, bool | None]]: City id, country id, whether the city and the region
+            (None without a region) were created, per birthplace.
+        """
+        countries = sorted({str(geo_dict["country"]) for geo_dict in geo_dicts})
+        statement = insert(Country).values([{"name": name, "still_exists": True} for name in countries])
+        statement = statement.on_conflict_do_update(
+            index_elements=["name"], index_where=text("still_exists IS TRUE"), set_={"name": statement.excluded.name}
+        ).returning(Country.name, Country.id)
+        country_ids: Dict[str, int] = dict(session.execute(statement).all())  # type: ignore
+
+        regions = sorted(
+            {(country_ids[str(geo_dict["country"])], str(geo_dict["region"])) for geo_dict in geo_dicts if geo_dict.get("region")}
+        )
+        region_ids: Dict[tuple[int, str], tuple[int, bool]] = {}
+        if regions:
+            statement = insert(Region).values([{"country_id": country_id, "name": name} for country_id, name in regions])
+            statement = statement.on_conflict_do_update(
+                index_elements=["country_id", "name"], set_={"name": statement.excluded.name}
+            ).returning(Region.country_id, Region.name, Region.id, CREATED)
+            region_ids = {(country_id, name): (id, created) for country_id, name, id, created in session.execute(statement)}
+
+        def parent(geo_dict: GeoDict) -> tuple[str, int]:
+            country_id = country_ids[str(geo_dict["country"])]
+            if geo_dict.get("region"):
+                return "region_id", region_ids[(country_id, str(geo_dict["region"]))][0]
+            return "country_id", country_id
+
+        city_ids: Dict[tuple[str, int, str], tuple[int, bool]] = {}
+        for column in ("region_id", "country_id"):
+            cities = sorted({(*parent(geo_dict), str(geo_dict["city"])) for geo_dict in geo_dicts if parent(geo_dict)[0] == column})
+            if not cities:
+                continue
+            parent_column = getattr(City, column)
+            statement = insert(City).values([{column: parent_id, "name": name} for _, parent_id, name in cities])
+            statement = statement.on_conflict_do_update(
+                index_elements=[column, "name"], index_where=parent_column.isnot(None), set_={"name": statement.excluded.name}
+            ).returning(parent_column, City.name, City.id, CREATED)
+            city_ids.update({(column, parent_id, name): (id, created) for parent_id, name, id, created in session.execute(statement)})
+
+        places = []
+        for geo_dict in geo_dicts:
+            country_id = country_ids[str(geo_dict["country"])]
+            city_id, created_city = city_ids[(*parent(geo_dict), str(geo_dict["city"]))]
+            created_region = region_ids[(country_id, str(geo_dict["region"]))][1] if geo_dict.get("region") else None
+            places.append((city_id, country_id, created_city, created_region))
+        return places
+
+    def _insert(
+        self, session: Session, pairs: List[tuple[AuthorDict, GeoDict | None]]
+    ) -> Dict[Hashable, tuple[int | None, str | None]]:
+        """Upserts the authors of a chunk and their places.
+        Authors with a non numeric id can't be stored, they are logged and left out.
+
+        Returns:
+            Dict[Hashable, tuple[int | None, str | None]]: Id and name of the country each stored author is linked to.
+        """
+        geo_dicts = [geo_dict for _, geo_dict in pairs if geo_dict]
+        places = iter(self._upsert_places(session, geo_dicts) if geo_dicts else [])
+        rows: Dict[int, Dict[str, Any]] = {}
+        original_ids: Dict[int, Hashable] = {}
+        for author_dict, geo_dict in pairs:
+            city_id, country_id = next(places)[:2] if geo_dict else (None, None)
+            goodreads_id = _as_int_id(author_dict["goodreads_id"])
+            if goodreads_id is None:
+                logger.warning("[storage] Skipping author with a non numeric id %s.", author_dict["goodreads_id"])
+                continue
+            original_ids[goodreads_id] = author_dict["goodreads_id"]
+            rows[goodreads_id] = {
+                "goodreads_id": goodreads_id,
+                "goodreads_link": author_dict.get("goodreads_link"),
+                "name": author_dict["name"],
+                "birth_city_id": city_id,
+                "birth_country_id": country_id,
+            }
+        if not rows:
+            return {}
+        statement = insert(Author).values([rows[goodreads_id] for goodreads_id in sorted(rows)])
+        statement = statement.on_conflict_do_update(
+            index_elements=["goodreads_id"],
+            set_={
+                "name": statement.excluded.name,
+                "birth_city_id": func.coalesce(statement.excluded.birth_city_id, Author.birth_city_id),
+                "birth_country_id": func.coalesce(statement.excluded.birth_country_id, Author.birth_country_id),
+            },
+        ).returning(Author.goodreads_id, Author.birth_country_id, LINKED_COUNTRY)
+        return {
+            original_ids[goodreads_id]: (country_id, country_name)
+            for goodreads_id, country_id, country_name in session.execute(statement)
+        }
+
+    def fetch_author_by_gr_id(self, goodreads_id: Hashable) -> Author | None:
+        with self.session_factory() as session:
+            return session.scalar(select(Author).where(Author.goodreads_id == _as_int_id(goodreads_id)))
+
+    def get_author_place(self, goodreads_id: Hashable, desired_entity: str = "Country") -> Country | Region | None:
+        if desired_entity == "Country":
+            query = select(Country).join(Author, Author.birth_country_id == Country.id)
+        elif desired_entity == "Region":
+            query = select(Region).join(City, City.region_id == Region.id).join(Author, Author.birth_city_id == City.id)
+        else:
+            raise ValueError(f"Authors aren't born in a {desired_entity}.")
+        with self.session_factory() as session:
+            return session.scalar(query.where(Author.goodreads_id == _as_int_id(goodreads_id)))
+
+    def create_geo_nodes(self, geo_dict: GeoDict) -> tuple[City, Country, bool | None, bool | None]:
+        with self.session_factory() as session:
+            city_id, country_id, created_city, created_region = self._upsert_places(session, [geo_dict])[0]
+            session.commit()
+            return session.get(City, city_id), session.get(Country, country_id), created_city, created_region  # type: ignore
+
+    def insert_everything(self, author_dict: AuthorDict, geo_dict: GeoDict | None) -> Country | None:
+        with self.session_factory() as session:
+            country_id, _ = self._insert(session, [(author_dict, geo_dict)]).get(author_dict["goodreads_id"], (None, None))
+            session.commit()
+            return session.get(Country, country_id) if country_id else None
+
+    def fetch_countries_by_gr_ids(
+        self, goodreads_ids: Iterable[Hashable], chunk_size: int = STORAGE_CHUNK_SIZE
+    ) -> tuple[Dict[Hashable, str | None], list[Hashable]]:
+        original_ids: Dict[int, Hashable] = {}
+        missing: list[Hashable] = []
+        for goodreads_id in goodreads_ids:
+            int_id = _as_int_id(goodreads_id)
+            if int_id is None:
+                missing.append(goodreads_id)  # Can't be stored, so it isn't.
+            else:
+                original_ids[int_id] = goodreads_id
+        keys = list(original_ids)
+        countries: Dict[Hashable, str | None] = {}
+        with self.session_factory() as session:
+            for start in range(0, len(keys), chunk_size):
+                query = (
+                    select(Author.goodreads_id, Country.name)
+                    .outerjoin(Country, Country.id == Author.birth_country_id)
+                    .where(Author.goodreads_id.in_(keys[start : start + chunk_size]))
+                )
+                for goodreads_id, country in session.execute(query):
+                    countries[original_ids[goodreads_id]] = country
+        missing.extend(goodreads_id for goodreads_id in original_ids.values() if goodreads_id not in countries)
+        logger.debug("[storage] Bulk lookup: %s found, %s missing.", len(countries), len(missing))
+        return countries, missing
+
+    def insert_many(
+        self, pairs: list[tuple[AuthorDict, GeoDict | None]], chunk_size: int = STORAGE_CHUNK_SIZE
+    ) -> Dict[Hashable, str | None]:
+        countries: Dict[Hashable, str | None] = {}
+        for start in range(0, len(pairs), chunk_size):
+            chunk = pairs[start : start + chunk_size]
+            with self.session_factory() as session:
+                stored = self._insert(session, chunk)
+                session.commit()
+            countries.update((goodreads_id, country_name) for goodreads_id, (_, country_name) in stored.items())
+        logger.info("[storage] Bulk inserted %s of %s authors.", len(countries), len(pairs))
+        return countries
@@ -1,5 +1,6 @@
 import pytest
-from bookscraper_backend.backend import extract_authors, process_birthplace, get_lat_long_place, process_country_count
+from bookscraper_backend import backend
+from bookscraper_backend.backend import extract_authors, process_birthplace, get_lat_long_place, process_country_count, count_by_country
 
 from collections import Counter
 from graph_models import Author
@@ -74,9 +75,9 @@ def test_get_lat_long_place(place, expected) -> None:
     [
         (
             "Limoeiro do Norte, Ceará, Brazil",
-            {"country": "Brazil", "region": "Ceará", "city": "Limoeiro do Norte", "latitude": -5.1455607, "longitude": -38.0984936},
+            {"country": "Brazil", "country_code": "BR", "region": "Ceará", "city": "Limoeiro do Norte", "latitude": -5.1455607, "longitude": -38.0984936},
         ),
-        ("Rome, Italy", {"country": "Italy", "city": "Rome", "latitude": 41.8933203, "longitude": 12.4829321}),
+        ("Rome, Italy", {"country": "Italy", "country_code": "IT", "city": "Rome", "latitude": 41.8933203, "longitude": 12.4829321}),
         ("", None),
         ("suhdfusdhfsudh, bumfuck, nedjsai", {"country": "nedjsai", "region": "bumfuck", "city": "suhdfusdhfsudh"})
 
@@ -94,3 +95,26 @@ def test_process_country_count():
         assert result.pop(country) == country_count[country]
     res_vals = list(result.values())
     assert res_vals == [0] * len(res_vals)
+
+
+def test_process_country_count_aliases():
+    country_count = {"England": 2, "The United Kingdom": 1, "USSR": 3, "Soviet Union": 1, "Russia": 1}
+    result = process_country_count(country_count)
+    assert result["United Kingdom"] == 3
+    assert result["Soviet Union"] == 4, "Former countries are counted apart from their successors."
+    assert result["Russian Federation"] == 1
+    assert "Czechoslovakia" not in result
+    assert sum(result.values()) == 8
+
+
+def test_count_by_country():
+    cont = Counter({("1", "link_1", "A"): 2, ("2", "link_2", "B"): 1, ("3", "link_3", "C"): 4, ("4", "link_4", "D"): 1})
+    author_countries = {"1": "France", "2": "Brazil", "3": "France", "4": None}
+    assert count_by_country(cont, author_countries) == {"France": 6, "Brazil": 1}
+
+
+def test_us_state_abbreviations_are_not_countries(monkeypatch):
+    monkeypatch.setattr(backend, "get_lat_long_place", lambda place: None)
+    geo_dict = process_birthplace("Atlanta, GA")
+    assert geo_dict == {"city": "Atlanta", "country": "GA"}, "GA is Georgia here, not Gabon."
+    assert process_birthplace("Philadelphia, PA")["country"] == "PA"  # type: ignore
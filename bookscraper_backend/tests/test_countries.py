@@ -0,0 +1,53 @@
+import pytest
+from bookscraper_backend.countries import CountryIndex
+
+
+@pytest.fixture(scope="module")
+def country_index():
+    return CountryIndex()
+
+
+@pytest.mark.parametrize(
+    "spelling, code",
+    [
+        ("Brazil", "BR"),
+        ("The United States", "US"),
+        ("England", "GB"),
+        ("USSR", None),
+        ("Persia", "IR"),
+        ("Côte d'Ivoire", "CI"),
+        ("cote d'ivoire", "CI"),
+        ("DEU", "DE"),
+        ("GA", None),
+        ("PA", None),
+        ("Brazill", "BR"),
+        ("nedjsai", None),
+        ("", None),
+    ],
+)
+def test_country_codes(country_index: CountryIndex, spelling, code):
+    assert country_index.code(spelling) == code
+
+
+def test_canonical_name(country_index: CountryIndex):
+    assert country_index.canonical_name("The United States") == "United States"
+
+
+@pytest.mark.parametrize(
+    "spelling, name",
+    [
+        ("USSR", "Soviet Union"),
+        ("Czechoslovakia", "Czechoslovakia"),
+        ("Kingdom of Yugoslavia", "Yugoslavia"),
+        ("East Germany", "East Germany"),
+        ("West Germany", "Germany"),
+    ],
+)
+def test_former_countries_keep_their_name(country_index: CountryIndex, spelling, name):
+    assert country_index.canonical_name(spelling) == name
+
+
+def test_zero_counts_are_copies(country_index: CountryIndex):
+    counts = country_index.zero_counts()
+    counts["Brazil"] += 1
+    assert country_index.zero_counts()["Brazil"] == 0
@@ -0,0 +1,34 @@
+import pytest
+import sqlalchemy as sa
+from sqlalchemy.exc import TimeoutError
+from sqlalchemy.pool import QueuePool
+from bookscraper_backend.database.setup import TimedQueuePool
+
+
+def test_timed_pool_records_waits_and_timeouts(tmp_path):
+    engine = sa.create_engine(
+        f"sqlite:///{tmp_path / 'pool.sqlite'}", poolclass=TimedQueuePool, pool_size=1, max_overflow=0, pool_timeout=0.1
+    )
+    pool: TimedQueuePool = engine.pool  # type: ignore
+    with engine.connect():
+        with pytest.raises(TimeoutError):
+            engine.connect()
+        assert pool.checkedout() == 1
+    assert (pool.checkouts, pool.timeouts) == (2, 1)
+    assert pool.max_wait_seconds >= 0.1
+
+
+def test_timed_pool_only_counts_timeouts():
+    def creator():
+        raise ConnectionRefusedError("Database is down.")
+
+    pool = TimedQueuePool(creator, pool_size=1, max_overflow=0, timeout=0.1)
+    with pytest.raises(ConnectionRefusedError):
+        pool.connect()
+    assert (pool.checkouts, pool.timeouts) == (1, 0)
+
+
+def test_timed_pool_still_overrides_a_sqlalchemy_method():
+    # TimedQueuePool times QueuePool._do_get, which isn't public API.
+    assert sa.__version__.startswith("2.")
+    assert callable(vars(QueuePool).get("_do_get"))
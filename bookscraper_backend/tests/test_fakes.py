@@ -0,0 +1,356 @@
+import asyncio
+import json
+import threading
+import time
+import pytest
+from fastapi.testclient import TestClient
+from bookscraper_backend import backend, backend_api
+from bookscraper_backend.backend_api import app
+from bookscraper_backend.fakes import FakeGeocoder, FakeGoodreads, FakeServiceError, SyntheticCatalog
+from bookscraper_backend.geocoding import GeocodeCache
+from bookscraper_backend.result_cache import LRUResultStore
+from bookscraper_backend.storage import StorageUnavailable
+from bookscraper_backend.storage.memory import MemoryStorage
+
+
+def test_synthetic_catalog_is_deterministic():
+    catalog = SyntheticCatalog(authors=1000, popular_authors=10, seed=3)
+    same = SyntheticCatalog(authors=1000, popular_authors=10, seed=3)
+    assert [catalog.birthplace(i) for i in range(100)] == [same.birthplace(i) for i in range(100)]
+    assert catalog.shelf("https://gr/user/1", 50, 0.5) == same.shelf("https://gr/user/1", 50, 0.5)
+    assert catalog.shelf("https://gr/user/1", 50, 0.5) != catalog.shelf("https://gr/user/2", 50, 0.5)
+    author_id, author_link, _ = catalog.author(42)
+    assert catalog.index_of(author_link) == 42 and author_id == "10000042"
+    assert all("," not in country for country in catalog.countries)
+
+
+def test_fake_goodreads_shelf_size_and_errors():
+    goodreads = FakeGoodreads(SyntheticCatalog(authors=100), shelf_size=20)
+    assert len(goodreads.process_goodreads_url("https://gr/user/1")) == 20
+    assert len(goodreads.process_goodreads_url("https://gr/user/1?books=7")) == 7
+    failing = FakeGoodreads(SyntheticCatalog(authors=100), error_rate=1.0)
+    try:
+        failing.scrape_gr_author("https://www.goodreads.com/author/show/10000001.Fake_Author_1")
+        raise AssertionError("The scrape should have failed.")
+    except FakeServiceError:
+        assert failing.errors == 1
+
+
+def test_fake_geocoder_is_stable():
+    geocoder = FakeGeocoder(miss_rate=0)
+    latitude, longitude = geocoder.geocode("Fakecity 1, Brazil")
+    assert geocoder.geocode("Fakecity 1, Brazil") == (latitude, longitude)
+    assert -90 <= latitude <= 90 and -180 <= longitude <= 180
+    assert FakeGeocoder(miss_rate=1).geocode("Fakecity 1, Brazil") is None
+
+
+def test_memory_storage_uniqueness():
+    storage = MemoryStorage()
+    geo_dict = {"city": "Sorocaba", "region": "Sao Paulo", "country": "Brazil"}
+    _, _, created_city, created_region = storage.create_geo_nodes(geo_dict)
+    assert (created_city, created_region) == (True, True)
+    _, _, created_city, created_region = storage.create_geo_nodes(dict(geo_dict))
+    assert (created_city, created_region) == (False, False)
+    storage.insert_many([({"goodreads_id": "1", "name": "A"}, geo_dict), ({"goodreads_id": "2", "name": "B"}, None)])
+    assert storage.fetch_countries_by_gr_ids(["1", "2", "3"]) == ({"1": "Brazil", "2": None}, ["3"])
+    assert storage.get_author_place("1", "Region").name == "Sao Paulo"
+    assert len(storage.cities) == 1
+
+
+def test_memory_storage_returns_linked_country():
+    storage = MemoryStorage()
+    rome = {"city": "Rome", "country": "Italy", "latitude": 41.89, "longitude": 12.48}
+    storage.insert_many([({"goodreads_id": "1", "name": "A"}, rome)])
+    inserted = storage.insert_many([({"goodreads_id": "2", "name": "B"}, {**rome, "country": "Vatican"})])
+    assert inserted == {"2": "Italy"}, "A city found by its coordinates keeps its country."
+    assert storage.fetch_countries_by_gr_ids(["2"]) == ({"2": "Italy"}, [])
+
+
+def test_process_profile_offline(monkeypatch):
+    storage = MemoryStorage()
+    monkeypatch.setattr(backend, "get_scraper", lambda: FakeGoodreads(SyntheticCatalog(authors=500), shelf_size=100))
+    monkeypatch.setattr(backend, "get_geocoder", FakeGeocoder)
+    monkeypatch.setattr(backend, "get_geocode_cache", lambda: GeocodeCache(path=None))
+    monkeypatch.setattr(backend, "get_storage", lambda: storage)
+    monkeypatch.setattr(backend, "get_snapshot_store", lambda: LRUResultStore(10))
+    counts = backend.process_profile("https://www.goodreads.com/user/show/1-offline", incremental=False)
+    assert sum(counts.values()) > 0
+    assert len(storage.authors) > 0
+    assert backend.process_profile("https://www.goodreads.com/user/show/1-offline", incremental=False) == counts
+
+
+@pytest.fixture
+def offline(monkeypatch):
+    """Backend wired to the fakes, without latency or errors. Returns the fake GR and the storage."""
+    goodreads = FakeGoodreads(SyntheticCatalog(authors=500), shelf_size=100, shelf_latency=0, author_latency=0, error_rate=0)
+    storage = MemoryStorage()
+    monkeypatch.setattr(backend, "get_scraper", lambda: goodreads)
+    monkeypatch.setattr(backend, "get_geocoder", lambda: FakeGeocoder(latency=0, error_rate=0))
+    monkeypatch.setattr(backend, "get_geocode_cache", lambda: GeocodeCache(path=None))
+    monkeypatch.setattr(backend, "get_storage", lambda: storage)
+    monkeypatch.setattr(backend, "get_snapshot_store", lambda: LRUResultStore(10))
+    monkeypatch.setattr(backend, "get_lock_table", lambda: None)
+    return goodreads, storage
+
+
+def test_authors_in_flight_elsewhere_are_shared(offline):
+    goodreads, _ = offline
+    catalog = goodreads.catalog
+    first, second = catalog.author(1), catalog.author(2)
+    # Another request is already resolving the first author.
+    future, leader = backend.author_flight.claim(first[0])
+    assert leader
+    results = {}
+    thread = threading.Thread(target=lambda: results.update(backend.resolve_missing_authors([first, second])))
+    thread.start()
+    thread.join(0.5)
+    assert thread.is_alive(), "The first author is waited on, not scraped again."
+    backend.author_flight.resolve(first[0], "Brazil")
+    thread.join(5)
+    assert results[first[0]] == "Brazil"
+    assert second[0] in results
+    assert goodreads.calls == 1, "Only the second author was scraped."
+
+
+def test_forced_refresh_does_not_join_an_incremental_run(offline):
+    url = "https://www.goodreads.com/user/show/1-offline"
+    # An incremental run of the profile is already in flight.
+    future, leader = backend.profile_flight.claim((backend.normalize_profile_url(url), True))
+    assert leader
+    try:
+        assert sum(backend.process_profile(url, incremental=False).values()) > 0
+        assert not future.done()
+    finally:
+        backend.profile_flight.resolve((backend.normalize_profile_url(url), True), {})
+
+
+def test_joined_profiles_get_the_leader_progress(monkeypatch):
+    started, release = threading.Event(), threading.Event()
+
+    def process(profile_url, incremental, progress):
+        progress(1, 2)
+        started.set()
+        release.wait(5)
+        progress(2, 2)
+        return {"Brazil": 2}
+
+    monkeypatch.setattr(backend, "_process_profile", process)
+    url = "https://www.goodreads.com/user/show/2-joined"
+    leader = threading.Thread(target=backend.process_profile, args=(url,))
+    leader.start()
+    assert started.wait(5)
+    reported = []
+    joiner = threading.Thread(target=backend.process_profile, args=(url,), kwargs={"progress": lambda *p: reported.append(p)})
+    joiner.start()
+    while not backend._profile_listeners:
+        time.sleep(0.01)
+    release.set()
+    leader.join(5)
+    joiner.join(5)
+    assert reported == [(1, 2), (2, 2)], "The joiner gets the last progress, then every later one."
+    assert not backend._profile_listeners and not backend._profile_progress
+
+
+def test_followers_get_an_error_when_the_leader_stops_early(offline):
+    goodreads, _ = offline
+    authors = [goodreads.catalog.author(i) for i in range(20)]
+    events = backend.iter_resolve_missing_authors(authors)
+    first_id, _ = next(events)
+    # Authors are only resolved as they are yielded, so every other one is still in flight.
+    other_id = next(author_id for author_id, _, _ in authors if author_id != first_id)
+    followed, leader = backend.author_flight.claim(other_id)
+    assert not leader
+    events.close()
+    with pytest.raises(RuntimeError, match="abandoned"):
+        followed.result(1)
+    assert backend.author_flight.in_flight() == 0
+
+
+def test_followers_get_the_leader_error(offline, monkeypatch):
+    goodreads, _ = offline
+    author = goodreads.catalog.author(1)
+    followers = []
+
+    def failing_scrape(author_link):
+        followers.append(backend.author_flight.claim(author[0])[0])
+        raise ValueError("Boom")
+
+    monkeypatch.setattr(goodreads, "scrape_gr_author", failing_scrape)
+    with pytest.raises(ValueError):
+        backend.resolve_missing_authors([author])
+    with pytest.raises(ValueError, match="Boom"):
+        followers[0].result(1)
+
+
+class FakeLockTable:
+    """Lock table where some keys are held by another process."""
+
+    def __init__(self, held_elsewhere):
+        self.held_elsewhere = set(held_elsewhere)
+        self.held = set()
+
+    def try_acquire(self, keys):
+        acquired = set(keys) - self.held_elsewhere
+        self.held |= acquired
+        return acquired
+
+    def release(self, keys):
+        self.held -= set(keys)
+
+    def wait_released(self, keys, timeout=60, poll_interval=0.5):
+        return True
+
+
+def test_authors_locked_by_another_process_are_read_back(offline, monkeypatch):
+    goodreads, storage = offline
+    catalog = goodreads.catalog
+    mine, stored_elsewhere, failed_elsewhere = catalog.author(1), catalog.author(2), catalog.author(3)
+    lock_table = FakeLockTable({f"author:{stored_elsewhere[0]}", f"author:{failed_elsewhere[0]}"})
+    monkeypatch.setattr(backend, "get_lock_table", lambda: lock_table)
+    # The other process stored one of its authors and gave up on the other.
+    storage.insert_many([({"goodreads_id": stored_elsewhere[0], "name": "Elsewhere"}, {"city": "Rome", "country": "Italy"})])
+    countries = backend.resolve_missing_authors([mine, stored_elsewhere, failed_elsewhere])
+    assert countries[stored_elsewhere[0]] == "Italy", "Read from the storage, not scraped."
+    assert set(countries) == {mine[0], stored_elsewhere[0], failed_elsewhere[0]}
+    assert goodreads.calls == 2, "Our author and the one the other process failed are scraped."
+    assert lock_table.held == set(), "Our locks are released."
+
+
+stream_url = "https://www.goodreads.com/user/show/1-stream"
+
+
+def test_profile_events_add_up_to_process_profile(offline):
+    events = list(backend.iter_profile_events(stream_url))
+    types = [event["type"] for event in events]
+    assert types[:2] == ["shelf", "cached"] and types[-1] == "summary"
+    assert set(types[2:-1]) == {"delta"}
+    counts = dict(events[1]["counts"])
+    for event in events[2:-1]:
+        counts[event["country"]] = counts.get(event["country"], 0) + event["delta"]
+    summary = events[-1]
+    assert summary["authors_resolved"] == summary["authors_total"] == events[0]["authors"]
+    assert {country: count for country, count in summary["data"].items() if count} == counts
+    assert summary["data"] == backend.process_profile(stream_url, incremental=False)
+
+
+def test_stream_framing(offline):
+    client = TestClient(app)
+    response = client.post("/process-profile/stream", json={"profile_url": stream_url})
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    events = [json.loads(line) for line in response.text.splitlines()]
+    assert [events[0]["type"], events[1]["type"], events[-1]["type"]] == ["shelf", "cached", "summary"]
+
+    response = client.post("/process-profile/stream", params={"format": "sse"}, json={"profile_url": stream_url})
+    assert response.headers["content-type"].startswith("text/event-stream")
+    blocks = response.text.split("\n\n")
+    assert blocks.pop() == ""
+    for block in blocks:
+        event_line, data_line = block.split("\n")
+        assert event_line == f"event: {json.loads(data_line.removeprefix('data: '))['type']}"
+    assert json.loads(blocks[-1].split("\n")[1].removeprefix("data: ")) == events[-1]
+
+
+async def _stream_until_disconnect(chunks: list, chunks_before_disconnect: int) -> None:
+    """Calls the stream endpoint like a client that goes away after a few chunks."""
+    body = json.dumps({"profile_url": stream_url}).encode()
+    scope = {
+        "type": "http", "method": "POST", "path": "/process-profile/stream", "raw_path": b"/process-profile/stream",
+        "query_string": b"", "headers": [(b"content-type", b"application/json")], "http_version": "1.1",
+        "scheme": "http", "server": ("test", 80), "client": ("test", 1), "root_path": "",
+    }
+    requested = False
+    gone = asyncio.Event()
+
+    async def receive():
+        nonlocal requested
+        if not requested:
+            requested = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        await gone.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.body" and message.get("body"):
+            chunks.append(message["body"])
+            if len(chunks) >= chunks_before_disconnect:
+                gone.set()
+
+    await app(scope, receive, send)
+
+
+def test_stream_stops_its_pipeline_when_the_client_leaves(offline, monkeypatch):
+    goodreads, _ = offline
+    monkeypatch.setattr(goodreads, "catalog", SyntheticCatalog(authors=2000))
+    monkeypatch.setattr(goodreads, "shelf_size", 1000)
+    monkeypatch.setattr(goodreads, "author_latency", 0.005)
+    chunks: list = []
+    asyncio.run(_stream_until_disconnect(chunks, 3))
+    assert json.loads(chunks[0])["type"] == "shelf"
+    assert backend.author_flight.in_flight() == 0, "The authors of the stream were released."
+    scraped = goodreads.calls
+    time.sleep(0.2)
+    assert goodreads.calls == scraped, "Nothing is scraped for the stream once the client left."
+    assert scraped < json.loads(chunks[0])["authors"]
+
+
+club = [f"https://www.goodreads.com/user/show/{i}-member" for i in range(1, 5)]
+
+
+def test_process_profiles_resolves_shared_authors_once(offline):
+    goodreads, storage = offline
+    result = backend.process_profiles(club)
+    shelves = [backend.extract_authors(goodreads.catalog.shelf(url, goodreads.shelf_size, goodreads.author_overlap)) for url in club]
+    unique_authors = {author_id for cont in shelves for author_id, _, _ in cont}
+    assert sum(len(cont) for cont in shelves) > len(unique_authors), "The shelves share authors."
+    assert result["unique_authors"] == len(unique_authors) == len(storage.authors)
+    assert goodreads.calls == len(club) + len(unique_authors), "Every shelf and every unique author is scraped once."
+    assert result["books"] == len(club) * goodreads.shelf_size
+    for url in club:
+        assert result["profiles"][url]["data"] == backend.process_profile(url, incremental=False)
+    aggregate = {country: count for country, count in result["aggregate"].items() if count}
+    for url in club:
+        for country, count in result["profiles"][url]["data"].items():
+            aggregate[country] = aggregate.get(country, 0) - count
+    assert set(aggregate.values()) <= {0}, "The aggregate is the sum of the profiles."
+
+
+def test_process_profiles_reports_failed_shelves(offline, monkeypatch):
+    goodreads, _ = offline
+    scrape_shelf = goodreads.process_goodreads_url
+
+    def flaky_scrape_shelf(profile_url):
+        if profile_url == club[0]:
+            raise ValueError("Private shelf")
+        return scrape_shelf(profile_url)
+
+    monkeypatch.setattr(goodreads, "process_goodreads_url", flaky_scrape_shelf)
+    result = backend.process_profiles(club)
+    assert result["profiles"][club[0]] == {"error": "Private shelf"}
+    assert all(sum(result["profiles"][url]["data"].values()) > 0 for url in club[1:])
+    assert result["books"] == (len(club) - 1) * goodreads.shelf_size
+
+
+def test_process_profiles_endpoint(offline):
+    client = TestClient(app)
+    response = client.post("/process-profiles/", json={"profile_urls": club[:2]})
+    assert response.status_code == 200
+    assert set(response.json()["profiles"]) == set(club[:2])
+    assert client.post("/process-profiles/", json={"profile_urls": []}).status_code == 422
+
+
+def test_db_health_checks_the_storage_backend(monkeypatch):
+    storage = MemoryStorage()
+    monkeypatch.setattr(backend_api, "get_storage", lambda: storage)
+    client = TestClient(app)
+    response = client.get("/db/health")
+    assert response.status_code == 200
+    assert response.json()["backend"] == "memory"
+
+    def unreachable():
+        raise StorageUnavailable("Connection refused.")
+
+    monkeypatch.setattr(storage, "ping", unreachable)
+    response = client.get("/db/health")
+    assert response.status_code == 503
+    assert response.json()["status"] == "unavailable"
+    assert "pool" in response.json()
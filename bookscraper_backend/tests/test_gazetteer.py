@@ -0,0 +1,54 @@
+import io
+import pytest
+from bookscraper_backend.gazetteer import GazetteerGeocoder, GazetteerIndex, build_index
+
+dump = "\n".join(
+    "\t".join(columns)
+    for columns in [
+        ["1", "São Paulo", "Sao Paulo", "", "-23.5475", "-46.63611", "P", "PPLA", "BR", "", "27", "", "", "", "10021295"],
+        ["2", "Rome", "Rome", "Roma,Rom", "41.89193", "12.51133", "P", "PPLC", "IT", "", "07", "", "", "", "2318895"],
+        ["3", "Rome", "Rome", "", "34.25704", "-85.16467", "P", "PPLA2", "US", "", "GA", "", "", "", "36303"],
+        ["4", "Portland", "Portland", "", "45.52345", "-122.67621", "P", "PPLA2", "US", "", "OR", "", "", "", "652503"],
+        ["5", "Portland", "Portland", "", "43.66147", "-70.25533", "P", "PPLA2", "US", "", "ME", "", "", "", "66881"],
+        ["6", "Dublin", "Dublin", "", "53.33306", "-6.24889", "P", "PPLC", "IE", "", "07", "", "", "", "1024027"],
+    ]
+)
+admin1_names = {
+    "BR.27": "São Paulo", "IT.07": "Lazio", "US.GA": "Georgia", "US.OR": "Oregon", "US.ME": "Maine", "IE.07": "Leinster"
+}
+
+
+@pytest.fixture
+def index(tmp_path):
+    path = str(tmp_path / "gazetteer.idx")
+    build_index(io.StringIO(dump), path, admin1_names, alternate_names=True)
+    index = GazetteerIndex(path)
+    yield index
+    index.close()
+
+
+def test_index_lookup(index: GazetteerIndex):
+    entry = index.lookup("sao  PAULO", "BR")
+    assert entry and (entry.latitude, entry.longitude, entry.admin_region) == (-23.5475, -46.63611, "São Paulo")
+    assert index.lookup("São Paulo", "AR") is None
+    assert index.lookup("Rome").latitude == 41.89193, "Without a country, the most populous city wins."  # type: ignore
+
+
+@pytest.mark.parametrize(
+    "place, expected",
+    [
+        ("Rome, Italy", (41.89193, 12.51133)),
+        ("Roma, Lazio, Italy", (41.89193, 12.51133)),
+        ("Rome, Georgia, United States", (34.25704, -85.16467)),
+        ("Rome, Brazil", None),
+        ("Portland, Oregon, United States", (45.52345, -122.67621)),
+        ("Portland, Maine, United States", None),  # Only the Oregon one is indexed, so it's left to the fallback.
+        ("Dublin, Ireland", (53.33306, -6.24889)),
+        ("Dublin, Ohio, Atlantis", None),  # A country we can't map isn't looked up in every country.
+        ("Dublin", (53.33306, -6.24889)),
+        ("suhdfusdhfsudh, bumfuck, nedjsai", None),
+        ("", None),
+    ],
+)
+def test_gazetteer_geocoder(index: GazetteerIndex, place, expected):
+    assert GazetteerGeocoder(index).geocode(place) == expected
@@ -0,0 +1,37 @@
+from bookscraper_backend.geocoding import GeocodeCache, MISSING, normalize_place
+
+
+def test_normalize_place():
+    assert normalize_place(" London ,  England, The United   Kingdom") == "london,england,the united kingdom"
+
+
+def test_cache_hits_and_misses(tmp_path):
+    cache = GeocodeCache(path=str(tmp_path / "geocode.sqlite"))
+    assert cache.get("Rome, Italy") is MISSING
+    cache.set("Rome, Italy", (41.8933203, 12.4829321))
+    cache.set("suhdfusdhfsudh, bumfuck, nedjsai", None)
+    assert cache.get("rome,  italy") == (41.8933203, 12.4829321)
+    assert cache.get("suhdfusdhfsudh, bumfuck, nedjsai") is None
+    stats = cache.stats()
+    assert stats["memory_hits"] == 2
+    assert stats["negative_hits"] == 1
+    assert stats["misses"] == 1
+
+
+def test_cache_survives_restarts(tmp_path):
+    path = str(tmp_path / "geocode.sqlite")
+    GeocodeCache(path=path).set("Rome, Italy", (41.8933203, 12.4829321))
+    cache = GeocodeCache(path=path)
+    assert cache.get("Rome, Italy") == (41.8933203, 12.4829321)
+    assert cache.stats()["disk_hits"] == 1
+
+
+def test_cache_expiration():
+    cache = GeocodeCache(max_entries=2)
+    cache.set("Rome, Italy", (41.8933203, 12.4829321), ttl=-1)
+    assert cache.get("Rome, Italy") is MISSING
+    assert cache.stats()["expired"] == 1
+    cache.set("a", None)
+    cache.set("b", None)
+    cache.set("c", None)
+    assert cache.get("a") is MISSING, "Least recently used entry was evicted."
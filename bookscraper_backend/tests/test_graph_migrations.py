@@ -0,0 +1,28 @@
+import pytest
+import graph_db
+import graph_migrations
+import graph_queries
+
+
+def test_check_query_plans_reports_label_scans():
+    index_seek = {"operatorType": "ProduceResults@neo4j", "children": [{"operatorType": "NodeIndexSeek@neo4j", "children": []}]}
+    label_scan = {"operatorType": "ProduceResults@neo4j", "children": [{"operatorType": "NodeByLabelScan@neo4j", "children": []}]}
+    scanning = graph_queries.get_template("region_in_country").cypher
+
+    offenders = graph_migrations.check_query_plans(lambda cypher, params: label_scan if cypher == scanning else index_seek)
+
+    assert offenders == {"region_in_country": ["NodeByLabelScan@neo4j"]}
+
+
+def test_migration_versions_are_unique_and_ordered():
+    versions = [migration.version for migration in graph_migrations.MIGRATIONS]
+    assert versions == sorted(set(versions))
+
+
+def test_failed_migrations_fail_startup(monkeypatch):
+    def failing_migrations():
+        raise RuntimeError("Constraint can't be created")
+
+    monkeypatch.setattr(graph_migrations, "run_migrations", failing_migrations)
+    with pytest.raises(RuntimeError, match="Constraint"):
+        graph_db.create_constraints()
@@ -8,12 +8,19 @@ from graph_db import (
     city_region_exists,
     create_constraints,
     city_country_exists,
-    create_or_get_city
+    insert_many,
+    fetch_countries_by_gr_ids,
+    insert_everything,
+    fetch_author_by_gr_id,
+    get_author_place,
 )
 from bookscraper_backend.setup import setup_db
-from graph_models import City
+from graph_models import City, Region
+from concurrent.futures import ThreadPoolExecutor
 from neomodel.exceptions import MultipleNodesReturned
 from neomodel import db
+import graph_migrations
+import graph_maintenance
 
 @pytest.fixture(scope="module", autouse=True)
 def neo4j_container():
@@ -102,8 +109,9 @@ def test_same_name_city() -> None:
     # This always raises multiple nodes
     with pytest.raises(MultipleNodesReturned):
         City.nodes.get(repeated_city)
-    # This shouldnt:
-    create_or_get_city(geo_dict_1)
+    # This shouldnt, the city is found again by its coordinates:
+    _, _, created_city, _ = create_geo_nodes(geo_dict_1)
+    assert created_city is False
 
 def test_same_exact_city_with_lat() -> None:
     country = "Israel"
@@ -125,4 +133,92 @@ def test_same_exact_city_without_lat() -> None:
     assert city_country_exists(city, country)
     assert created_city_node
     city_node, country_node, created_city_node, created_region_node = create_geo_nodes(geo_dict)
-    assert not created_city_node
\ No newline at end of file
+    assert not created_city_node
+
+def test_parallel_geo_nodes_are_not_duplicated() -> None:
+    geo_dicts = [
+        {"country": "Portugal", "region": "Lisboa", "city": "Lisboa", "latitude": 38.7077507, "longitude": -9.1365919},
+        {"country": "Portugal", "region": "Lisboa", "city": "Sintra"},
+    ] * 8
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(executor.map(create_geo_nodes, geo_dicts))
+    assert sum(created_city for _, _, created_city, _ in results) == 2
+    assert sum(created_region for _, _, _, created_region in results) == 1
+    assert len(Region.nodes.filter(name="Lisboa")) == 1
+    assert len(City.nodes.filter(name="Sintra")) == 1
+
+
+def test_bulk_insert_and_lookup() -> None:
+    pairs = [
+        ({"name": "Machado de Assis", "goodreads_id": "22458", "goodreads_link": "link_1"},
+         {"country": "Brazil", "region": "Rio de Janeiro", "city": "Rio de Janeiro", "latitude": -22.9110137, "longitude": -43.2093727}),
+        ({"name": "Clarice Lispector", "goodreads_id": "10992", "goodreads_link": "link_2"},
+         {"country": "Brazil", "region": "Rio de Janeiro", "city": "Rio de Janeiro", "latitude": -22.9110137, "longitude": -43.2093727}),
+        ({"name": "Amos Oz", "goodreads_id": "1500", "goodreads_link": "link_3"}, {"country": "Israel", "city": "Jerusalem"}),
+        ({"name": "Nobody", "goodreads_id": "1", "goodreads_link": "link_4"}, None),
+    ]
+    inserted = insert_many(pairs, chunk_size=2)
+    assert inserted == {"22458": "Brazil", "10992": "Brazil", "1500": "Israel", "1": None}
+    assert len(City.nodes.filter(name="Rio de Janeiro")) == 1, "Both authors share the same city node."
+    assert region_country_exists("Rio de Janeiro", "Brazil")
+    assert city_country_exists("Jerusalem", "Israel")
+    countries, missing = fetch_countries_by_gr_ids([22458, 10992, 1500, 1, 999])
+    assert countries == {22458: "Brazil", 10992: "Brazil", 1500: "Israel", 1: None}
+    assert missing == [999]
+
+
+def test_bulk_insert_returns_linked_country() -> None:
+    rome = {"country": "Italy", "city": "Rome", "latitude": 41.89, "longitude": 12.48}
+    insert_many([({"name": "Elena Ferrante", "goodreads_id": "1", "goodreads_link": "link_1"}, rome)])
+    # Same coordinates, another country: the author joins the existing city, which stays in Italy.
+    inserted = insert_many([({"name": "Someone", "goodreads_id": "2", "goodreads_link": "link_2"}, {**rome, "country": "Vatican"})])
+    assert inserted == {"2": "Italy"}
+    assert fetch_countries_by_gr_ids(["2"])[0] == {"2": "Italy"}
+
+
+def test_author_country_projection() -> None:
+    insert_everything(
+        {"name": "Amos Oz", "goodreads_id": "1500", "goodreads_link": "link"},
+        {"country": "Israel", "region": "Jerusalem District", "city": "Jerusalem"},
+    )
+    author = fetch_author_by_gr_id("1500")
+    assert (author.country_name, author.country_code) == ("Israel", "IL")
+    assert get_author_place(author).name == "Israel"
+    assert graph_maintenance.find_inconsistent_authors() == []
+    db.cypher_query("MATCH (a:Author {goodreads_id: '1500'}) SET a.country_name = 'Brazil'")
+    assert [row["goodreads_id"] for row in graph_maintenance.find_inconsistent_authors()] == ["1500"]
+    assert graph_maintenance.repair_author_countries() == 1
+    assert graph_maintenance.find_inconsistent_authors() == []
+
+
+def test_names_with_apostrophes() -> None:
+    geo_dict = {"country": "Côte d'Ivoire", "region": "Lagunes", "city": "Grand-Bassam d'Ivoire"}
+    create_geo_nodes(geo_dict)
+    assert region_country_exists("Lagunes", "Côte d'Ivoire")
+    assert city_region_exists("Grand-Bassam d'Ivoire", "Lagunes")
+
+
+def test_migrations_are_recorded_and_queries_use_indexes():
+    assert graph_migrations.run_migrations() == [1, 2, 3, 4, 5]
+    assert graph_migrations.run_migrations() == []
+    assert graph_migrations.applied_versions() == [1, 2, 3, 4, 5]
+    assert graph_migrations.check_query_plans() == {}
+
+
+def test_region_constraint_migration_merges_duplicates():
+    db.cypher_query("DROP CONSTRAINT region_name_country IF EXISTS")
+    db.cypher_query(
+        """
+        CREATE (co:Country {name: 'Brazil'})
+        CREATE (r1:Region {name: 'Bahia', country_name: 'Brazil'})-[:WITHIN]->(co)
+        CREATE (r2:Region {name: 'Bahia', country_name: 'Brazil'})-[:WITHIN]->(co)
+        CREATE (:City {name: 'Salvador'})-[:WITHIN]->(r1)
+        CREATE (:City {name: 'Ilheus'})-[:WITHIN]->(r2)
+        """
+    )
+    migration = next(migration for migration in graph_migrations.MIGRATIONS if migration.version == 3)
+    for statement in migration.statements:
+        db.cypher_query(statement)
+    assert len(Region.nodes.filter(name="Bahia")) == 1
+    assert city_region_exists("Salvador", "Bahia") and city_region_exists("Ilheus", "Bahia")
+    assert region_country_exists("Bahia", "Brazil")
@@ -0,0 +1,79 @@
+import threading
+import time
+import pytest
+from bookscraper_backend.jobs import DONE, FAILED, QUEUED, RUNNING, JobManager, JobManagerStopped, JobQueueFull
+
+profile_url = "https://www.goodreads.com/user/show/183326807-samir-talem"
+
+
+def test_job_runs_and_reports_progress():
+    def work(url, progress):
+        progress(1, 2)
+        progress(2, 2)
+        return {"Brazil": 1}
+
+    manager = JobManager(work, workers=1)
+    manager.start()
+    job, created = manager.submit(profile_url)
+    assert created
+    assert job.wait(5) == {"Brazil": 1}
+    status = manager.get(job.id).to_dict()  # type: ignore
+    assert status["status"] == DONE
+    assert status["progress"] == {"authors_resolved": 2, "authors_total": 2}
+    assert status["result"] == {"data": {"Brazil": 1}}
+
+
+def test_jobs_are_deduplicated_and_bounded():
+    release = threading.Event()
+    manager = JobManager(lambda url, progress: release.wait(5), workers=1, queue_depth=1)
+    manager.start()
+    running, _ = manager.submit(profile_url)
+    while running.status != RUNNING:
+        time.sleep(0.01)
+    same, created = manager.submit(profile_url + "?shelf=read")
+    assert same is running and not created
+    manager.submit("https://www.goodreads.com/user/show/1-someone")
+    with pytest.raises(JobQueueFull):
+        manager.submit("https://www.goodreads.com/user/show/2-someone-else")
+    release.set()
+    assert running.wait(5)
+
+
+def test_failed_job():
+    def work(url, progress):
+        raise ValueError("Boom")
+
+    manager = JobManager(work, workers=1, retention=0)
+    manager.start()
+    job, _ = manager.submit(profile_url)
+    with pytest.raises(RuntimeError, match="Boom"):
+        job.wait(5)
+    assert job.status == FAILED
+    assert manager.get(job.id) is None, "Finished jobs are dropped after the retention window."
+
+
+def test_jobs_need_a_running_manager():
+    manager = JobManager(lambda url, progress: None, workers=1)
+    with pytest.raises(JobManagerStopped):
+        manager.submit(profile_url)
+    manager.start()
+    manager.shutdown()
+    with pytest.raises(JobManagerStopped):
+        manager.submit(profile_url)
+    assert manager.queued() == 0, "A rejected job isn't left queued."
+
+
+def test_shutdown_fails_queued_jobs():
+    release = threading.Event()
+    manager = JobManager(lambda url, progress: release.wait(5), workers=1)
+    manager.start()
+    running, _ = manager.submit(profile_url)
+    while running.status != RUNNING:
+        time.sleep(0.01)
+    queued, _ = manager.submit("https://www.goodreads.com/user/show/1-someone")
+    assert queued.status == QUEUED
+    manager.shutdown()
+    with pytest.raises(RuntimeError, match="shut down"):
+        queued.wait(1)
+    release.set()
+    assert running.wait(5)
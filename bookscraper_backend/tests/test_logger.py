@@ -0,0 +1,56 @@
+import json
+import logging
+import queue
+import time
+from fastapi.testclient import TestClient
+from bookscraper_backend.backend_api import app
+from logger import DroppingQueueHandler, JsonFormatter, RateLimitFilter, RequestIdFilter, request_id
+
+
+def record(msg, *args, level=logging.INFO, **extra):
+    log_record = logging.LogRecord("test", level, __file__, 1, msg, args, None)
+    log_record.__dict__.update(extra)
+    return log_record
+
+
+def test_rate_limit_filter_counts_suppressed_records():
+    rate_limit = RateLimitFilter(limit=2, window=0.05)
+    passed = [rate_limit.filter(record("Scraped author %s.", i, sampled=True)) for i in range(5)]
+    assert passed == [True, True, False, False, False]
+    assert rate_limit.filter(record("Another template %s.", 1, sampled=True))
+    assert rate_limit.filter(record("Scraped author %s.", 1, level=logging.WARNING, sampled=True)), "Warnings are never dropped."
+    time.sleep(0.06)
+    next_window = record("Scraped author %s.", 6, sampled=True)
+    assert rate_limit.filter(next_window) and next_window.suppressed == 3
+
+
+def test_rate_limit_filter_only_limits_sampled_records():
+    rate_limit = RateLimitFilter(limit=1, window=60)
+    assert all(rate_limit.filter(record("[Process Profile Request]: Starting for %s!", i)) for i in range(5))
+    assert "sampled" not in JsonFormatter().format(record("Scraped author %s.", 1, sampled=True))
+
+
+def test_json_records_carry_request_id_and_extra_fields():
+    handler = DroppingQueueHandler(queue.Queue())
+    token = request_id.set("abc123")
+    try:
+        log_record = record("Scraped author %s.", 42, stage="author_scrape", duration_ms=1.5)
+        RequestIdFilter().filter(log_record)
+    finally:
+        request_id.reset(token)
+    document = json.loads(JsonFormatter().format(handler.prepare(log_record)))
+    assert document["message"] == "Scraped author 42."
+    assert (document["request_id"], document["stage"], document["duration_ms"]) == ("abc123", "author_scrape", 1.5)
+
+
+def test_full_queue_drops_instead_of_blocking():
+    handler = DroppingQueueHandler(queue.Queue(maxsize=1))
+    handler.emit(record("first"))
+    handler.emit(record("second"))
+    assert handler.dropped == 1
+
+
+def test_request_id_header():
+    client = TestClient(app)
+    assert client.get("/db/pool", headers={"X-Request-ID": "given-id"}).headers["x-request-id"] == "given-id"
+    assert len(client.get("/db/pool").headers["x-request-id"]) == 32
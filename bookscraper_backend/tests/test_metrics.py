@@ -0,0 +1,46 @@
+from fastapi.testclient import TestClient
+from bookscraper_backend import backend
+from bookscraper_backend.backend_api import app
+from bookscraper_backend.fakes import FakeGeocoder, FakeGoodreads, SyntheticCatalog
+from bookscraper_backend.metrics import Registry
+from bookscraper_backend.result_cache import LRUResultStore
+from bookscraper_backend.storage.memory import MemoryStorage
+
+
+def test_registry_renders_prometheus_text():
+    registry = Registry()
+    requests = registry.counter("test_requests_total", "Requests.", ["path"])
+    latency = registry.histogram("test_latency_seconds", "Latency.", buckets=[0.1, 1])
+    requests.inc('/a"b')
+    requests.inc('/a"b', amount=2)
+    latency.observe(0.05)
+    latency.observe(0.5)
+    latency.observe(5)
+    text = registry.render()
+    assert "# TYPE test_requests_total counter" in text
+    assert 'test_requests_total{path="/a\\"b"} 3' in text
+    assert 'test_latency_seconds_bucket{le="0.1"} 1' in text
+    assert 'test_latency_seconds_bucket{le="1"} 2' in text
+    assert 'test_latency_seconds_bucket{le="+Inf"} 3' in text
+    assert "test_latency_seconds_count 3" in text
+
+
+def test_metrics_endpoint_has_stage_timings(monkeypatch):
+    storage = MemoryStorage()
+    monkeypatch.setattr(backend, "get_scraper", lambda: FakeGoodreads(SyntheticCatalog(authors=200), shelf_size=30))
+    monkeypatch.setattr(backend, "get_geocoder", FakeGeocoder)
+    monkeypatch.setenv("GEOCODE_CACHE_PATH", "")
+    backend.get_geocode_cache.cache_clear()
+    monkeypatch.setattr(backend, "get_storage", lambda: storage)
+    monkeypatch.setattr(backend, "get_snapshot_store", lambda: LRUResultStore(10))
+    backend.process_profile("https://www.goodreads.com/user/show/1-metrics", incremental=False)
+
+    response = TestClient(app).get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    for stage in ("shelf_scrape", "extract_authors", "author_lookup", "author_scrape", "geocode", "insert"):
+        assert f'bookscraper_stage_seconds_count{{stage="{stage}"}}' in response.text
+    assert 'bookscraper_authors_total{source="scraped"}' in response.text
+    assert "bookscraper_http_requests_in_flight 1" in response.text
+    assert "bookscraper_geocode_cache_hit_ratio" in response.text
+    backend.get_geocode_cache.cache_clear()
@@ -0,0 +1,92 @@
+import threading
+import time
+import pytest
+from bookscraper_backend.pipeline import Stage, run_pipeline
+
+
+def test_pipeline_matches_sequential():
+    items = list(range(200))
+    stages = [
+        Stage("double", lambda x: x * 2, workers=4),
+        Stage("increment", lambda x: x + 1, workers=2),
+        Stage("batch", lambda batch: [(x, len(batch)) for x in batch], workers=1, batch_size=16),
+    ]
+    outputs = list(run_pipeline(items, stages, queue_size=4))
+    assert sorted(x for x, _ in outputs) == [x * 2 + 1 for x in items]
+    assert max(size for _, size in outputs) <= 16
+
+
+def test_pipeline_stages_overlap():
+    """The second stage gets items while the first one is still working on the rest."""
+    processed = []
+    first_stage_busy = []
+
+    def slow(x):
+        time.sleep(0.01)
+        processed.append(x)
+        return x
+
+    def record(x):
+        first_stage_busy.append(len(processed) < 20)
+        return x
+
+    outputs = list(run_pipeline(range(20), [Stage("slow", slow), Stage("record", record)]))
+    assert outputs == list(range(20))
+    assert any(first_stage_busy)
+
+
+def test_pipeline_raises_stage_errors():
+    def fail_on_three(x):
+        if x == 3:
+            raise ValueError("Boom")
+        return x
+
+    with pytest.raises(ValueError, match="Boom"):
+        list(run_pipeline(range(10), [Stage("fail", fail_on_three, workers=2)]))
+
+
+def test_pipeline_reuses_its_workers():
+    """Every run goes through the same long-lived workers, so per thread state like database drivers is kept."""
+    seen = set()
+
+    def record(x):
+        seen.add(threading.get_ident())
+        return x
+
+    before = threading.active_count()
+    for _ in range(20):
+        assert sorted(run_pipeline(range(10), [Stage("reused", record, workers=2)])) == list(range(10))
+    assert len(seen) <= 2
+    assert threading.active_count() <= before + 2
+
+
+def test_pipeline_closed_early_stops_its_work():
+    started = []
+
+    def slow(x):
+        started.append(x)
+        time.sleep(0.01)
+        return x
+
+    outputs = run_pipeline(range(1000), [Stage("closed", slow, workers=2)], queue_size=10)
+    next(outputs)
+    outputs.close()
+    count = len(started)
+    time.sleep(0.05)
+    assert len(started) == count < 20, "Queued items of a closed pipeline are skipped."
+
+
+def test_pipeline_closed_from_its_own_worker():
+    go, closed = threading.Event(), threading.Event()
+
+    def close_consumer(item):
+        if item == 5:
+            go.wait(5)
+            outputs.close()  # What the garbage collector does if the consumer is dropped while a worker runs.
+            closed.set()
+        return item
+
+    outputs = run_pipeline(range(100), [Stage("close_from_worker", close_consumer)], queue_size=10)
+    assert next(outputs) == 0
+    go.set()
+    assert closed.wait(5), "The worker doesn't wait for itself to stop."
@@ -0,0 +1,70 @@
+import os
+from typing import Generator
+import pytest
+import sqlalchemy as sa
+from alembic import command
+from alembic.config import Config
+from sqlalchemy.orm import sessionmaker
+from testcontainers.postgres import PostgresContainer
+from bookscraper_backend.storage.postgres import PostgresStorage
+
+
+@pytest.fixture(scope="module")
+def storage() -> Generator[PostgresStorage, None, None]:
+    with PostgresContainer(
+        username=os.getenv("DB_USER"),
+        password=os.getenv("DB_PASSWORD"),
+        dbname=os.getenv("DB_NAME")
+    ) as postgres:
+        postgres.start()
+        engine = sa.create_engine(postgres.get_connection_url())
+        alembic_cfg = Config("alembic.ini")
+        alembic_cfg.set_main_option("sqlalchemy.url", postgres.get_connection_url())
+        command.upgrade(alembic_cfg, "head")
+        yield PostgresStorage(sessionmaker(bind=engine))
+
+
+@pytest.fixture(autouse=True)
+def cleanup_tables(storage: PostgresStorage):
+    with storage.session_factory() as session:
+        session.execute(sa.text("TRUNCATE TABLE authors, cities, regions, countries RESTART IDENTITY CASCADE"))
+        session.commit()
+
+
+def test_create_geo_nodes(storage: PostgresStorage):
+    geo_dict = {"country": "Brazil", "region": "Rio de Janeiro", "city": "Rio de Janeiro"}
+    city, country, created_city, created_region = storage.create_geo_nodes(geo_dict)
+    assert (city.name, country.name, created_city, created_region) == ("Rio de Janeiro", "Brazil", True, True)
+    _, _, created_city, created_region = storage.create_geo_nodes(geo_dict)
+    assert not created_city and not created_region
+    _, _, created_city, created_region = storage.create_geo_nodes({"country": "Brazil", "city": "Rio de Janeiro"})
+    assert created_city, "Without a region, the city belongs to the country and is a different one."
+    assert created_region is None
+
+
+def test_insert_many_and_lookup(storage: PostgresStorage):
+    pairs = [
+        ({"name": "Machado de Assis", "goodreads_id": "22458", "goodreads_link": "link_1"},
+         {"country": "Brazil", "region": "Rio de Janeiro", "city": "Rio de Janeiro"}),
+        ({"name": "Clarice Lispector", "goodreads_id": "10992", "goodreads_link": "link_2"},
+         {"country": "Brazil", "region": "Rio de Janeiro", "city": "Rio de Janeiro"}),
+        ({"name": "Amos Oz", "goodreads_id": "1500", "goodreads_link": "link_3"}, {"country": "Israel", "city": "Jerusalem"}),
+        ({"name": "Nobody", "goodreads_id": "1", "goodreads_link": "link_4"}, None),
+    ]
+    assert storage.insert_many(pairs, chunk_size=3) == {"22458": "Brazil", "10992": "Brazil", "1500": "Israel", "1": None}
+    countries, missing = storage.fetch_countries_by_gr_ids([22458, 10992, 1500, 1, 999])
+    assert countries == {22458: "Brazil", 10992: "Brazil", 1500: "Israel", 1: None}
+    assert missing == [999]
+    assert storage.get_author_place("22458", "Region").name == "Rio de Janeiro"  # type: ignore
+    assert storage.get_author_place("1500", "Region") is None
+    assert storage.fetch_author_by_gr_id("1500").name == "Amos Oz"  # type: ignore
+
+
+def test_insert_many_leaves_out_non_numeric_ids(storage: PostgresStorage):
+    pairs = [
+        ({"name": "Amos Oz", "goodreads_id": "1500", "goodreads_link": "link_1"}, {"country": "Israel", "city": "Jerusalem"}),
+        ({"name": "Nobody", "goodreads_id": "not-a-number", "goodreads_link": "link_2"}, {"country": "Israel", "city": "Haifa"}),
+    ]
+    assert storage.insert_many(pairs) == {"1500": "Israel"}, "Only authors that were stored are returned."
+    _, missing = storage.fetch_countries_by_gr_ids(["not-a-number"])
+    assert missing == ["not-a-number"]
@@ -0,0 +1,74 @@
+import contextvars
+import pstats
+import threading
+import time
+from fastapi.testclient import TestClient
+from bookscraper_backend import profiling
+from bookscraper_backend.backend_api import app
+from logger import request_id
+
+
+def busy_loop(stop: threading.Event) -> None:
+    while not stop.is_set():
+        sum(range(1000))
+
+
+def test_sampler_writes_pstats_and_collapsed_stacks(tmp_path):
+    stop = threading.Event()
+    worker = threading.Thread(target=busy_loop, args=(stop,))
+    worker.start()
+    sampler = profiling.StackSampler(interval=0.001)
+    sampler.start()
+    time.sleep(0.2)
+    sampler.stop()
+    stop.set()
+    worker.join()
+    prof_path, collapsed_path = sampler.save("test", str(tmp_path))
+    stats = pstats.Stats(prof_path)
+    busy = [key for key in stats.stats if key[2] == "busy_loop"]  # type: ignore
+    assert busy and stats.stats[busy[0]][3] > 0  # type: ignore
+    assert "busy_loop (test_profiling.py:" in open(collapsed_path).read()
+
+
+def other_busy_loop(stop: threading.Event) -> None:
+    busy_loop(stop)
+
+
+def test_request_sampler_only_samples_the_request_threads():
+    stop = threading.Event()
+    workers = []
+    for current_id, loop in [("profiled", busy_loop), ("other", other_busy_loop)]:
+        context = contextvars.copy_context()
+        context.run(request_id.set, current_id)
+        workers.append(threading.Thread(target=context.run, args=(profiling.run_for_request, loop, stop)))
+    untagged = threading.Thread(target=other_busy_loop, args=(stop,))
+    for worker in [*workers, untagged]:
+        worker.start()
+    sampler = profiling.StackSampler(interval=0.001, request="profiled")
+    sampler.start()
+    time.sleep(0.2)
+    sampler.stop()
+    stop.set()
+    for worker in [*workers, untagged]:
+        worker.join()
+    names = {name for stack in sampler.stacks for _, _, name in stack}
+    assert "busy_loop" in names
+    assert "other_busy_loop" not in names, "Threads of other requests, or of none, aren't sampled."
+    assert not profiling._request_threads
+
+
+def test_profiling_endpoints_need_the_token(tmp_path, monkeypatch):
+    client = TestClient(app)
+    monkeypatch.setattr(profiling, "PROFILE_DIR", str(tmp_path))
+    monkeypatch.setattr(profiling, "PROFILE_ADMIN_TOKEN", None)
+    assert client.get("/admin/profiles").status_code == 404, "Profiling is off without a token."
+    monkeypatch.setattr(profiling, "PROFILE_ADMIN_TOKEN", "secret")
+    assert client.get("/admin/profiles", headers={"X-Profile-Token": "wrong"}).status_code == 403
+
+    response = client.get("/admin/profiles", params={"profile_token": "secret"}, headers={"X-Profile-Token": "secret"})
+    name = response.headers["x-profile"]
+    profiles = client.get("/admin/profiles", headers={"X-Profile-Token": "secret"}).json()
+    assert {profile["name"] for profile in profiles} >= {f"{name}.prof", f"{name}.collapsed"}
+    download = client.get(f"/admin/profiles/{name}.collapsed", headers={"X-Profile-Token": "secret"})
+    assert download.status_code == 200
+    assert client.get("/admin/profiles/..%2F.env", headers={"X-Profile-Token": "secret"}).status_code == 404
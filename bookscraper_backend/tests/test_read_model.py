@@ -0,0 +1,42 @@
+from bookscraper_backend.read_model import ReadModel, SharedReadModel, author_key, write_read_model
+
+
+class FakeSource:
+    def __init__(self, authors):
+        self.authors = authors  # goodreads id -> (country, updated_at)
+        self.clock = 1000
+
+    def now(self):
+        return self.clock
+
+    def snapshot(self):
+        return [(gr_id, country) for gr_id, (country, _) in self.authors.items()]
+
+    def changes(self, since):
+        return [(gr_id, country, updated_at) for gr_id, (country, updated_at) in self.authors.items() if updated_at > since]
+
+
+def test_read_model_lookup(tmp_path):
+    path = str(tmp_path / "authors.rm")
+    write_read_model(path, {author_key("22458"): "Brazil", author_key("1500"): None, author_key("abc"): "Israel"}, 5)
+    model = ReadModel(path)
+    assert (len(model), model.watermark) == (3, 5)
+    assert model.lookup(author_key(22458)) == (True, "Brazil")
+    assert model.lookup(author_key("1500")) == (True, None)
+    assert model.lookup(author_key("abc")) == (True, "Israel")
+    assert model.lookup(author_key("999")) == (False, None)
+
+
+def test_shared_read_model_syncs_changes(tmp_path):
+    source = FakeSource({"22458": ("Brazil", 900), "1500": (None, 950)})
+    shared = SharedReadModel(str(tmp_path / "authors.rm"), source, reload_interval=0)
+    assert shared.lookup_many(["22458"]) == ({}, ["22458"]), "Nothing is known before the first sync."
+    assert shared.sync()
+    assert shared.lookup_many([22458, "1500", "7"]) == ({22458: "Brazil", "1500": None}, ["7"])
+
+    assert not shared.sync(), "No changes since the watermark."
+    source.authors["7"] = ("Italy", 1100)
+    source.authors["1500"] = ("Israel", 990)  # Committed late, behind the watermark.
+    assert shared.sync()
+    assert shared.current().watermark == 1100  # type: ignore
+    assert shared.lookup_many(["7", "1500"]) == ({"7": "Italy", "1500": "Israel"}, [])
@@ -0,0 +1,60 @@
+import time
+import pytest
+from bookscraper_backend.result_cache import (
+    LRUResultStore,
+    ProfileResultCache,
+    SQLiteResultStore,
+    normalize_profile_url,
+)
+
+profile_url = "https://www.goodreads.com/user/show/183326807-samir-talem"
+
+
+def test_normalize_profile_url():
+    assert normalize_profile_url(profile_url) == "goodreads:user:183326807"
+    assert normalize_profile_url("https://goodreads.com/user/show/183326807?shelf=read") == "goodreads:user:183326807"
+    assert normalize_profile_url("https://WWW.Example.com/some/path/") == "example.com/some/path"
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    if request.param == "sqlite":
+        return SQLiteResultStore(str(tmp_path / "profiles.sqlite"))
+    return LRUResultStore()
+
+
+def test_fresh_results_are_cached(store):
+    cache = ProfileResultCache(store, ttl=60, max_stale=60)
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return {"Brazil": len(calls)}
+
+    data, meta = cache.get_or_compute(profile_url, compute)
+    assert data == {"Brazil": 1} and not meta["cached"]
+    data, meta = cache.get_or_compute(profile_url, compute)
+    assert data == {"Brazil": 1} and meta["cached"] and not meta["stale"]
+    data, meta = cache.get_or_compute(profile_url, compute, force_refresh=True)
+    assert data == {"Brazil": 2} and not meta["cached"]
+
+
+def test_stale_results_are_served_while_refreshing(store):
+    cache = ProfileResultCache(store, ttl=0, max_stale=60)
+    cache.get_or_compute(profile_url, lambda: {"Brazil": 1})
+    data, meta = cache.get_or_compute(profile_url, lambda: {"Brazil": 2})
+    assert data == {"Brazil": 1}
+    assert meta["stale"] and meta["refreshing"]
+    for _ in range(100):
+        if store.get(normalize_profile_url(profile_url))[0] == {"Brazil": 2}:
+            break
+        time.sleep(0.01)
+    assert store.get(normalize_profile_url(profile_url))[0] == {"Brazil": 2}
+
+
+def test_too_stale_results_are_recomputed(store):
+    cache = ProfileResultCache(store, ttl=0, max_stale=0)
+    cache.get_or_compute(profile_url, lambda: {"Brazil": 1})
+    time.sleep(0.01)
+    data, meta = cache.get_or_compute(profile_url, lambda: {"Brazil": 2})
+    assert data == {"Brazil": 2} and not meta["cached"]
@@ -0,0 +1,49 @@
+import threading
+import time
+import pytest
+from bookscraper_backend.singleflight import SingleFlight
+
+
+def test_concurrent_calls_are_coalesced():
+    flight = SingleFlight("author")
+    calls = []
+
+    def resolve():
+        calls.append(1)
+        time.sleep(0.1)
+        return "Brazil"
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(flight.do("22458", resolve))) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == ["Brazil"] * 5
+    assert len(calls) == 1
+    assert flight.in_flight() == 0
+
+
+def test_errors_are_shared_and_not_cached():
+    flight = SingleFlight("author")
+    future, leader = flight.claim("22458")
+    follower, is_leader = flight.claim("22458")
+    assert leader and not is_leader and follower is future
+    flight.fail("22458", ValueError("Boom"))
+    with pytest.raises(ValueError):
+        follower.result()
+    assert flight.do("22458", lambda: "Brazil") == "Brazil", "A failed call doesn't stick around."
+
+
+def test_interrupted_leader_fails_followers_with_runtime_error():
+    flight = SingleFlight("author")
+    followers = []
+
+    def interrupted():
+        followers.append(flight.claim("22458")[0])
+        raise KeyboardInterrupt
+
+    with pytest.raises(KeyboardInterrupt):
+        flight.do("22458", interrupted)
+    with pytest.raises(RuntimeError, match="abandoned"):
+        followers[0].result()
@@ -0,0 +1,33 @@
+from collections import Counter
+from bookscraper_backend.snapshots import apply_shelf
+
+countries = {1: "France", 2: "Brazil", 3: "Brazil", 4: None, 5: "Israel"}
+
+
+def resolve(cont: Counter):
+    resolve.calls.append(sorted(author_id for author_id, _, _ in cont))
+    return {author_id: countries[author_id] for author_id, _, _ in cont}
+
+
+def shelf(**counts) -> Counter:
+    return Counter({(int(author[1:]), f"link_{author}", f"name_{author}"): count for author, count in counts.items()})
+
+
+def test_incremental_shelf_matches_full_count():
+    resolve.calls = []
+    count, snapshot = apply_shelf(None, shelf(a1=2, a2=1, a4=3), resolve)
+    assert count == {"France": 2, "Brazil": 1}
+    # a1 read one more book, a2 left the shelf, a3 and a5 are new.
+    new_shelf = shelf(a1=3, a3=2, a4=3, a5=1)
+    count, snapshot = apply_shelf(snapshot, new_shelf, resolve)
+    assert resolve.calls == [[1, 2, 4], [3, 5]], "Only new authors are resolved."
+    full_count, _ = apply_shelf(None, new_shelf, resolve)
+    assert count == full_count == {"France": 3, "Brazil": 2, "Israel": 1}
+
+
+def test_unchanged_shelf_resolves_nothing():
+    resolve.calls = []
+    _, snapshot = apply_shelf(None, shelf(a1=1), resolve)
+    count, _ = apply_shelf(snapshot, shelf(a1=1), resolve)
+    assert count == {"France": 1}
+    assert len(resolve.calls) == 1
@@ -1,19 +1,29 @@
 from neomodel import db, StructuredNode
-from graph_models import Author, City, Country, Region
-from typing import Dict
+from neo4j.exceptions import TransientError
+from graph_models import Author, City, Country
+from typing import Dict, Hashable, Iterable, Iterator
+from bookscraper_backend.countries import get_country_index
 from logger import logger
+import graph_migrations
+import graph_queries
+import time
+
+# Upper bound of ids sent in a single UNWIND, so huge shelves don't build a giant parameter list.
+BULK_CHUNK_SIZE = 1000
+# How many times a chunk of the bulk insert is retried when Neo4j reports a transient error (e.g. deadlocks).
+BULK_MAX_RETRIES = 3
 
 def query_pair(origin_type: str, origin_name: str, destination_type: str, destination_name: str) -> list[list[StructuredNode]]:
-    query = f"""
-    MATCH (c:{origin_type})-[:WITHIN]->(r:{destination_type} {{name: '{destination_name}'}})
-    WHERE c.name = '{origin_name}'
-    RETURN c
-    """
-    results, _ = db.cypher_query(query, resolve_objects=True)
-    return results
+    return graph_queries.run(
+        graph_queries.pair_template(origin_type, destination_type),
+        {"origin_name": origin_name, "destination_name": destination_name},
+    )
 
 def pair_exists(origin_type: str, origin_name: str, destination_type: str, destination_name: str) -> bool:
-    results = query_pair(origin_type, origin_name, destination_type, destination_name)
+    results = graph_queries.run(
+        graph_queries.pair_template(origin_type, destination_type, exists=True),
+        {"origin_name": origin_name, "destination_name": destination_name},
+    )
     return len(results) > 0
 
 def city_region_exists(city_name: str, region_name: str) -> bool:
@@ -28,112 +38,41 @@ def region_country_exists(region_name: str, country_name: str) -> bool:
     return pair_exists("Region", region_name, "Country", country_name)
 
 
-@db.transaction
 def create_geo_nodes(geo_dict: Dict[str, str | float]) -> tuple[City, Country, bool | None, bool| None]:
     """Main function for all geographical node insertions/retrievals and connections.
     Expects a dictionary of geographical attributes, 
     will fetch/create the respective node as needed and connect them if applicable.
-    Should only be used internally, for now
+    Everything happens in a single MERGE statement, so it is atomic and safe to run from parallel workers.
 
     Args:
         geo_dict (Dict[str, str]): Dictionary of geographical attributes.
 
     Returns:
-        City| None: City node for connection with Author node elsewhere.
+        tuple[City, Country, bool | None, bool | None]: City node for connection with Author node elsewhere,
+        its Country node, and whether the city and the region (None if there is no region) were created.
     """
-
-    # The first node we should create is country, which already has a uniqueness check. All good on this front then.
-    c = Country.get_or_create({"name": geo_dict["country"]})
-    country_node: Country = c[0]
-    # Then, we create the city node.
-    city_node, created_city_node = create_or_get_city(geo_dict)
-    city_node.save()
-    logger.info("[graph_db] City %s creation: %s", geo_dict['city'], created_city_node)
-    created_region_node = None
-    if "region" in geo_dict:
-        region_node, created_region_node = create_or_get_region(geo_dict)
-        logger.info("[graph_db] Region %s creation: %s", geo_dict['region'], created_region_node)
-        region_node.save()
-        if not region_node.country.is_connected(country_node):
-            region_node.country.connect(country_node)
-            logger.debug("[graph_db] %s wasn't connected to %s, connection done.", geo_dict['region'], geo_dict['country'])
-        # If there is region, then city connects to region:
-        if not city_node.region.is_connected(region_node):
-            city_node.region.connect(region_node)
-            logger.debug("[graph_db] %s wasn't connected to %s, connection done.", geo_dict['city'], geo_dict['region'])
-    else:
-        # If there is no region, city connects to country:
-        if not city_node.country.is_connected(country_node):
-            city_node.country.connect(country_node)
-            logger.debug("[graph_db] %s wasn't connected to %s, connection done.", geo_dict['city'], geo_dict['country'])
-    return city_node, country_node, created_city_node, created_region_node
-
-
-
-def create_or_get_region(geo_dict: Dict[str, str | float]) -> tuple[Region, bool]:
-    """Creates a Region node if and only if it satisfies the validation criteria.
-
-    Args:
-        geo_dict (Dict[str, str]): Geographical information.
-
-    Returns:
-        Region: The desired region node.
-    """
-    # Validate constraints
-    created = None
-    if not region_country_exists(geo_dict["region"], geo_dict["country"]): #type: ignore
-        # If this doesn't exist, we shoud create it. But we will connect and then save!!
-        region_node = Region(name = geo_dict["region"])
-        created = True
-    else:
-        logger.debug("The region %s already exists within %s  so we didn't create it.", {geo_dict['region']}, {geo_dict['country']})
-        region_node =  Region.nodes.get(name = geo_dict["region"])
-        created = False
-    return region_node, created
-
-
-def create_or_get_city(geo_dict: Dict[str, str | float]) -> tuple[City, bool]:
-    """Creates a City node if and only if it satisfies the validation criteria.
-
-    Args:
-        geo_dict (Dict[str, str]): Geographical information.
-
-    Returns:
-        City: The desired City node.
-    """
-    # Validate constraints.
-    #TODO: Maybe now that we have lat long, that is all we need.
-    city: str = geo_dict["city"] #type: ignore
-    country: str = geo_dict["country"] #type: ignore
-    city_country_pair_exists = city_country_exists(city, country)
-    region: str = geo_dict.get("region", "") #type: ignore
-    city_region_pair_exists = city_region_exists(city, region) # type: ignore
     latitude = geo_dict.get("latitude")
     longitude = geo_dict.get("longitude")
-    if latitude and longitude:
-        # Then no checks are needed. Lat long string is already a unique id
-        lat_long_string = f"lat:{latitude} long:{longitude}"
-        city_node: City = City.nodes.get_or_none(lat_long_string=lat_long_string)
-        if not city_node:
-            city_node = City(name = city, latitude = latitude, longitude = longitude, lat_long_string = lat_long_string)
-            created = True
-        else:
-            created = False
-    else:
-        if not city_country_pair_exists and not city_region_pair_exists:
-            # If this doesn't exist, we shoud create it. But we will connect and then save!!
-            city_node = City(name = city)
-            created = True
-        else:
-            # If we dont have latitudes AND the city does exist
-            logger.debug("This combination for city already exists, so we didn't create it.")
-            # And here WE AGAIN have the same problem. 
-            if city_region_pair_exists:
-                city_node: City = query_pair("City", city, "Region", region)[0][0] #type: ignore
-            else:
-                city_node: City = query_pair("City", city, "Country", country)[0][0] #type: ignore
-            created = False
-    return city_node, created
+    has_coordinates = bool(latitude and longitude)
+    has_region = "region" in geo_dict
+    params = {
+        "country": geo_dict["country"],
+        "country_code": geo_dict.get("country_code") or get_country_index().code(geo_dict["country"]),  # type: ignore
+        "region": geo_dict.get("region"),
+        "city": geo_dict["city"],
+        "latitude": latitude,
+        "longitude": longitude,
+        # Lat long string is already a unique id.
+        "lat_long_string": f"lat:{latitude} long:{longitude}" if has_coordinates else None,
+    }
+    city_node, country_node, created_city_node, created_region_node = graph_queries.run(
+        graph_queries.geo_upsert_template(has_region, has_coordinates), params
+    )[0]
+    logger.info("[graph_db] City %s creation: %s", geo_dict['city'], created_city_node, extra={"sampled": True})
+    if not has_region:
+        return city_node, country_node, created_city_node, None
+    logger.info("[graph_db] Region %s creation: %s", geo_dict['region'], created_region_node, extra={"sampled": True})
+    return city_node, country_node, created_city_node, created_region_node
 
 
 @db.transaction
@@ -163,10 +102,42 @@ def fetch_author_by_gr_id(goodreads_id: int) -> Author:
     Returns:
         Author: Author node with that Goodreads id.
     """
-    logger.debug("[graph_db] Looking for author %s", {goodreads_id})
+    logger.debug("[graph_db] Looking for author %s", goodreads_id)
     return Author.nodes.get_or_none(goodreads_id = goodreads_id)
 
 
+def fetch_countries_by_gr_ids(
+    goodreads_ids: Iterable[Hashable], chunk_size: int = BULK_CHUNK_SIZE
+) -> tuple[Dict[Hashable, str | None], list[Hashable]]:
+    """Resolves many authors to their birth country with one UNWIND query per chunk of ids.
+    This replaces calling fetch_author_by_gr_id and get_author_place for every single author.
+    Countries come from the projection on the Author nodes, so this is one index lookup per author.
+
+    Args:
+        goodreads_ids (Iterable[Hashable]): Goodreads ids of the authors, as they come from the shelf.
+        chunk_size (int): Maximum number of ids sent in a single query.
+
+    Returns:
+        tuple[Dict[Hashable, str | None], list[Hashable]]: Country name (or None if the author has no known birthplace)
+        for every author found in the database, and the list of ids that weren't found at all.
+    """
+    # Ids are stored as strings, but the shelf may give us ints, so we map back to whatever we received.
+    original_ids = {str(goodreads_id): goodreads_id for goodreads_id in goodreads_ids}
+    keys = list(original_ids)
+    countries: Dict[Hashable, str | None] = {}
+    missing: list[Hashable] = []
+    for start in range(0, len(keys), chunk_size):
+        chunk = keys[start : start + chunk_size]
+        results = graph_queries.run("author_countries", {"ids": chunk})
+        for gr_id, found, country in results:
+            if found:
+                countries[original_ids[gr_id]] = country
+            else:
+                missing.append(original_ids[gr_id])
+    logger.debug("[graph_db] Bulk lookup: %s found, %s missing.", len(countries), len(missing))
+    return countries, missing
+
+
 def insert_everything(author_dict: Dict[str, str], geo_dict: Dict[str,str | float]| None) -> Country| None:
     """Inserts all necessary nodes according to the information received, both the Author node and the geographical nodes.
 
@@ -179,29 +150,179 @@ def insert_everything(author_dict: Dict[str, str], geo_dict: Dict[str,str | floa
     """
     author: Author = create_author(author_dict)
     logger.info("[graph_db] Created author!")
+    country = None
     # Create regions if applicable.:
     if geo_dict:
         city, country, _, _ = create_geo_nodes(geo_dict)
         if not author.birth_city.is_connected(city):
             logger.debug("Author wasn't connected to birth city, connecting! ")
             author.birth_city.connect(city)
-        return country
-    return None
+    project_author_countries([str(author.goodreads_id)])
+    return country
 
 
-def create_constraints():
-    """Runs list of cypher queries with simple constraints for uniqueness and the like.
+def project_author_countries(goodreads_ids: Iterable[str]) -> Dict[str, str | None]:
+    """Writes the country_name and country_code projection of the authors from their birthplace hierarchy.
+    Runs inside the active transaction, if there is one.
+
+    Args:
+        goodreads_ids (Iterable[str]): Goodreads ids of the authors, as stored.
+
+    Returns:
+        Dict[str, str | None]: Country the graph links each author to (or None), per stored goodreads id.
+    """
+    results = graph_queries.run("project_author_countries", {"ids": list(goodreads_ids)})
+    return {gr_id: country for gr_id, country in results}
+
+
+def _author_geo_row(author_dict: Dict[str, str], geo_dict: Dict[str, str | float] | None) -> Dict[str, str | float | None]:
+    """Flattens an author dictionary and its geographical dictionary into a single row for UNWIND queries.
+
+    Args:
+        author_dict (Dict[str, str]): Dictionary with the author information.
+        geo_dict (Dict[str, str | float] | None): Dictionary with the geographical information, if it exists.
+
+    Returns:
+        Dict[str, str | float | None]: Row with every property the bulk queries need.
+    """
+    row: Dict[str, str | float | None] = {
+        "goodreads_id": str(author_dict["goodreads_id"]),
+        "goodreads_link": author_dict.get("goodreads_link"),
+        "name": author_dict["name"],
+        "city": None,
+        "region": None,
+        "country": None,
+        "latitude": None,
+        "longitude": None,
+        "lat_long_string": None,
+    }
+    if geo_dict:
+        row["city"] = geo_dict["city"]
+        row["region"] = geo_dict.get("region")
+        row["country"] = geo_dict["country"]
+        latitude = geo_dict.get("latitude")
+        longitude = geo_dict.get("longitude")
+        if latitude and longitude:
+            # Same unique id create_geo_nodes uses.
+            row["latitude"] = latitude
+            row["longitude"] = longitude
+            row["lat_long_string"] = f"lat:{latitude} long:{longitude}"
+    return row
+
+
+def _insert_chunk(rows: list[Dict[str, str | float | None]]) -> Dict[str, str | None]:
+    """Writes one chunk of author rows, and all their geographical nodes, inside a single transaction.
+
+    Args:
+        rows (list[Dict[str, str | float | None]]): Rows built by _author_geo_row.
+
+    Returns:
+        Dict[str, str | None]: Country each author ended up linked to, per stored goodreads id.
     """
-    queries = [
-        "CREATE CONSTRAINT country_name FOR (country:Country) REQUIRE country.name IS UNIQUE",
-        "CREATE CONSTRAINT author_gr_id FOR (author:Author) REQUIRE author.goodreads_id IS UNIQUE",
-        "CREATE CONSTRAINT city_lat_long_string FOR (city:City) REQUIRE city.lat_long_string IS UNIQUE"
+    geo_rows = [row for row in rows if row["country"]]
+    country_index = get_country_index()
+    countries = [
+        {"name": country, "code": country_index.code(country)}
+        for country in sorted({row["country"] for row in geo_rows})  # type: ignore
+    ]
+    regions = [
+        {"country": country, "region": region}
+        for country, region in sorted({(row["country"], row["region"]) for row in geo_rows if row["region"]})  # type: ignore
     ]
-    for query in queries:
-        try:
-            db.cypher_query(query)
-        except Exception as e:
-            logger.error("Error creating constraint: %s", e)
+    with db.transaction:
+        graph_queries.run("bulk_authors", {"rows": rows})
+        if countries:
+            graph_queries.run("bulk_countries", {"countries": countries})
+        if regions:
+            graph_queries.run("bulk_regions", {"regions": regions})
+        with_coordinates = [row for row in geo_rows if row["lat_long_string"]]
+        if with_coordinates:
+            graph_queries.run("bulk_cities_with_coordinates", {"rows": with_coordinates})
+        without_coordinates = [row for row in geo_rows if not row["lat_long_string"]]
+        if without_coordinates:
+            graph_queries.run("bulk_cities_without_coordinates", {"rows": without_coordinates})
+        # Authors without a birthplace are projected too, so their updated_at watermark is set.
+        return project_author_countries(row["goodreads_id"] for row in rows)  # type: ignore
+
+
+def insert_many(
+    pairs: list[tuple[Dict[str, str], Dict[str, str | float] | None]],
+    chunk_size: int = BULK_CHUNK_SIZE,
+    max_retries: int = BULK_MAX_RETRIES,
+) -> Dict[Hashable, str | None]:
+    """Bulk version of insert_everything: writes all authors and their geographical nodes with a few UNWIND ... MERGE
+    statements per chunk, each chunk in its own transaction. Chunks are retried on transient errors such as deadlocks.
+
+    Args:
+        pairs (list[tuple[Dict[str, str], Dict[str, str | float] | None]]): Author dictionary and geographical
+        dictionary (if it exists) of every author to insert.
+        chunk_size (int): Maximum number of authors written per transaction.
+        max_retries (int): How many times a chunk is retried after a transient error.
+
+    Returns:
+        Dict[Hashable, str | None]: Country name (or None) per author id, as linked in the graph. A city matched
+        by its coordinates keeps the parent it already had, so that country can differ from the geographical dictionary's.
+    """
+    countries: Dict[Hashable, str | None] = {}
+    rows = []
+    original_ids: Dict[str, Hashable] = {}
+    for author_dict, geo_dict in pairs:
+        rows.append(_author_geo_row(author_dict, geo_dict))
+        original_ids[str(author_dict["goodreads_id"])] = author_dict["goodreads_id"]
+    for start in range(0, len(rows), chunk_size):
+        chunk = rows[start : start + chunk_size]
+        for attempt in range(max_retries + 1):
+            try:
+                linked = _insert_chunk(chunk)
+                countries.update((original_ids[gr_id], country) for gr_id, country in linked.items())
+                break
+            except TransientError as e:
+                if attempt == max_retries:
+                    raise
+                logger.warning("[graph_db] Transient error on bulk insert, retrying chunk (%s): %s", attempt + 1, e)
+                time.sleep(0.1 * 2**attempt)
+    logger.info("[graph_db] Bulk inserted %s authors.", len(rows))
+    return countries
+
+
+def graph_timestamp() -> int:
+    """Current time of the database, in milliseconds, the clock updated_at watermarks are written with."""
+    results, _ = db.cypher_query("RETURN timestamp()")
+    return results[0][0]
+
+
+def iter_author_countries(batch_size: int = BULK_CHUNK_SIZE) -> Iterator[tuple[str, str | None]]:
+    """Every author with its projected country, in goodreads id order, one query per batch."""
+    after = ""
+    while True:
+        results = graph_queries.run("author_countries_page", {"after": after, "limit": batch_size})
+        yield from ((gr_id, country) for gr_id, country in results)
+        if len(results) < batch_size:
+            return
+        after = results[-1][0]
+
+
+def fetch_author_changes(since: int) -> list[tuple[str, str | None, int]]:
+    """Authors whose projection was written after the watermark.
+
+    Args:
+        since (int): Watermark, in database milliseconds (see graph_timestamp).
+
+    Returns:
+        list[tuple[str, str | None, int]]: Goodreads id, projected country and updated_at of every changed author.
+    """
+    return [tuple(row) for row in graph_queries.run("author_changes", {"since": since})]  # type: ignore
+
+
+def create_constraints():
+    """Brings the graph schema (constraints and indexes) up to date, see graph_migrations.
+    A failed migration is raised, so the app doesn't start on a schema its queries don't expect.
+    """
+    try:
+        graph_migrations.run_migrations()
+    except Exception:
+        logger.exception("Error migrating the graph schema.")
+        raise
 
 
 def get_author_place(author: Author, desired_entity: str = "Country") -> StructuredNode | None:
@@ -215,15 +336,11 @@ def get_author_place(author: Author, desired_entity: str = "Country") -> Structu
     Returns:
         StructuredNode | None: Maybe this should return the specific types of nodes we could get or None.
     """
-    element_id = author.element_id
-    query = f'''
-    MATCH (a:Author)-[:BORN_IN]->(c:City)-[:WITHIN*]->(co:{desired_entity}) 
-    WHERE elementId(a) = $element_id
-    RETURN co;
-    '''
-    results, meta = db.cypher_query(
-        query, {"element_id": element_id}, resolve_objects=True
-    )
+    if desired_entity == "Country":
+        # The country is projected on the author, no need to walk the hierarchy.
+        results = graph_queries.run("author_country", {"element_id": author.element_id})
+    else:
+        results = graph_queries.run(f"author_place:{desired_entity}", {"element_id": author.element_id})
     if results:
         return results[0][0]
     return None
@@ -0,0 +1,122 @@
+"""Maintenance of the author country projection (Author.country_name and Author.country_code).
+
+    python graph_maintenance.py check              # List authors whose projection doesn't match their birthplace.
+    python graph_maintenance.py backfill           # Recompute the projection of every author.
+    python graph_maintenance.py backfill --repair  # Only recompute the authors the check reports.
+"""
+from neomodel import db
+from typing import Dict, List
+from graph_db import project_author_countries
+from logger import logger
+import graph_queries
+import argparse
+import sys
+
+MAINTENANCE_BATCH_SIZE = 1000
+
+
+def backfill_author_countries(batch_size: int = MAINTENANCE_BATCH_SIZE) -> int:
+    """Recomputes the projection of every author, a batch of ids per transaction, in goodreads id order.
+
+    Args:
+        batch_size (int): Authors updated per transaction.
+
+    Returns:
+        int: Number of authors updated.
+    """
+    after = ""
+    updated = 0
+    while True:
+        results, _ = db.cypher_query(
+            """
+            MATCH (a:Author) WHERE a.goodreads_id > $after
+            RETURN a.goodreads_id ORDER BY a.goodreads_id LIMIT $limit
+            """,
+            {"after": after, "limit": batch_size},
+        )
+        ids = [row[0] for row in results]
+        if not ids:
+            break
+        with db.transaction:
+            project_author_countries(ids)
+        updated += len(ids)
+        after = ids[-1]
+        logger.info("[graph_maintenance] Backfilled %s authors.", updated)
+    return updated
+
+
+def find_inconsistent_authors(limit: int | None = None) -> List[Dict[str, str | None]]:
+    """Compares the projection of every author with the Country reached through its birthplace.
+
+    Args:
+        limit (int | None): Maximum number of authors reported.
+
+    Returns:
+        List[Dict[str, str | None]]: Goodreads id, projected and actual country of every inconsistent author.
+    """
+    results, _ = db.cypher_query(
+        f"""
+        MATCH (a:Author)
+        OPTIONAL MATCH {graph_queries.AUTHOR_COUNTRY_PATH}
+        WITH a, collect(co)[0] AS co
+        WHERE coalesce(a.country_name, "") <> coalesce(co.name, "")
+           OR coalesce(a.country_code, "") <> coalesce(co.code, "")
+        RETURN a.goodreads_id, a.country_name, a.country_code, co.name, co.code
+        {"LIMIT $limit" if limit else ""}
+        """,
+        {"limit": limit},
+    )
+    return [
+        {
+            "goodreads_id": gr_id,
+            "projected_country": projected_name,
+            "projected_code": projected_code,
+            "country": name,
+            "code": code,
+        }
+        for gr_id, projected_name, projected_code, name, code in results
+    ]
+
+
+def repair_author_countries(batch_size: int = MAINTENANCE_BATCH_SIZE) -> int:
+    """Recomputes the projection of the inconsistent authors only.
+
+    Returns:
+        int: Number of authors repaired.
+    """
+    ids = [row["goodreads_id"] for row in find_inconsistent_authors()]
+    for start in range(0, len(ids), batch_size):
+        with db.transaction:
+            project_author_countries(ids[start : start + batch_size])
+    logger.info("[graph_maintenance] Repaired %s authors.", len(ids))
+    return len(ids)
+
+
+def main(argv: List[str] | None = None) -> int:
+    from bookscraper_backend.setup import setup_db
+
+    parser = argparse.ArgumentParser(description="Author country projection maintenance.")
+    parser.add_argument("command", choices=["check", "backfill"])
+    parser.add_argument("--repair", action="store_true", help="Only backfill the authors that fail the check.")
+    parser.add_argument("--limit", type=int, default=20, help="Inconsistent authors printed by check.")
+    parser.add_argument("--batch-size", type=int, default=MAINTENANCE_BATCH_SIZE)
+    args = parser.parse_args(argv)
+    setup_db()
+    if args.command == "backfill":
+        if args.repair:
+            print(f"Repaired {repair_author_countries(args.batch_size)} authors.")
+        else:
+            print(f"Backfilled {backfill_author_countries(args.batch_size)} authors.")
+        return 0
+    inconsistent = find_inconsistent_authors()
+    for row in inconsistent[: args.limit]:
+        print(
+            f"{row['goodreads_id']}: projected {row['projected_country']} ({row['projected_code']}), "
+            f"born in {row['country']} ({row['code']})"
+        )
+    print(f"{len(inconsistent)} inconsistent authors.")
+    return 1 if inconsistent else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,209 @@
+"""Versioned schema migrations for the graph database, the Neo4j counterpart of the alembic setup for Postgres.
+
+Applied versions are recorded as (:SchemaMigration {version}) nodes, so every migration runs once per database.
+
+    python graph_migrations.py upgrade   # Apply pending migrations.
+    python graph_migrations.py status    # List applied and pending migrations.
+    python graph_migrations.py check     # EXPLAIN every registered query and fail on label scans.
+"""
+from neomodel import db
+from typing import Any, Callable, Dict, List
+from logger import logger
+import graph_queries
+import argparse
+import sys
+import time
+
+# Plan operators that mean a query reads every node of a label (or of the whole graph).
+SCAN_OPERATORS = ("NodeByLabelScan", "AllNodesScan")
+
+
+class Migration:
+    """A schema version: Cypher statements, run in order, each in its own auto-commit transaction
+    (Neo4j doesn't allow schema and data changes in the same transaction).
+    """
+
+    def __init__(self, version: int, description: str, statements: List[str]):
+        self.version = version
+        self.description = description
+        self.statements = statements
+
+
+MIGRATIONS: List[Migration] = [
+    Migration(
+        1,
+        "Uniqueness constraints",
+        [
+            "CREATE CONSTRAINT country_name IF NOT EXISTS FOR (country:Country) REQUIRE country.name IS UNIQUE",
+            "CREATE CONSTRAINT author_gr_id IF NOT EXISTS FOR (author:Author) REQUIRE author.goodreads_id IS UNIQUE",
+            "CREATE CONSTRAINT city_lat_long_string IF NOT EXISTS FOR (city:City) REQUIRE city.lat_long_string IS UNIQUE",
+        ],
+    ),
+    Migration(
+        2,
+        "Indexes for region and city lookups by name",
+        [
+            "CREATE INDEX region_name IF NOT EXISTS FOR (region:Region) ON (region.name)",
+            "CREATE INDEX city_name IF NOT EXISTS FOR (city:City) ON (city.name)",
+            "CREATE INDEX country_code IF NOT EXISTS FOR (country:Country) ON (country.code)",
+            # Regions are unique by name within a country, so the country name lives on the region too.
+            "CREATE INDEX region_name_country IF NOT EXISTS FOR (region:Region) ON (region.name, region.country_name)",
+            """
+            MATCH (region:Region)-[:WITHIN]->(country:Country)
+            WHERE region.country_name IS NULL
+            SET region.country_name = country.name
+            """,
+        ],
+    ),
+    Migration(
+        3,
+        "Regions are unique by name within a country",
+        [
+            # Regions created before the constraint may be duplicated: their cities move to the first copy...
+            """
+            MATCH (region:Region) WHERE region.country_name IS NOT NULL
+            WITH region.name AS name, region.country_name AS country_name, collect(region) AS regions
+            WHERE size(regions) > 1
+            WITH regions[0] AS kept, regions[1..] AS duplicates
+            UNWIND duplicates AS duplicate
+            MATCH (city:City)-[within:WITHIN]->(duplicate)
+            MERGE (city)-[:WITHIN]->(kept)
+            DELETE within
+            """,
+            # ...and the other copies are deleted, so the constraint can be created.
+            """
+            MATCH (region:Region) WHERE region.country_name IS NOT NULL
+            WITH region.name AS name, region.country_name AS country_name, collect(region) AS regions
+            WHERE size(regions) > 1
+            UNWIND regions[1..] AS duplicate
+            DETACH DELETE duplicate
+            """,
+            # The uniqueness constraint brings its own index on the same properties, and Neo4j doesn't create
+            # it while the index exists. If the constraint fails anyway, the version isn't recorded and reruns.
+            "DROP INDEX region_name_country IF EXISTS",
+            "CREATE CONSTRAINT region_name_country IF NOT EXISTS FOR (region:Region) REQUIRE (region.name, region.country_name) IS UNIQUE",
+        ],
+    ),
+    Migration(
+        4,
+        "Backfill the country projection of authors",
+        [
+            f"""
+            MATCH (a:Author)
+            CALL {{
+                WITH a
+                OPTIONAL MATCH {graph_queries.AUTHOR_COUNTRY_PATH}
+                WITH a, collect(co)[0] AS co
+                SET a.country_name = co.name, a.country_code = co.code
+            }} IN TRANSACTIONS OF 1000 ROWS
+            """,
+        ],
+    ),
+    Migration(
+        5,
+        "Index the change watermark of authors",
+        [
+            "CREATE INDEX author_updated_at IF NOT EXISTS FOR (author:Author) ON (author.updated_at)",
+        ],
+    ),
+]
+
+
+def _bootstrap() -> None:
+    db.cypher_query(
+        "CREATE CONSTRAINT schema_migration_version IF NOT EXISTS "
+        "FOR (migration:SchemaMigration) REQUIRE migration.version IS UNIQUE"
+    )
+
+
+def applied_versions() -> List[int]:
+    _bootstrap()
+    results, _ = db.cypher_query("MATCH (migration:SchemaMigration) RETURN migration.version ORDER BY migration.version")
+    return [row[0] for row in results]
+
+
+def run_migrations(migrations: List[Migration] = MIGRATIONS) -> List[int]:
+    """Applies every migration that isn't recorded in the database yet, in version order.
+
+    Args:
+        migrations (List[Migration]): Known migrations.
+
+    Returns:
+        List[int]: Versions applied by this call.
+    """
+    applied = set(applied_versions())
+    newly_applied = []
+    for migration in sorted(migrations, key=lambda migration: migration.version):
+        if migration.version in applied:
+            continue
+        logger.info("[graph_migrations] Applying %s: %s.", migration.version, migration.description)
+        for statement in migration.statements:
+            db.cypher_query(statement)
+        db.cypher_query(
+            "MERGE (migration:SchemaMigration {version: $version}) "
+            "SET migration.description = $description, migration.applied_at = $applied_at",
+            {"version": migration.version, "description": migration.description, "applied_at": time.time()},
+        )
+        newly_applied.append(migration.version)
+    if not newly_applied:
+        logger.info("[graph_migrations] Graph schema is up to date.")
+    return newly_applied
+
+
+def _scans(plan: Dict[str, Any]) -> List[str]:
+    operator = plan.get("operatorType", "")
+    found = [operator] if operator.startswith(SCAN_OPERATORS) else []
+    for child in plan.get("children", []):
+        found.extend(_scans(child))
+    return found
+
+
+def check_query_plans(explain: Callable[[str, Dict[str, Any]], Dict[str, Any]] | None = None) -> Dict[str, List[str]]:
+    """EXPLAINs every registered query template and collects the ones whose plan scans a whole label.
+
+    Args:
+        explain (Callable[[str, Dict[str, Any]], Dict[str, Any]] | None): Returns the plan of a query.
+        Defaults to running EXPLAIN on the database.
+
+    Returns:
+        Dict[str, List[str]]: Scan operators per offending template. Empty if every plan uses indexes.
+    """
+
+    def explain_on_db(cypher: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        with db.driver.session() as session:
+            return session.run("EXPLAIN " + cypher, params).consume().plan
+
+    explain = explain or explain_on_db
+    offenders = {}
+    for name, template in graph_queries.templates().items():
+        scans = _scans(explain(template.cypher, template.sample_params))
+        if scans:
+            offenders[name] = scans
+            logger.error("[graph_migrations] %s scans: %s", name, ", ".join(scans))
+    return offenders
+
+
+def main(argv: List[str] | None = None) -> int:
+    from bookscraper_backend.setup import setup_db
+
+    parser = argparse.ArgumentParser(description="Graph database schema migrations.")
+    parser.add_argument("command", choices=["upgrade", "status", "check"])
+    args = parser.parse_args(argv)
+    setup_db()
+    if args.command == "upgrade":
+        print(f"Applied: {run_migrations() or 'nothing'}")
+    elif args.command == "status":
+        applied = set(applied_versions())
+        for migration in MIGRATIONS:
+            print(f"{migration.version:>4} {'applied' if migration.version in applied else 'pending':>8}  {migration.description}")
+    else:
+        offenders = check_query_plans()
+        if offenders:
+            print(f"Queries with label scans: {', '.join(offenders)}")
+            return 1
+        print(f"All {len(graph_queries.templates())} queries use indexes.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
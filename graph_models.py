@@ -12,6 +12,7 @@ from neomodel import (
 class Country(StructuredNode): #TODO: Draw out schema and create equivalents in db models
 
     name = StringProperty(unique_index=True, required=True)
+    code = StringProperty(index=True)  # ISO alpha-2, from the country index.
     regions = RelationshipTo("Region", "CONTAINS")
     cities = RelationshipTo("City", "CONTAINS")
 
@@ -20,6 +21,7 @@ class Region(StructuredNode):
     # This is states or counties or whatever.
 
     name = StringProperty(required=True)
+    country_name = StringProperty()  # Name of the country it is WITHIN, for the (name, country_name) index.
     country = RelationshipTo(Country, "WITHIN", cardinality=One)
 
 
@@ -38,5 +40,9 @@ class Author(StructuredNode):
     goodreads_id = StringProperty(unique_index=True)
     goodreads_link = StringProperty()
     name = StringProperty(required=True)
+    # Projection of the Country reached through BORN_IN and WITHIN, so reads don't traverse the hierarchy.
+    # Written with the birthplace and repaired by graph_maintenance.py.
+    country_name = StringProperty()
+    country_code = StringProperty()
     birth_city = RelationshipTo(City, "BORN_IN", cardinality=ZeroOrOne)
     lived_in = RelationshipTo(City, "LIVED_IN")
@@ -0,0 +1,329 @@
+from neomodel import db
+from typing import Any, Dict
+from logger import logger
+import threading
+import time
+
+# Labels that can be linked by a WITHIN relationship, (origin, destination).
+WITHIN_PAIRS = [("City", "Region"), ("City", "Country"), ("Region", "Country")]
+# Labels get_author_place can return.
+AUTHOR_PLACES = ["Region", "Country"]
+
+
+class QueryTemplate:
+    """A fixed Cypher query. Values are only ever sent as $parameters, so Neo4j caches one plan per template."""
+
+    def __init__(self, name: str, cypher: str, resolve_objects: bool = False, sample_params: Dict[str, Any] | None = None):
+        """
+        Args:
+            name (str): Unique name of the template.
+            cypher (str): Query text, with $parameters for every value.
+            resolve_objects (bool): Whether results are turned into neomodel nodes.
+            sample_params (Dict[str, Any] | None): Parameters to EXPLAIN the query with.
+        """
+        self.name = name
+        self.cypher = cypher
+        self.resolve_objects = resolve_objects
+        self.sample_params = sample_params or {}
+        self.calls = 0
+        self.errors = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+
+
+_templates: Dict[str, QueryTemplate] = {}
+_stats_lock = threading.Lock()
+
+
+def register(name: str, cypher: str, resolve_objects: bool = False, sample_params: Dict[str, Any] | None = None) -> QueryTemplate:
+    if name in _templates:
+        raise ValueError(f"Query template {name} is already registered.")
+    template = QueryTemplate(name, cypher, resolve_objects, sample_params)
+    _templates[name] = template
+    return template
+
+
+def get_template(name: str) -> QueryTemplate:
+    try:
+        return _templates[name]
+    except KeyError:
+        raise KeyError(f"There is no query template named {name}.") from None
+
+
+def templates() -> Dict[str, QueryTemplate]:
+    return dict(_templates)
+
+
+def run(name: str, params: Dict[str, Any] | None = None) -> list:
+    """Runs a registered template with the given parameters and records its call count and latency.
+    Queries go through neomodel's db.cypher_query, so they join the active transaction if there is one
+    and otherwise reuse a pooled connection of the driver.
+
+    Args:
+        name (str): Name of the template.
+        params (Dict[str, Any] | None): Values for the $parameters of the template.
+
+    Returns:
+        list: Rows of the result.
+    """
+    template = get_template(name)
+    start = time.perf_counter()
+    try:
+        results, _ = db.cypher_query(template.cypher, params or {}, resolve_objects=template.resolve_objects)
+    except Exception:
+        with _stats_lock:
+            template.errors += 1
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        with _stats_lock:
+            template.calls += 1
+            template.total_seconds += elapsed
+            template.max_seconds = max(template.max_seconds, elapsed)
+    logger.debug("[graph_queries] %s took %.2f ms.", name, elapsed * 1000)
+    return results
+
+
+def query_stats() -> Dict[str, Dict[str, float]]:
+    """Calls, errors and latencies per template, for every template called at least once."""
+    with _stats_lock:
+        return {
+            name: {
+                "calls": template.calls,
+                "errors": template.errors,
+                "total_seconds": template.total_seconds,
+                "mean_seconds": template.total_seconds / template.calls,
+                "max_seconds": template.max_seconds,
+            }
+            for name, template in _templates.items()
+            if template.calls
+        }
+
+
+def reset_stats() -> None:
+    with _stats_lock:
+        for template in _templates.values():
+            template.calls = template.errors = 0
+            template.total_seconds = template.max_seconds = 0.0
+
+
+def geo_upsert_template(has_region: bool, has_coordinates: bool) -> str:
+    """Name of the template create_geo_nodes uses for a birthplace with or without a region and coordinates."""
+    return f"geo_upsert:{'region' if has_region else 'country'}:{'coordinates' if has_coordinates else 'name'}"
+
+
+def pair_template(origin_type: str, destination_type: str, exists: bool = False) -> str:
+    """Name of the template matching an origin node WITHIN a destination node, by their names."""
+    if (origin_type, destination_type) not in WITHIN_PAIRS:
+        raise ValueError(f"{origin_type} can't be WITHIN {destination_type}.")
+    return f"{'pair_exists' if exists else 'pair'}:{origin_type}->{destination_type}"
+
+
+for _origin, _destination in WITHIN_PAIRS:
+    _sample = {"origin_name": "Rio de Janeiro", "destination_name": "Brazil"}
+    register(
+        pair_template(_origin, _destination),
+        f"""
+        MATCH (c:{_origin} {{name: $origin_name}})-[:WITHIN]->(:{_destination} {{name: $destination_name}})
+        RETURN c
+        """,
+        resolve_objects=True,
+        sample_params=_sample,
+    )
+    register(
+        pair_template(_origin, _destination, exists=True),
+        f"""
+        MATCH (c:{_origin} {{name: $origin_name}})-[:WITHIN]->(:{_destination} {{name: $destination_name}})
+        RETURN c LIMIT 1
+        """,
+        sample_params=_sample,
+    )
+
+for _place in AUTHOR_PLACES:
+    register(
+        f"author_place:{_place}",
+        f"""
+        MATCH (a:Author)-[:BORN_IN]->(c:City)-[:WITHIN*]->(co:{_place})
+        WHERE elementId(a) = $element_id
+        RETURN co
+        """,
+        resolve_objects=True,
+        sample_params={"element_id": "4:00000000-0000-0000-0000-000000000000:0"},
+    )
+
+register(
+    "region_in_country",
+    """
+    MATCH (r:Region {name: $region_name, country_name: $country_name})
+    RETURN r LIMIT 1
+    """,
+    resolve_objects=True,
+    sample_params={"region_name": "Rio de Janeiro", "country_name": "Brazil"},
+)
+
+register(
+    "author_country",
+    """
+    MATCH (a:Author)
+    WHERE elementId(a) = $element_id
+    MATCH (co:Country {name: a.country_name})
+    RETURN co
+    """,
+    resolve_objects=True,
+    sample_params={"element_id": "4:00000000-0000-0000-0000-000000000000:0"},
+)
+
+register(
+    "author_countries",
+    """
+    UNWIND $ids AS gr_id
+    OPTIONAL MATCH (a:Author {goodreads_id: gr_id})
+    RETURN gr_id, a IS NOT NULL AS found, a.country_name AS country
+    """,
+    sample_params={"ids": ["22458"]},
+)
+
+# Cities are WITHIN a Region WITHIN a Country, or directly WITHIN a Country, so two hops at most.
+AUTHOR_COUNTRY_PATH = "(a)-[:BORN_IN]->(:City)-[:WITHIN*1..2]->(co:Country)"
+
+register(
+    "project_author_countries",
+    f"""
+    UNWIND $ids AS gr_id
+    MATCH (a:Author {{goodreads_id: gr_id}})
+    OPTIONAL MATCH {AUTHOR_COUNTRY_PATH}
+    WITH a, collect(co)[0] AS co
+    SET a.country_name = co.name, a.country_code = co.code, a.updated_at = timestamp()
+    RETURN a.goodreads_id, co.name
+    """,
+    sample_params={"ids": ["22458"]},
+)
+
+register(
+    "author_countries_page",
+    """
+    MATCH (a:Author) WHERE a.goodreads_id > $after
+    RETURN a.goodreads_id, a.country_name ORDER BY a.goodreads_id LIMIT $limit
+    """,
+    sample_params={"after": "", "limit": 1000},
+)
+
+register(
+    "author_changes",
+    """
+    MATCH (a:Author) WHERE a.updated_at > $since
+    RETURN a.goodreads_id, a.country_name, a.updated_at
+    """,
+    sample_params={"since": 0},
+)
+
+register(
+    "bulk_authors",
+    """
+    UNWIND $rows AS row
+    MERGE (a:Author {goodreads_id: row.goodreads_id})
+    ON CREATE SET a.name = row.name, a.goodreads_link = row.goodreads_link
+    """,
+)
+
+register(
+    "bulk_countries",
+    """
+    UNWIND $countries AS row
+    MERGE (co:Country {name: row.name})
+    SET co.code = coalesce(row.code, co.code)
+    """,
+)
+
+register(
+    "bulk_regions",
+    """
+    UNWIND $regions AS row
+    MATCH (co:Country {name: row.country})
+    MERGE (r:Region {name: row.region, country_name: co.name})
+    MERGE (r)-[:WITHIN]->(co)
+    """,
+)
+
+# Cities with coordinates are unique by lat_long_string, the rest are unique by name within their parent.
+# A city is only attached to a parent if it doesn't have one yet, like create_geo_nodes does.
+register(
+    "bulk_cities_with_coordinates",
+    """
+    UNWIND $rows AS row
+    MATCH (a:Author {goodreads_id: row.goodreads_id})
+    MATCH (co:Country {name: row.country})
+    OPTIONAL MATCH (r:Region)-[:WITHIN]->(co)
+    WHERE row.region IS NOT NULL AND r.name = row.region
+    WITH row, a, coalesce(r, co) AS parent
+    MERGE (c:City {lat_long_string: row.lat_long_string})
+    ON CREATE SET c.name = row.city, c.latitude = row.latitude, c.longitude = row.longitude
+    FOREACH (_ IN CASE WHEN EXISTS { (c)-[:WITHIN]->() } THEN [] ELSE [1] END | MERGE (c)-[:WITHIN]->(parent))
+    MERGE (a)-[:BORN_IN]->(c)
+    """,
+)
+
+register(
+    "bulk_cities_without_coordinates",
+    """
+    UNWIND $rows AS row
+    MATCH (a:Author {goodreads_id: row.goodreads_id})
+    MATCH (co:Country {name: row.country})
+    OPTIONAL MATCH (r:Region)-[:WITHIN]->(co)
+    WHERE row.region IS NOT NULL AND r.name = row.region
+    WITH row, a, coalesce(r, co) AS parent
+    MERGE (c:City {name: row.city})-[:WITHIN]->(parent)
+    MERGE (a)-[:BORN_IN]->(c)
+    """,
+)
+
+# create_geo_nodes in a single statement. Every node is MERGEd on properties backed by a uniqueness constraint
+# (or, for cities without coordinates, under the lock MERGE takes on their bound parent), so concurrent workers
+# can't create duplicates. Nodes created by the statement are flagged with a temporary _created property.
+_GEO_PARENT = {
+    True: """
+    MERGE (r:Region {name: $region, country_name: co.name})
+    ON CREATE SET r._created = true
+    MERGE (r)-[:WITHIN]->(co)
+    WITH co, r, r AS parent
+    """,
+    False: """
+    WITH co, null AS r, co AS parent
+    """,
+}
+_GEO_CITY = {
+    # A city found by its coordinates keeps the parent it already has, the first birthplace stored for it wins.
+    True: """
+    MERGE (c:City {lat_long_string: $lat_long_string})
+    ON CREATE SET c.name = $city, c.latitude = $latitude, c.longitude = $longitude, c._created = true
+    FOREACH (_ IN CASE WHEN EXISTS { (c)-[:WITHIN]->() } THEN [] ELSE [1] END | MERGE (c)-[:WITHIN]->(parent))
+    """,
+    False: """
+    MERGE (c:City {name: $city})-[:WITHIN]->(parent)
+    ON CREATE SET c._created = true
+    """,
+}
+for _has_region in (True, False):
+    for _has_coordinates in (True, False):
+        register(
+            geo_upsert_template(_has_region, _has_coordinates),
+            f"""
+            MERGE (co:Country {{name: $country}})
+            SET co.code = coalesce($country_code, co.code)
+            {_GEO_PARENT[_has_region]}
+            {_GEO_CITY[_has_coordinates]}
+            WITH c, co, r, c._created IS NOT NULL AS created_city, r._created IS NOT NULL AS created_region
+            REMOVE c._created, r._created
+            RETURN c, co, created_city, created_region
+            """,
+            resolve_objects=True,
+            sample_params={
+                "country": "Brazil",
+                "country_code": "BR",
+                "region": "Rio de Janeiro",
+                "city": "Rio de Janeiro",
+                "latitude": -22.9110137,
+                "longitude": -43.2093727,
+                "lat_long_string": "lat:-22.9110137 long:-43.2093727",
+            },
+        )
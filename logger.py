@@ -1,10 +1,156 @@
+"""Logging setup of the app: callers only put records on a queue, a background thread writes them to stdout.
+
+Records carry the id of the request they were logged for (see request_id) and any extra fields, e.g.
+extra={"stage": "shelf_scrape", "duration_ms": 812.4}. With LOG_FORMAT=json each record is one JSON object
+per line, otherwise a line of text.
+
+Records logged once per author or place, opted in with extra={"sampled": True}, are rate limited: below WARNING,
+at most LOG_RATE_LIMIT records of the same message template are written every LOG_RATE_WINDOW seconds, and the
+next one written says how many were dropped. Templates are the unformatted messages, so logging with lazy
+%-style arguments is what makes per-author messages count as one. Every other record is written.
+If the writer falls behind, records that don't fit in the queue are dropped too.
+"""
+import atexit
+import copy
+import json
 import logging
+import logging.handlers
+import os
+import queue
 import sys
+import threading
+import time
+from contextvars import ContextVar
+from typing import Any, Dict
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text")  # "text" or "json".
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", 10_000))
+LOG_RATE_LIMIT = int(os.getenv("LOG_RATE_LIMIT", 20))
+LOG_RATE_WINDOW = float(os.getenv("LOG_RATE_WINDOW", 10))
+TEXT_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+
+# Id of the request being served, set by the request id middleware of the API.
+request_id: ContextVar[str | None] = ContextVar("request_id", default=None)
+
+# Attributes every LogRecord has, anything else on a record came from extra=.
+_RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "request_id", "suppressed", "sampled"}
+
+
+class RequestIdFilter(logging.Filter):
+    """Stamps records with the id of the current request. Runs on the thread that logs, where the request's context is."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id.get()
+        return True
+
+
+class RateLimitFilter(logging.Filter):
+    """Lets at most limit records per message template through every window seconds, for sampled records below WARNING."""
+
+    def __init__(self, limit: int = LOG_RATE_LIMIT, window: float = LOG_RATE_WINDOW):
+        super().__init__()
+        self.limit = limit
+        self.window = window
+        self._windows: Dict[tuple, list] = {}  # Template -> [window start, records let through, records dropped].
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING or self.limit <= 0 or not getattr(record, "sampled", False):
+            return True
+        key = (record.name, record.levelno, record.msg)
+        now = time.monotonic()
+        with self._lock:
+            state = self._windows.get(key)
+            if state is None or now - state[0] >= self.window:
+                if state and state[2]:
+                    record.suppressed = state[2]
+                self._windows[key] = [now, 1, 0]
+                if len(self._windows) > 10_000:
+                    self._windows = {key: self._windows[key]}  # Templates shouldn't vary, forget them if they do.
+                return True
+            if state[1] < self.limit:
+                state[1] += 1
+                return True
+            state[2] += 1
+            return False
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that never blocks: records that don't fit in the queue are counted and dropped."""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Only merges the arguments into the message, formatting into text or JSON happens on the writer thread.
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def _extra_fields(record: logging.LogRecord) -> Dict[str, Any]:
+    return {key: value for key, value in vars(record).items() if key not in _RECORD_ATTRIBUTES}
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        document: Dict[str, Any] = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if getattr(record, "request_id", None):
+            document["request_id"] = record.request_id  # type: ignore
+        document.update(_extra_fields(record))
+        if getattr(record, "suppressed", None):
+            document["suppressed"] = record.suppressed  # type: ignore
+        if record.exc_text:
+            document["exception"] = record.exc_text
+        return json.dumps(document, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        text = super().format(record)
+        fields = _extra_fields(record)
+        if getattr(record, "request_id", None):
+            fields = {"request_id": record.request_id, **fields}  # type: ignore
+        if fields:
+            text += " " + " ".join(f"{key}={value}" for key, value in fields.items())
+        if getattr(record, "suppressed", None):
+            text += f" ({record.suppressed} similar messages suppressed)"  # type: ignore
+        return text
+
+
+def configure_logging() -> logging.handlers.QueueListener:
+    """Sends every record of the root logger through the queue, and starts the thread writing them out."""
+    log_queue: queue.Queue = queue.Queue(LOG_QUEUE_SIZE)
+    queue_handler = DroppingQueueHandler(log_queue)
+    queue_handler.addFilter(RateLimitFilter())
+    queue_handler.addFilter(RequestIdFilter())
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(JsonFormatter() if LOG_FORMAT == "json" else TextFormatter(TEXT_FORMAT))
+    root = logging.getLogger()
+    root.setLevel(LOG_LEVEL)
+    root.addHandler(queue_handler)
+    listener = logging.handlers.QueueListener(log_queue, stream_handler)
+    listener.start()
+    atexit.register(listener.stop)  # Writes whatever is still queued.
+    return listener
 
 
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[logging.StreamHandler(sys.stdout)])
-    
-logger = logging.getLogger(__name__)
\ No newline at end of file
+listener = configure_logging()
+logger = logging.getLogger(__name__)
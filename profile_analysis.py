@@ -1,6 +1,8 @@
+import sys
 import pstats
 
-stats = pstats.Stats("profile/my_profile.prof")
+# A .prof file, e.g. one captured through /admin/profiles (see bookscraper_backend.profiling).
+stats = pstats.Stats(sys.argv[1] if len(sys.argv) > 1 else "profile/my_profile.prof")
 stats.strip_dirs()
 stats.sort_stats("cumulative")
 stats.print_stats(50)